@@ -1,18 +1,42 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 import os
-import json
+import asyncio
+import logging
+import uuid
+import time
 from services.kb_service import KBService
 from services.llm_service import LLMService
+from services.llm_scheduler import LLMScheduler, LocalSlotBackend, RedisSlotBackend, AdmissionRejected
 from services.session_service import SessionService
+from services.history_manager import HistoryManager
+from services.chat_context import ChatContextLoader
 from services.workflow_executor import WorkflowExecutor
 from services.workflow_service import WorkflowService
+from services.workflow_graph import WorkflowValidationError
 from services.database_service import DatabaseService
 from services.tools_service import ToolsService
-from models.db_connection import CreateDatabaseConnectionRequest
-from models.tool_action import CreateAgentActionRequest
+from services.tool_cache import ToolResultCache
+from services.registry_store import RegistryInvalidator, create_registry
+from utils.redis_client import get_redis_client, ping_redis, close_redis_client
+from services.http_client import get_http_client, close_http_client
+from services.chat_socket import ChatSocketConnection
+from utils.stream_coalescer import coalesce_stream, STREAM_READ_AHEAD
+from utils.sse import format_event, HEARTBEAT, SSE_HEADERS, SSE_HEARTBEAT_SECONDS
+from utils.metrics import record_chat_turn, render_metrics, CHAT_REQUESTS, project_label
+from utils.tracing import setup_tracing, shutdown_tracing, TracingMiddleware
+from utils.log import setup_logging, shutdown_logging, LogContextMiddleware
+from utils.mongo_client import close_mongo_client
+from models.db_connection import DatabaseConnection, CreateDatabaseConnectionRequest
+from models.tool_action import AgentAction, CreateAgentActionRequest
+
+setup_logging("ai-agent-service")
+setup_tracing("ai-agent-service")
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="AI Agent Service",
@@ -28,14 +52,32 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(LogContextMiddleware)
+# Outermost, so the server span covers CORS handling and streamed bodies
+app.add_middleware(TracingMiddleware)
 
 # Services
+# One pooled async Redis client shared by every state service
+redis_client = get_redis_client()
+
 kb_service = KBService()
-session_service = SessionService()
-workflow_service = WorkflowService()
-database_service = DatabaseService()
-tools_service = ToolsService(database_service)
-llm_service = LLMService(tools_service) # Inject tools_service
+session_service = SessionService(redis_client)
+workflow_service = WorkflowService(redis_client)
+# Connections and actions live in MongoDB; workers drop cached copies on Redis pub/sub
+registry_invalidator = RegistryInvalidator(redis_client)
+database_service = DatabaseService(create_registry("connections", DatabaseConnection, registry_invalidator))
+# Shared Redis tier for tool results is opt-in; the in-process tier is always on
+tool_cache = ToolResultCache(
+    redis_client=redis_client if os.getenv("TOOL_CACHE_REDIS", "false").lower() == "true" else None
+)
+tools_service = ToolsService(database_service, tool_cache, create_registry("actions", AgentAction, registry_invalidator))
+# LLM slots are counted in Redis so concurrency limits hold across workers
+llm_scheduler = LLMScheduler(
+    backend=RedisSlotBackend(redis_client) if os.getenv("LLM_SCHEDULER_BACKEND", "redis") == "redis" else LocalSlotBackend()
+)
+llm_service = LLMService(tools_service, llm_scheduler) # Inject tools_service
+history_manager = HistoryManager(session_service, llm_service)
+chat_context_loader = ChatContextLoader(history_manager, kb_service, tools_service)
 
 class ChatRequest(BaseModel):
     query: str
@@ -45,6 +87,17 @@ class ChatRequest(BaseModel):
     persona: Optional[Dict[str, str]] = {}
     workflow_state: Optional[Dict] = None  # For hybrid execution
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    logger.warning("LLM request rejected", extra={"project_id": exc.project_id, "reason": exc.reason})
+    endpoint = {"/chat": "chat", "/chat/stream": "chat_stream"}.get(request.url.path, "other")
+    CHAT_REQUESTS.labels(endpoint, project_label(exc.project_id), "rate_limited").inc()
+    return JSONResponse(
+        status_code=429,
+        content={"detail": {"message": "Too many requests for this project, retry shortly", "code": "rate_limited", "reason": exc.reason}},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.get("/")
 async def root():
     return {
@@ -52,16 +105,38 @@ async def root():
         "model": os.getenv("LITELLM_MODEL", "gemini/gemini-2.5-flash")
     }
 
+@app.on_event("startup")
+async def startup_event():
+    registry_invalidator.start()
+    database_service.engines.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await registry_invalidator.stop()
+    await database_service.engines.stop()
+    await close_http_client()
+    await close_redis_client()
+    close_mongo_client()
+    shutdown_tracing()
+    shutdown_logging()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    redis_ok = await ping_redis()
+    return {"status": "healthy" if redis_ok else "degraded", "redis": redis_ok}
 
 # --- Database Connection Management ---
 @app.post("/projects/{project_id}/db-connection")
 async def create_db_connection(project_id: str, request: CreateDatabaseConnectionRequest):
     """Save a database connection configuration."""
     try:
-        connection = database_service.save_connection(project_id, request)
+        connection = await database_service.save_connection(project_id, request)
         # Don't return the password
         response = connection.model_dump()
         response.pop("encrypted_password")
@@ -72,13 +147,13 @@ async def create_db_connection(project_id: str, request: CreateDatabaseConnectio
 @app.get("/projects/{project_id}/db-connection")
 async def get_db_connections(project_id: str):
     """Get all connections for a project."""
-    return database_service.get_connections(project_id)
+    return await database_service.get_connections(project_id)
 
 @app.post("/projects/{project_id}/db-connection/{connection_id}/test")
 async def test_db_connection(project_id: str, connection_id: str):
     """Test a database connection."""
     try:
-        success = database_service.test_connection(project_id, connection_id)
+        success = await database_service.test_connection(project_id, connection_id)
         return {"success": success}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -88,7 +163,7 @@ async def test_db_connection(project_id: str, connection_id: str):
 async def create_action(project_id: str, request: CreateAgentActionRequest):
     """Create a new Named SQL Action (Tool)."""
     try:
-        action = tools_service.create_action(project_id, request)
+        action = await tools_service.create_action(project_id, request)
         return action
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -96,138 +171,336 @@ async def create_action(project_id: str, request: CreateAgentActionRequest):
 @app.get("/projects/{project_id}/actions")
 async def get_actions(project_id: str):
     """List all actions for a project."""
-    return tools_service.get_actions(project_id)
+    return await tools_service.get_actions(project_id)
+
+@app.get("/projects/{project_id}/actions/stats")
+async def get_action_stats(project_id: str):
+    """Calls, errors, latency percentiles and replica/primary split per database action (this worker)."""
+    return database_service.action_stats.get_stats(project_id)
+
+@app.get("/workflows/cache/stats")
+async def get_workflow_cache_stats():
+    """Hit/miss metrics for the compiled workflow cache."""
+    return workflow_service.graph_cache.get_stats()
+
+@app.get("/workflows/http/stats")
+async def get_workflow_http_stats():
+    """Retry counts and per-host circuit breaker state for workflow API calls."""
+    return get_http_client().get_stats()
+
+@app.get("/llm/scheduler/stats")
+async def get_llm_scheduler_stats():
+    """Admission control counters, queue depths and queue-time percentiles"""
+    return llm_scheduler.get_stats()
+
+@app.get("/llm/providers/stats")
+async def get_llm_provider_stats():
+    """Per-provider health, latency percentiles, hedges and failovers"""
+    return llm_service.router.get_stats()
+
+@app.get("/tools/cache/stats")
+async def get_tool_cache_stats():
+    """Hit/miss metrics for the tool result cache."""
+    return tool_cache.get_stats()
+
+@app.get("/db/engines/stats")
+async def get_db_engine_stats():
+    """Engine cache hits/misses, evictions and pool usage per customer database connection."""
+    return database_service.engines.get_stats()
+
+@app.get("/db/replicas/stats")
+async def get_db_replica_stats():
+    """Replica reads, primary fallbacks, lag per replica and statement cache usage."""
+    return database_service.get_stats()
+
+@app.get("/registry/stats")
+async def get_registry_stats():
+    """Hit/miss metrics for the connection and action caches, and invalidation counters."""
+    return {
+        "connections": database_service.registry.get_stats(),
+        "actions": tools_service.registry.get_stats(),
+        "invalidation": registry_invalidator.get_stats()
+    }
 
 # --- Chat Endpoints ---
 
 @app.post("/chat")
 async def chat(request: ChatRequest):
-    print(f"📨 Chat Request: query='{request.query}' project_id='{request.project_id}'")
-    print(f"🎭 Persona Config: {json.dumps(request.persona, indent=2)}")
+    # Sizes only: queries and personas are customer content
+    logger.info("Chat request", extra={"project_id": request.project_id, "session_id": request.session_id, "query_chars": len(request.query)})
+    logger.debug("Persona fields: %s", sorted(request.persona or {}))
+    request_start = time.perf_counter()
     
     # Check if project has workflow (would come from project config in production)
     # For now, we'll check if workflow_state is provided
     if request.workflow_state:
-        # Hybrid execution: Frontend sent workflow state, execute backend node
-        print(f"🔄 Hybrid workflow execution for node: {request.workflow_state.get('currentNodeId')}")
+        # Server-side execution: run the workflow from the current node until it needs input
+        logger.info("Workflow execution", extra={"node_id": request.workflow_state.get('currentNodeId') or "stored state"})
+        
+        # The client sends the full definition once, then only its hash
+        try:
+            workflow = await workflow_service.resolve_workflow(
+                request.project_id,
+                definition=request.workflow_state.get('workflow'),
+                workflow_hash=request.workflow_state.get('workflowHash')
+            )
+        except WorkflowValidationError as e:
+            raise HTTPException(status_code=422, detail={"message": "Invalid workflow", "errors": e.errors})
         
-        # Get workflow definition from project config (mock for now)
-        # In production, load from database/storage
-        workflow_def = request.workflow_state.get('workflow', {})
+        if not workflow and request.workflow_state.get('workflowHash'):
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Unknown workflow hash, resend the full definition", "code": "workflow_definition_required"}
+            )
         
-        if workflow_def:
+        if workflow:
             executor = WorkflowExecutor(
-                workflow_definition=workflow_def,
+                workflow=workflow,
                 session_id=request.session_id,
                 project_id=request.project_id,
                 llm_service=llm_service,
                 kb_service=kb_service
             )
             
-            # Load state from frontend
-            executor.load_state(request.workflow_state)
+            # Resume from the state stored by the previous turn unless the client sent its own
+            # (the stored userInput belongs to that turn; this turn's input is the query)
+            state = request.workflow_state
+            if not state.get('currentNodeId'):
+                stored_state = await workflow_service.get_workflow_state(request.project_id, request.session_id)
+                if stored_state and stored_state.get('workflowHash') == workflow.hash and stored_state.get('currentNodeId'):
+                    state = {
+                        **stored_state,
+                        'variables': {**stored_state.get('variables', {}), **state.get('variables', {})},
+                        'userInput': None
+                    }
+            if state.get('userInput') is None:
+                state = {**state, 'userInput': request.query or None}
+            executor.load_state(state)
             
-            # Execute current backend node
-            result = await executor.execute_current_node()
+            # Run every node until one needs user input, so a turn is one round trip
+            workflow_start = time.perf_counter()
+            result = await executor.run_until_input()
+            workflow_ms = round((time.perf_counter() - workflow_start) * 1000, 1)
             
             # Save state to Redis
-            workflow_service.set_workflow_state(
+            await workflow_service.set_workflow_state(
                 request.project_id,
                 request.session_id,
                 executor.get_state()
             )
+            record_chat_turn("chat_workflow", request.project_id, time.perf_counter() - request_start, {"workflow": workflow_ms})
             
             return {
                 "node_result": {
                     "messages": result.messages,
                     "nextNodeId": result.next_node_id,
                     "variables": result.variables,
+                    "requiresInput": result.requires_input,
                     "isComplete": result.is_complete
                 },
+                "workflow_hash": workflow.hash,
                 "session_id": request.session_id
             }
     
     # Default behavior: No workflow, use existing LLM-based chat
-    # 1. Get conversation history from Redis
-    stored_history = session_service.get_conversation_history(request.project_id, request.session_id)
-    
-    # Use stored history if available, otherwise use provided history
-    conversation_history = stored_history if stored_history else request.history
-    
-    # 2. Retrieve context from Knowledge Base
-    context = await kb_service.get_relevant_context(request.query, request.project_id)
+    # 1. Load history, Knowledge Base context and tool schemas concurrently
+    # (stored history if available, otherwise provided history)
+    chat_context = await chat_context_loader.load(
+        request.query, request.project_id, request.session_id, fallback_history=request.history
+    )
     
-    # 3. Generate response using LLM with conversation history and persona
+    # 2. Generate response using LLM with conversation history and persona
     # IMPORTANT: Passing project_id to enable tool usage specific to this project
+    llm_start = time.perf_counter()
     response = await llm_service.generate_response(
         query=request.query, 
-        context_chunks=context, 
-        history=conversation_history, 
+        context_chunks=chat_context.context_chunks, 
+        history=chat_context.history, 
         persona_config=request.persona,
-        project_id=request.project_id
+        project_id=request.project_id,
+        conversation_summary=chat_context.summary,
+        tools=chat_context.tools
     )
+    chat_context.timings["llm"] = round((time.perf_counter() - llm_start) * 1000, 1)
+    
+    # 3. Update conversation history in Redis
+    await session_service.add_turn(request.project_id, request.session_id, request.query, response)
     
-    # 4. Update conversation history in Redis
-    session_service.add_message_to_history(request.project_id, request.session_id, "user", request.query)
-    session_service.add_message_to_history(request.project_id, request.session_id, "assistant", response)
+    logger.info("Chat timings", extra={"timings_ms": chat_context.timings, "degraded": chat_context.degraded})
+    record_chat_turn("chat", request.project_id, time.perf_counter() - request_start, chat_context.timings, chat_context.degraded)
     
     return {
         "response": response,
-        "context_used": context,
-        "session_id": request.session_id
+        "context_used": chat_context.context_chunks,
+        "session_id": request.session_id,
+        "timings": chat_context.timings,
+        "degraded": chat_context.degraded
     }
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """
+    Server-Sent Events variant of /chat for clients that cannot use WebSockets.
+    Events: token, tool (tool progress), done (context metadata and timings), error.
+    Generation is cancelled as soon as the client disconnects.
+    """
+    if request.workflow_state:
+        raise HTTPException(status_code=400, detail="Workflows are not streamed, use /chat")
+    
+    logger.info("Stream request", extra={"project_id": request.project_id, "session_id": request.session_id, "query_chars": len(request.query)})
+    # Answer 429 before the stream starts when the project's queue is already full
+    llm_scheduler.check_admission(request.project_id)
+    events: asyncio.Queue = asyncio.Queue(maxsize=STREAM_READ_AHEAD)
+    
+    async def on_tool_event(event: Dict):
+        await events.put(format_event("tool", event))
+    
+    async def produce():
+        request_start = time.perf_counter()
+        try:
+            chat_context = await chat_context_loader.load(
+                request.query, request.project_id, request.session_id, fallback_history=request.history
+            )
+            
+            llm_start = time.perf_counter()
+            parts = []
+            async for chunk in coalesce_stream(llm_service.generate_stream_response(
+                query=request.query,
+                context_chunks=chat_context.context_chunks,
+                history=chat_context.history,
+                persona_config=request.persona,
+                project_id=request.project_id,
+                conversation_summary=chat_context.summary,
+                tools=chat_context.tools,
+                on_tool_event=on_tool_event
+            )):
+                if not parts:
+                    chat_context.timings["first_token"] = round((time.perf_counter() - llm_start) * 1000, 1)
+                parts.append(chunk)
+                await events.put(format_event("token", {"content": chunk}))
+            chat_context.timings["llm"] = round((time.perf_counter() - llm_start) * 1000, 1)
+            
+            response = "".join(parts)
+            await session_service.add_turn(request.project_id, request.session_id, request.query, response)
+            record_chat_turn("chat_stream", request.project_id, time.perf_counter() - request_start, chat_context.timings, chat_context.degraded)
+            await events.put(format_event("done", {
+                "session_id": request.session_id,
+                "context_used": chat_context.context_chunks,
+                "timings": chat_context.timings,
+                "degraded": chat_context.degraded
+            }))
+        except AdmissionRejected as e:
+            record_chat_turn("chat_stream", request.project_id, time.perf_counter() - request_start, outcome="rate_limited")
+            await events.put(format_event("error", {
+                "message": "Too many requests for this project, retry shortly",
+                "code": "rate_limited",
+                "reason": e.reason,
+                "retry_after": e.retry_after
+            }))
+        except Exception:
+            logger.exception("Error streaming response")
+            record_chat_turn("chat_stream", request.project_id, time.perf_counter() - request_start, outcome="error")
+            await events.put(format_event("error", {"message": "Failed to generate response"}))
+        await events.put(None)  # End of stream
+    
+    async def event_stream():
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    event = HEARTBEAT
+                if event is None:
+                    break
+                if await http_request.is_disconnected():
+                    logger.info("Stream client disconnected, cancelling generation", extra={"project_id": request.project_id})
+                    break
+                yield event
+        finally:
+            # Also runs when the server cancels the response because the client went away
+            producer.cancel()
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.websocket("/ws/chat/{project_id}")
 async def websocket_endpoint(websocket: WebSocket, project_id: str):
     await websocket.accept()
-    session_id = "default"  # Could be passed as query param
+    # Each visitor gets their own history; pass ?session_id= to resume a conversation
+    session_id = websocket.query_params.get("session_id") or uuid.uuid4().hex
+    connection = ChatSocketConnection(websocket, session_id)
     
-    try:
-        while True:
-            # Receive message
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
-            query = message_data.get("query")
-            
-            if not query:
-                continue
-            
-            # Get conversation history
-            history = session_service.get_conversation_history(project_id, session_id)
-                
-            # 1. Retrieve context
-            context = await kb_service.get_relevant_context(query, project_id)
-            
-            # 2. Stream response
-            full_response = ""
+    async def handle_request(connection: ChatSocketConnection, request_id: str, message_data: Dict):
+        query = message_data.get("query")
+        if not query:
+            await connection.send({"type": "error", "request_id": request_id, "code": "query_required"})
+            return
+        request_session_id = message_data.get("session_id") or connection.session_id
+        request_start = time.perf_counter()
+        
+        # 1. Load history, context and tools concurrently
+        chat_context = await chat_context_loader.load(query, project_id, request_session_id)
+        
+        # 2. Stream response, coalescing token deltas into fewer frames
+        parts = []
+        llm_start = time.perf_counter()
+        try:
             # IMPORTANT: Passing project_id to enable tool usage
-            async for chunk in llm_service.generate_stream_response(
+            async for chunk in coalesce_stream(llm_service.generate_stream_response(
                 query=query, 
-                context_chunks=context, 
-                history=history,
-                project_id=project_id
-            ):
-                full_response += chunk
-                await websocket.send_text(json.dumps({
+                context_chunks=chat_context.context_chunks, 
+                history=chat_context.history,
+                project_id=project_id,
+                conversation_summary=chat_context.summary,
+                tools=chat_context.tools
+            )):
+                if not parts:
+                    chat_context.timings["first_token"] = round((time.perf_counter() - llm_start) * 1000, 1)
+                parts.append(chunk)
+                await connection.send({
                     "type": "chunk",
+                    "request_id": request_id,
                     "content": chunk
-                }))
-            
-            # Send completion message
-            await websocket.send_text(json.dumps({
-                "type": "complete",
-                "full_response": full_response,
-                "context_used": context
-            }))
-            
-            # Update history in Redis
-            session_service.add_message_to_history(project_id, session_id, "user", query)
-            session_service.add_message_to_history(project_id, session_id, "assistant", full_response)
-            
+                })
+        except AdmissionRejected as e:
+            record_chat_turn("ws", project_id, time.perf_counter() - request_start, outcome="rate_limited")
+            await connection.send({
+                "type": "error",
+                "request_id": request_id,
+                "code": "rate_limited",
+                "reason": e.reason,
+                "retry_after": e.retry_after
+            })
+            return
+        full_response = "".join(parts)
+        chat_context.timings["llm"] = round((time.perf_counter() - llm_start) * 1000, 1)
+        
+        # Send completion message
+        await connection.send({
+            "type": "complete",
+            "request_id": request_id,
+            "session_id": request_session_id,
+            "full_response": full_response,
+            "context_used": chat_context.context_chunks,
+            "timings": chat_context.timings
+        })
+        
+        # Update history in Redis
+        await session_service.add_turn(project_id, request_session_id, query, full_response)
+        record_chat_turn("ws", project_id, time.perf_counter() - request_start, chat_context.timings, chat_context.degraded)
+    
+    try:
+        await connection.serve(handle_request)
     except WebSocketDisconnect:
-        print(f"Client disconnected from project {project_id}")
-    except Exception as e:
-        print(f"WebSocket error: {e}")
+        logger.info("WebSocket client disconnected", extra={"project_id": project_id})
+    except asyncio.TimeoutError:
+        logger.warning("WebSocket client stopped reading, closing", extra={"project_id": project_id})
+        try:
+            await websocket.close(code=1008)
+        except:
+            pass
+    except Exception:
+        logger.exception("WebSocket error")
         try:
             await websocket.close()
         except:
@@ -1,8 +1,14 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from datetime import datetime
 
+class ReplicaEndpoint(BaseModel):
+    """A read replica of the connection's database; same credentials and database name"""
+    host: str
+    port: int
+
 class DatabaseConnection(BaseModel):
+    id: Optional[str] = None
     project_id: str
     type: Literal["postgres", "mysql"]
     name: str = Field(..., description="Friendly name for this connection")
@@ -16,6 +22,15 @@ class DatabaseConnection(BaseModel):
     
     ssl_mode: Optional[str] = "prefer"
     
+    # Pool sizing for this connection; DB_POOL_SIZE / DB_POOL_MAX_OVERFLOW when unset
+    pool_size: Optional[int] = None
+    max_overflow: Optional[int] = None
+    
+    # Read-only actions go to a replica that is no further behind than
+    # max_replica_lag_seconds (DB_REPLICA_MAX_LAG_SECONDS when unset), else to the primary
+    replicas: List[ReplicaEndpoint] = Field(default_factory=list)
+    max_replica_lag_seconds: Optional[float] = None
+    
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -28,3 +43,7 @@ class CreateDatabaseConnectionRequest(BaseModel):
     password: str  # Plain text in request, will be encrypted
     database: str
     ssl_mode: Optional[str] = "prefer"
+    pool_size: Optional[int] = Field(None, ge=1, description="Connections kept open per worker")
+    max_overflow: Optional[int] = Field(None, ge=0, description="Extra connections allowed under load")
+    replicas: List[ReplicaEndpoint] = Field(default_factory=list, description="Read replicas for read-only actions")
+    max_replica_lag_seconds: Optional[float] = Field(None, gt=0, description="Skip replicas further behind than this")
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Dict, Optional, Any, Literal
 
 class ParameterDefinition(BaseModel):
@@ -22,6 +22,8 @@ class AgentAction(BaseModel):
     sql_query: Optional[str] = Field(None, description="SQL query to execute (required if action_type is database)")
     api_config: Optional[ApiConfig] = Field(None, description="API configuration (required if action_type is api)")
     parameters: Dict[str, ParameterDefinition] = Field(default_factory=dict, description="Parameters for the query or API")
+    read_only: bool = Field(False, description="Whether the action only reads data and has no side effects")
+    cache_ttl_seconds: Optional[int] = Field(None, description="Cache results for this many seconds (read-only actions only)")
 
 class CreateAgentActionRequest(BaseModel):
     connection_id: Optional[str] = None
@@ -31,3 +33,15 @@ class CreateAgentActionRequest(BaseModel):
     sql_query: Optional[str] = None
     api_config: Optional[ApiConfig] = None
     parameters: Dict[str, ParameterDefinition] = {}
+    read_only: bool = False
+    cache_ttl_seconds: Optional[int] = None
+
+    @model_validator(mode="after")
+    def check_cache_settings(self):
+        if self.cache_ttl_seconds is not None:
+            # Caching is disabled by leaving the TTL out, not with 0
+            if self.cache_ttl_seconds < 1:
+                raise ValueError("cache_ttl_seconds must be at least 1; omit it to disable caching")
+            if not self.read_only:
+                raise ValueError("Only read-only actions can be cached")
+        return self
@@ -0,0 +1,99 @@
+"""
+Pre-LLM stage of a chat turn
+Loads history, knowledge base context and tool schemas concurrently
+"""
+
+from typing import Dict, List, Optional, Any, Awaitable
+from dataclasses import dataclass, field
+import asyncio
+import logging
+import os
+import time
+from services.history_manager import HistoryManager
+from services.kb_service import KBService
+from services.tools_service import ToolsService
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Per-dependency budgets; a dependency that misses its budget is skipped, not awaited
+HISTORY_TIMEOUT_MS = int(os.getenv("HISTORY_TIMEOUT_MS", "300"))
+KB_TIMEOUT_MS = int(os.getenv("KB_TIMEOUT_MS", "1500"))
+TOOLS_TIMEOUT_MS = int(os.getenv("TOOLS_TIMEOUT_MS", "300"))
+
+
+@dataclass
+class ChatContext:
+    """Everything the LLM call needs besides the query itself"""
+    history: List[Dict[str, str]]
+    summary: Optional[str]
+    context_chunks: List[Dict[str, Any]]
+    tools: List[Dict[str, Any]]
+    timings: Dict[str, float] = field(default_factory=dict)  # Milliseconds per stage
+    degraded: List[str] = field(default_factory=list)  # Stages that timed out or failed
+
+
+class ChatContextLoader:
+    """
+    Fans out the independent pre-LLM lookups so their latency is the slowest
+    dependency rather than the sum, degrading to empty results on timeout.
+    """
+
+    def __init__(self, history_manager: HistoryManager, kb_service: KBService, tools_service: ToolsService):
+        self.history_manager = history_manager
+        self.kb_service = kb_service
+        self.tools_service = tools_service
+
+    async def load(
+        self,
+        query: str,
+        project_id: str,
+        session_id: str,
+        fallback_history: Optional[List[Dict[str, str]]] = None
+    ) -> ChatContext:
+        timings: Dict[str, float] = {}
+        degraded: List[str] = []
+        started = time.perf_counter()
+
+        async def timed(stage: str, awaitable: Awaitable, timeout_ms: int, default: Any) -> Any:
+            stage_start = time.perf_counter()
+            with tracer.start_as_current_span(f"chat.{stage}") as span:
+                try:
+                    return await asyncio.wait_for(awaitable, timeout_ms / 1000)
+                except asyncio.TimeoutError:
+                    logger.warning("Chat stage timed out, continuing without it", extra={"stage": stage, "timeout_ms": timeout_ms})
+                    degraded.append(stage)
+                    span.set_attribute("degraded", "timeout")
+                    return default
+                except Exception as e:
+                    logger.warning("Chat stage failed, continuing without it: %s", e, extra={"stage": stage})
+                    degraded.append(stage)
+                    span.set_attribute("degraded", "error")
+                    return default
+                finally:
+                    timings[stage] = round((time.perf_counter() - stage_start) * 1000, 1)
+
+        (history, summary), context_chunks, tools = await asyncio.gather(
+            timed(
+                "history",
+                self.history_manager.get_prompt_history(project_id, session_id, fallback_history=fallback_history),
+                HISTORY_TIMEOUT_MS,
+                (fallback_history or [], None)
+            ),
+            timed("kb", self.kb_service.get_relevant_context(query, project_id), KB_TIMEOUT_MS, []),
+            timed("tools", self._load_tools(project_id), TOOLS_TIMEOUT_MS, [])
+        )
+
+        timings["pre_llm"] = round((time.perf_counter() - started) * 1000, 1)
+
+        return ChatContext(
+            history=history,
+            summary=summary,
+            context_chunks=context_chunks,
+            tools=tools,
+            timings=timings,
+            degraded=degraded
+        )
+
+    async def _load_tools(self, project_id: str) -> List[Dict[str, Any]]:
+        return await self.tools_service.get_tools_for_llm(project_id)
@@ -0,0 +1,107 @@
+"""
+Chat WebSocket protocol
+Multiplexes concurrent requests over one socket by request id, with a single
+bounded writer so slow readers apply backpressure instead of buffering
+"""
+
+from typing import Dict, Any, Callable, Awaitable
+import asyncio
+import json
+import logging
+import os
+import uuid
+from fastapi import WebSocket
+from opentelemetry import trace
+from opentelemetry.context import Context
+from opentelemetry.trace import Link, SpanKind, Status, StatusCode
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "4"))  # Concurrent requests per socket
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "32"))  # Frames waiting for a slow client
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))  # Stalled client is dropped
+
+RequestHandler = Callable[["ChatSocketConnection", str, Dict[str, Any]], Awaitable[None]]
+
+
+class ChatSocketConnection:
+    """
+    Client frames: {"request_id", "query", "session_id"?} starts a request,
+    {"type": "cancel", "request_id"} cancels one. Every server frame carries
+    the request_id it belongs to, so responses may interleave.
+    """
+
+    def __init__(self, websocket: WebSocket, session_id: str, max_inflight: int = WS_MAX_INFLIGHT):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.max_inflight = max_inflight
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self._requests: Dict[str, asyncio.Task] = {}
+
+    async def send(self, frame: Dict[str, Any]):
+        """Queue a frame; waits while the client is not keeping up"""
+        await self._outbox.put(frame)
+
+    async def serve(self, handler: RequestHandler):
+        """Run until the client disconnects or stops reading"""
+        writer = asyncio.create_task(self._write_loop())
+        reader = asyncio.create_task(self._read_loop(handler))
+        try:
+            await self.send({"type": "session", "session_id": self.session_id})
+            done, _ = await asyncio.wait({reader, writer}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in [reader, writer, *self._requests.values()]:
+                task.cancel()
+
+    async def _write_loop(self):
+        while True:
+            frame = await self._outbox.get()
+            await asyncio.wait_for(self.websocket.send_text(json.dumps(frame)), WS_SEND_TIMEOUT_SECONDS)
+
+    async def _read_loop(self, handler: RequestHandler):
+        while True:
+            data = await self.websocket.receive_text()
+            try:
+                message = json.loads(data)
+            except ValueError:
+                await self.send({"type": "error", "code": "invalid_json", "message": "Frames must be JSON"})
+                continue
+
+            request_id = str(message.get("request_id") or uuid.uuid4().hex)
+
+            if message.get("type") == "cancel":
+                task = self._requests.get(request_id)
+                if task:
+                    task.cancel()
+                    await self.send({"type": "cancelled", "request_id": request_id})
+                continue
+
+            if request_id in self._requests:
+                await self.send({"type": "error", "request_id": request_id, "code": "duplicate_request_id"})
+                continue
+            if len(self._requests) >= self.max_inflight:
+                await self.send({"type": "error", "request_id": request_id, "code": "too_many_requests"})
+                continue
+
+            self._requests[request_id] = asyncio.create_task(self._run(handler, request_id, message))
+
+    async def _run(self, handler: RequestHandler, request_id: str, message: Dict[str, Any]):
+        # Each request is its own trace, linked to the socket's, so a long session
+        # does not end up as one enormous trace
+        session = trace.get_current_span().get_span_context()
+        links = [Link(session)] if session.is_valid else []
+        with tracer.start_as_current_span("ws.request", context=Context(), links=links, kind=SpanKind.SERVER) as span:
+            span.set_attribute("ws.request_id", request_id)
+            try:
+                await handler(self, request_id, message)
+            except asyncio.CancelledError:
+                span.set_attribute("ws.cancelled", True)
+            except Exception as e:
+                logger.exception("WebSocket request failed", extra={"request_id": request_id})
+                span.set_status(Status(StatusCode.ERROR, str(e)))
+                await self.send({"type": "error", "request_id": request_id, "code": "internal_error"})
+            finally:
+                self._requests.pop(request_id, None)
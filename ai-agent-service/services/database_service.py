@@ -1,24 +1,66 @@
 from typing import Dict, Any, Optional, List
-from sqlalchemy import create_engine, text, Engine
-from sqlalchemy.exc import SQLAlchemyError
+from functools import lru_cache
+from sqlalchemy import text, TextClause
+from sqlalchemy.exc import SQLAlchemyError, DBAPIError, TimeoutError as PoolTimeoutError
 from models.db_connection import DatabaseConnection, CreateDatabaseConnectionRequest
-from utils.encryption import encrypt_value, decrypt_value
+from services.registry_store import ProjectRegistry, MemoryRegistryBackend
+from services.engine_registry import EngineRegistry, EngineCapacityError
+from services.replica_router import ReplicaRouter
+from services.query_stats import ActionQueryStats
+from utils.encryption import encrypt_value
+import asyncio
+from utils.tracing import tracer
+from opentelemetry.trace import SpanKind
+import logging
+import os
+import time
 import uuid
 
-# In-memory storage for MVP (Production should use a persistence layer like MongoDB/Postgres)
-# Map: project_id -> Connection ID -> DatabaseConnection
-_CONNECTIONS_DB: Dict[str, Dict[str, DatabaseConnection]] = {}
+logger = logging.getLogger(__name__)
+
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "512"))  # Distinct query templates per worker
+
+
+
+@lru_cache(maxsize=DB_STATEMENT_CACHE_SIZE)
+def compiled_statement(query_template: str) -> TextClause:
+    """
+    One TextClause per action query, so its bind parameters are parsed once;
+    each engine's compiled cache then skips SQL compilation on later calls.
+    Using text() keeps parameter binding safe.
+    """
+    return text(query_template)
+
+
+def _unreachable(error: Exception) -> bool:
+    """The database could not be reached, as opposed to the query failing on it"""
+    if isinstance(error, PoolTimeoutError):
+        return True
+    # Connect errors carry no statement; connection_invalidated marks a connection dropped mid-query
+    return isinstance(error, DBAPIError) and (error.statement is None or error.connection_invalidated)
 
-# Map: connection_id -> SQLAlchemy Engine
-_ENGINE_CACHE: Dict[str, Engine] = {}
 
 class DatabaseService:
     
-    def save_connection(self, project_id: str, request: CreateDatabaseConnectionRequest) -> DatabaseConnection:
+    def __init__(
+        self,
+        registry: Optional[ProjectRegistry[DatabaseConnection]] = None,
+        engines: Optional[EngineRegistry] = None
+    ):
+        # Connection configs are shared by every worker (see services/registry_store.py)
+        self.registry = registry or ProjectRegistry("connections", DatabaseConnection, MemoryRegistryBackend())
+        # One bounded pool per connection (see services/engine_registry.py)
+        self.engines = engines or EngineRegistry()
+        # Read-only actions prefer replicas (see services/replica_router.py)
+        self.replicas = ReplicaRouter(self.engines)
+        self.action_stats = ActionQueryStats()
+    
+    async def save_connection(self, project_id: str, request: CreateDatabaseConnectionRequest) -> DatabaseConnection:
         """Saves a new database connection config."""
         connection_id = str(uuid.uuid4())
         
         connection = DatabaseConnection(
+            id=connection_id,
             project_id=project_id,
             type=request.type,
             name=request.name,
@@ -27,115 +69,125 @@ class DatabaseService:
             username=request.username,
             encrypted_password=encrypt_value(request.password),
             database=request.database,
-            ssl_mode=request.ssl_mode
+            ssl_mode=request.ssl_mode,
+            pool_size=request.pool_size,
+            max_overflow=request.max_overflow,
+            replicas=request.replicas,
+            max_replica_lag_seconds=request.max_replica_lag_seconds
         )
         
-        if project_id not in _CONNECTIONS_DB:
-            _CONNECTIONS_DB[project_id] = {}
-        
-        # Store with ID (In real DB, ID is key)
-        # We need to attach the ID to the object or store it in a way we can retrieve it.
-        # Let's mock the "ID generation" part of a DB
-        # Re-creating object to include ID if we added it to model, 
-        # but for now let's just use a dict for storage
-        _CONNECTIONS_DB[project_id][connection_id] = connection
-        
-        # Return connection with ID (injecting ID dynamically for this mock)
-        # In a real app, the model would have 'id' field
-        setattr(connection, 'id', connection_id) 
+        await self.registry.put(project_id, connection_id, connection)
         return connection
 
-    def get_connections(self, project_id: str) -> List[Dict]:
+    async def get_connections(self, project_id: str) -> List[Dict]:
         """Returns all connections for a project."""
-        if project_id not in _CONNECTIONS_DB:
-            return []
-        
         results = []
-        for conn_id, conn in _CONNECTIONS_DB[project_id].items():
-            # Return as dict with ID
+        for conn in (await self.registry.get_all(project_id)).values():
             data = conn.model_dump()
-            data['id'] = conn_id
             data.pop('encrypted_password') # Don't leak this
             results.append(data)
         return results
 
-    def _get_engine(self, connection: DatabaseConnection) -> Engine:
-        """Creates or retrieves a cached SQLAlchemy engine."""
-        # Use a consistent key for caching. 
-        # Note: If config changes, we should invalidate cache. For MVP, we assume immutable config or server restart.
-        cache_key = f"{connection.host}:{connection.port}/{connection.database}" 
-        
-        if cache_key in _ENGINE_CACHE:
-            return _ENGINE_CACHE[cache_key]
-        
-        password = decrypt_value(connection.encrypted_password)
-        
-        url = ""
-        if connection.type == "postgres":
-            url = f"postgresql+psycopg2://{connection.username}:{password}@{connection.host}:{connection.port}/{connection.database}"
-        elif connection.type == "mysql":
-            url = f"mysql+pymysql://{connection.username}:{password}@{connection.host}:{connection.port}/{connection.database}"
-        else:
-            raise ValueError(f"Unsupported database type: {connection.type}")
-            
-        try:
-            engine = create_engine(url, pool_pre_ping=True, pool_size=5, max_overflow=10)
-            _ENGINE_CACHE[cache_key] = engine
-            return engine
-        except Exception as e:
-            print(f"Failed to create engine: {e}")
-            raise e
-
-    def test_connection(self, project_id: str, connection_id: str) -> bool:
+    async def test_connection(self, project_id: str, connection_id: str) -> bool:
         """Tests connectivity to the database."""
-        conn = self._get_connection_by_id(project_id, connection_id)
+        conn = await self._get_connection_by_id(project_id, connection_id)
         if not conn:
             raise ValueError("Connection not found")
             
         try:
-            engine = self._get_engine(conn)
-            with engine.connect() as connection:
-                connection.execute(text("SELECT 1"))
+            await asyncio.to_thread(self._ping, conn)
             return True
         except Exception as e:
-            print(f"Connection test failed: {e}")
+            logger.warning("Connection test failed: %s", e, extra={"connection_id": connection_id})
             return False
 
-    def execute_named_query(self, project_id: str, connection_id: str, query_template: str, params: Dict[str, Any]) -> List[Dict]:
+    async def execute_named_query(
+        self,
+        project_id: str,
+        connection_id: str,
+        query_template: str,
+        params: Dict[str, Any],
+        read_only: bool = False,
+        action_id: Optional[str] = None
+    ) -> List[Dict]:
         """
         Executes a named SQL query with safe parameter binding.
+        Read-only queries run on a replica when the connection has a usable one.
         """
-        conn = self._get_connection_by_id(project_id, connection_id)
+        conn = await self._get_connection_by_id(project_id, connection_id)
         if not conn:
             raise ValueError("Connection not found")
             
         try:
-            engine = self._get_engine(conn)
-            
-            # Using text() for safe parameter binding
-            statement = text(query_template)
-            
-            with engine.connect() as connection:
-                # Execute and fetch results
-                result = connection.execute(statement, params)
-                
-                # Check if it's a SELECT query (returns rows)
-                if result.returns_rows:
-                    # Convert rows to list of dicts
-                    keys = result.keys()
-                    return [dict(zip(keys, row)) for row in result.fetchall()]
-                else:
-                    # For INSERT/UPDATE/DELETE, return rowcount or success indicator
-                    return [{"status": "success", "rows_affected": result.rowcount}]
-                    
+            # Pool checkout and the query block, so they run off the event loop
+            return await asyncio.to_thread(self._run_query, conn, query_template, params, read_only, project_id, action_id)
+        except EngineCapacityError as e:
+            logger.warning("Database connection budget exhausted", extra={"connection_id": connection_id})
+            raise ValueError(str(e))
         except SQLAlchemyError as e:
-            print(f"SQL Error: {e}")
+            logger.warning("SQL error: %s", e, extra={"connection_id": connection_id})
             raise ValueError(f"Database execution error: {str(e)}")
         except Exception as e:
-            print(f"Generic Error: {e}")
+            logger.exception("Query execution failed", extra={"connection_id": connection_id})
             raise ValueError(f"Execution error: {str(e)}")
 
-    def _get_connection_by_id(self, project_id: str, connection_id: str) -> Optional[DatabaseConnection]:
-        if project_id in _CONNECTIONS_DB and connection_id in _CONNECTIONS_DB[project_id]:
-            return _CONNECTIONS_DB[project_id][connection_id]
-        return None
+    def _ping(self, conn: DatabaseConnection):
+        with self.engines.connect(conn) as (_, connection):
+            connection.execute(text("SELECT 1"))
+
+    def _run_query(
+        self,
+        conn: DatabaseConnection,
+        query_template: str,
+        params: Dict[str, Any],
+        read_only: bool,
+        project_id: str,
+        action_id: Optional[str]
+    ) -> List[Dict]:
+        statement = compiled_statement(query_template)
+        # The primary is always last, so its errors are the ones that surface
+        targets = self.replicas.read_targets(conn) if read_only else [conn]
+
+        for target in targets:
+            role = "primary" if target is conn else "replica"
+            started = time.perf_counter()
+            try:
+                rows = self._execute(target, role, statement, params)
+            except Exception as e:
+                self.action_stats.record(project_id, action_id, time.perf_counter() - started, role, ok=False)
+                if target is not conn and isinstance(e, EngineCapacityError):
+                    # This worker has no room for the replica's engine; the replica itself is fine
+                    logger.info("No engine capacity for replica, trying next", extra={"connection_id": target.id})
+                    continue
+                if target is conn or not _unreachable(e):
+                    raise
+                self.replicas.record_failure(target)
+                logger.warning("Replica unavailable, trying next: %s", e, extra={"connection_id": target.id})
+                continue
+            self.action_stats.record(project_id, action_id, time.perf_counter() - started, role, ok=True)
+            self.replicas.record_read(target, conn)
+            return rows
+
+    def _execute(self, target: DatabaseConnection, role: str, statement: TextClause, params: Dict[str, Any]) -> List[Dict]:
+        with tracer.start_as_current_span("db.query", kind=SpanKind.CLIENT) as span, self.engines.connect(target) as (engine, connection):
+            span.set_attributes({"db.system": engine.dialect.name, "db.connection_id": target.id, "db.target": role})
+            # Execute and fetch results
+            result = connection.execute(statement, params)
+            
+            # Check if it's a SELECT query (returns rows)
+            if result.returns_rows:
+                # Convert rows to list of dicts
+                keys = result.keys()
+                return [dict(zip(keys, row)) for row in result.fetchall()]
+            else:
+                # For INSERT/UPDATE/DELETE, return rowcount or success indicator
+                return [{"status": "success", "rows_affected": result.rowcount}]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "replicas": self.replicas.get_stats(),
+            "statement_cache": compiled_statement.cache_info()._asdict()
+        }
+
+    async def _get_connection_by_id(self, project_id: str, connection_id: str) -> Optional[DatabaseConnection]:
+        return await self.registry.get(project_id, connection_id)
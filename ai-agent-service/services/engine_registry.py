@@ -0,0 +1,308 @@
+"""
+SQLAlchemy engines for customer databases
+One engine per (connection id, config version), so tenants never share a pool
+and a changed connection gets a fresh engine. Engines are evicted least
+recently used first once DB_ENGINE_MAX_COUNT is reached, after
+DB_ENGINE_IDLE_SECONDS without use, or to stay under DB_MAX_TOTAL_CONNECTIONS
+pooled connections per worker; evicted engines are disposed, which closes
+their pooled connections. connect() leases the engine before checking out a
+connection, and leased engines are never evicted.
+"""
+
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from sqlalchemy import create_engine, event, Engine
+from sqlalchemy.engine import URL
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from models.db_connection import DatabaseConnection
+from utils.encryption import decrypt_value
+from utils.metrics import (
+    DB_ENGINE_LOOKUPS,
+    DB_ENGINE_EVICTIONS,
+    DB_ENGINES,
+    DB_POOL_CAPACITY,
+    DB_POOL_CHECKOUT_SECONDS,
+    DB_POOL_CONNECTS
+)
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "2"))  # Per connection, unless the connection sets pool_size
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "3"))  # Per connection, unless it sets max_overflow
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "5"))  # Wait for a free pooled connection
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_ENGINE_MAX_COUNT = int(os.getenv("DB_ENGINE_MAX_COUNT", "100"))  # Engines per worker
+DB_ENGINE_IDLE_SECONDS = float(os.getenv("DB_ENGINE_IDLE_SECONDS", "300"))
+DB_MAX_TOTAL_CONNECTIONS = int(os.getenv("DB_MAX_TOTAL_CONNECTIONS", "200"))  # pool_size + max_overflow over all engines, per worker
+DB_ENGINE_SWEEP_SECONDS = float(os.getenv("DB_ENGINE_SWEEP_SECONDS", "60"))
+
+_DRIVERS = {"postgres": "postgresql+psycopg2", "mysql": "mysql+pymysql"}
+
+
+class EngineCapacityError(Exception):
+    """Every pooled connection this worker may hold is checked out"""
+
+
+def config_version(connection: DatabaseConnection) -> str:
+    """Hash of everything the engine is built from; changes whenever the connection does"""
+    fields = connection.model_dump(include={
+        "type", "host", "port", "username", "encrypted_password", "database", "ssl_mode", "pool_size", "max_overflow"
+    })
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class _Entry:
+    __slots__ = ("engine", "version", "capacity", "last_used", "leases", "retired")
+
+    def __init__(self, engine: Engine, version: str, capacity: int):
+        self.engine = engine
+        self.version = version
+        self.capacity = capacity
+        self.last_used = time.monotonic()
+        self.leases = 0  # connect() calls between lookup and close, taken under the registry lock
+        self.retired = False  # removed while leased; disposed when the last lease ends
+
+    def in_use(self) -> bool:
+        return self.leases > 0 or self.engine.pool.checkedout() > 0
+
+
+class EngineRegistry:
+    """Bounded, thread-safe cache of engines by connection id"""
+
+    def __init__(
+        self,
+        max_engines: int = DB_ENGINE_MAX_COUNT,
+        max_total_connections: int = DB_MAX_TOTAL_CONNECTIONS,
+        idle_seconds: float = DB_ENGINE_IDLE_SECONDS
+    ):
+        self.max_engines = max_engines
+        self.max_total_connections = max_total_connections
+        self.idle_seconds = idle_seconds
+        # connection id -> entry, least recently used first
+        self._engines: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._capacity = 0
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "capacity_rejections": 0, "checkout_timeouts": 0}
+
+    def get(self, connection: DatabaseConnection) -> Engine:
+        """
+        The engine for this connection's current config, creating it if needed.
+        Not leased: it can be evicted at any time, use connect() to query.
+        """
+        return self._acquire(connection, lease=False).engine
+
+    def _acquire(self, connection: DatabaseConnection, lease: bool) -> _Entry:
+        version = config_version(connection)
+        key = connection.id or version
+        if connection.type not in _DRIVERS:
+            raise ValueError(f"Unsupported database type: {connection.type}")
+        retired = []
+        try:
+            with self._lock:
+                entry = self._engines.get(key)
+                if entry and entry.version == version:
+                    entry.last_used = time.monotonic()
+                    entry.leases += lease
+                    self._engines.move_to_end(key)
+                    self._stats["hits"] += 1
+                    DB_ENGINE_LOOKUPS.labels("hit").inc()
+                    return entry
+
+                self._stats["misses"] += 1
+                DB_ENGINE_LOOKUPS.labels("miss").inc()
+                pool_size, max_overflow = self._pool_limits(connection)
+                if entry:
+                    # The connection was edited; its old pool must not be used again
+                    retired.append(self._remove(key, "replaced"))
+                retired.extend(self._make_room(pool_size + max_overflow))
+                engine = self._create_engine(connection, pool_size, max_overflow)
+                entry = _Entry(engine, version, pool_size + max_overflow)
+                entry.leases += lease
+                self._engines[key] = entry
+                self._capacity += pool_size + max_overflow
+                self._update_gauges()
+                return entry
+        finally:
+            # Outside the lock: closing connections can block
+            for old in retired:
+                if old is not None:
+                    old.dispose()
+
+    def _release(self, entry: _Entry):
+        with self._lock:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            if not (entry.retired and entry.leases == 0):
+                return
+            # Its capacity stayed counted until now: the connections were still open
+            self._capacity -= entry.capacity
+            self._update_gauges()
+        entry.engine.dispose()
+
+    @contextmanager
+    def connect(self, connection: DatabaseConnection):
+        """Check out a pooled connection, recording how long the wait took"""
+        # Leased under the registry lock, so the engine cannot be evicted before or while it is used
+        entry = self._acquire(connection, lease=True)
+        try:
+            engine = entry.engine
+            started = time.perf_counter()
+            try:
+                db_connection = engine.connect()
+            except PoolTimeoutError:
+                self._stats["checkout_timeouts"] += 1
+                DB_POOL_CHECKOUT_SECONDS.labels("timeout").observe(time.perf_counter() - started)
+                raise
+            except Exception:
+                DB_POOL_CHECKOUT_SECONDS.labels("error").observe(time.perf_counter() - started)
+                raise
+            DB_POOL_CHECKOUT_SECONDS.labels("ok").observe(time.perf_counter() - started)
+            try:
+                yield engine, db_connection
+            finally:
+                db_connection.close()
+        finally:
+            self._release(entry)
+
+    def _pool_limits(self, connection: DatabaseConnection) -> Tuple[int, int]:
+        pool_size = connection.pool_size if connection.pool_size is not None else DB_POOL_SIZE
+        max_overflow = connection.max_overflow if connection.max_overflow is not None else DB_POOL_MAX_OVERFLOW
+        # One connection may not take more than the whole worker budget
+        pool_size = max(1, min(pool_size, self.max_total_connections))
+        max_overflow = max(0, min(max_overflow, self.max_total_connections - pool_size))
+        return pool_size, max_overflow
+
+    def _create_engine(self, connection: DatabaseConnection, pool_size: int, max_overflow: int) -> Engine:
+        url = URL.create(
+            _DRIVERS[connection.type],
+            username=connection.username,
+            password=decrypt_value(connection.encrypted_password),
+            host=connection.host,
+            port=connection.port,
+            database=connection.database
+        )
+        engine = create_engine(
+            url,
+            pool_pre_ping=True,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=DB_POOL_RECYCLE_SECONDS
+        )
+        event.listen(engine, "connect", lambda *args: DB_POOL_CONNECTS.inc())
+        return engine
+
+    def _make_room(self, capacity: int) -> list:
+        """
+        Evict least recently used idle engines until `capacity` more connections
+        fit; engines with connections checked out are never evicted
+        """
+        count, total = len(self._engines), self._capacity
+        victims = []
+        for key, entry in self._engines.items():
+            if count < self.max_engines and total + capacity <= self.max_total_connections:
+                break
+            if not entry.in_use():
+                victims.append(key)
+                count -= 1
+                total -= entry.capacity
+        if count >= self.max_engines or total + capacity > self.max_total_connections:
+            self._stats["capacity_rejections"] += 1
+            raise EngineCapacityError("Too many database connections in use, retry shortly")
+
+        evicted = []
+        for key in victims:
+            reason = "lru" if len(self._engines) >= self.max_engines else "capacity"
+            evicted.append(self._remove(key, reason))
+        return evicted
+
+    def _remove(self, key: str, reason: str) -> Optional[Engine]:
+        """The engine to dispose, or None if it is leased and left to the last _release()"""
+        entry = self._engines.pop(key)
+        self._stats["evictions"] += 1
+        DB_ENGINE_EVICTIONS.labels(reason).inc()
+        if entry.leases:
+            entry.retired = True
+            self._update_gauges()
+            return None
+        self._capacity -= entry.capacity
+        self._update_gauges()
+        return entry.engine
+
+    def _update_gauges(self):
+        DB_ENGINES.set(len(self._engines))
+        DB_POOL_CAPACITY.set(self._capacity)
+
+    def evict_idle(self) -> int:
+        """Dispose engines unused for `idle_seconds` with nothing checked out"""
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [key for key, entry in self._engines.items() if entry.last_used < cutoff and not entry.in_use()]
+            evicted = [self._remove(key, "idle") for key in idle]
+        for engine in evicted:
+            engine.dispose()
+        return len(evicted)
+
+    def dispose_all(self):
+        with self._lock:
+            evicted = [self._remove(key, "shutdown") for key in list(self._engines)]
+        for engine in evicted:
+            if engine is not None:
+                engine.dispose()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.dispose_all)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(DB_ENGINE_SWEEP_SECONDS)
+            try:
+                evicted = await asyncio.to_thread(self.evict_idle)
+                if evicted:
+                    logger.debug("Disposed %d idle database engines", evicted)
+            except Exception as e:
+                logger.warning("Idle engine sweep failed: %s", e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            engines = [
+                {
+                    "connection_id": key,
+                    "version": entry.version,
+                    "pool_capacity": entry.capacity,
+                    "checked_out": entry.engine.pool.checkedout(),
+                    "leases": entry.leases,
+                    "idle_seconds": round(time.monotonic() - entry.last_used, 1)
+                }
+                for key, entry in self._engines.items()
+            ]
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "engines": len(engines),
+                "max_engines": self.max_engines,
+                "pool_capacity": self._capacity,
+                "max_total_connections": self.max_total_connections,
+                "by_connection": engines
+            }
@@ -0,0 +1,120 @@
+"""
+Token-budgeted conversation history
+Keeps recent turns verbatim and folds older turns into a rolling summary
+"""
+
+from typing import List, Dict, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+from litellm import token_counter
+from services.session_service import SessionService
+from services.llm_service import LLMService, MODEL_NAME
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+
+
+class HistoryManager:
+    """
+    Builds the history sent to the LLM.
+    Recent messages are kept verbatim while they fit in the token budget; anything
+    older is summarized in the background and removed from the stored history.
+    """
+
+    def __init__(self, session_service: SessionService, llm_service: LLMService, token_budget: int = HISTORY_TOKEN_BUDGET):
+        self.session_service = session_service
+        self.llm_service = llm_service
+        self.token_budget = token_budget
+        # Sessions with a compaction in flight, and strong refs to the tasks
+        self._compacting: Set[Tuple[str, str]] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def count_tokens(self, message: Dict[str, str]) -> int:
+        """Count tokens for a single message, falling back to a character estimate"""
+        try:
+            return token_counter(model=MODEL_NAME, messages=[message])
+        except Exception:
+            return len(message.get("content") or "") // 4 + 4
+
+    def split_history(self, history: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """
+        Split history into (older, recent) where recent is the longest suffix that
+        fits in the token budget.
+        """
+        used = 0
+        cut = len(history)
+        for index in range(len(history) - 1, -1, -1):
+            used += self.count_tokens(history[index])
+            if used > self.token_budget:
+                break
+            cut = index
+
+        # Start the verbatim part on a user turn so it never opens with a dangling reply
+        while cut < len(history) and history[cut].get("role") != "user":
+            cut += 1
+
+        return history[:cut], history[cut:]
+
+    async def get_prompt_history(
+        self,
+        project_id: str,
+        session_id: str,
+        fallback_history: Optional[List[Dict[str, str]]] = None
+    ) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """
+        Return (recent_messages, summary) for prompt building.
+        Schedules a background compaction when older turns no longer fit.
+        """
+        history, summary = await self.session_service.get_history_with_summary(project_id, session_id)
+
+        if not history and fallback_history:
+            # Client-supplied history is budgeted too, but there is nothing stored to compact
+            return self.split_history(fallback_history)[1], summary
+
+        older, recent = self.split_history(history)
+        if older:
+            self.schedule_compaction(project_id, session_id)
+
+        return recent, summary
+
+    def schedule_compaction(self, project_id: str, session_id: str):
+        """Refresh the rolling summary off the request path"""
+        session = (project_id, session_id)
+        if session in self._compacting:
+            return
+
+        self._compacting.add(session)
+        task = asyncio.create_task(self._compact(project_id, session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._compacting.discard(session))
+
+    async def _compact(self, project_id: str, session_id: str):
+        try:
+            # _compacting only covers this worker; the lock covers every worker
+            if not await self.session_service.acquire_compact_lock(project_id, session_id):
+                return
+        except Exception as e:
+            logger.warning("Error compacting history: %s", e, extra={"project_id": project_id, "session_id": session_id})
+            return
+        try:
+            history, summary = await self.session_service.get_history_with_summary(project_id, session_id)
+            older, _ = self.split_history(history)
+            if not older:
+                return
+
+            new_summary = await self.llm_service.summarize_conversation(older, summary, project_id)
+            if not new_summary:
+                return
+
+            folded = await self.session_service.compact_history(project_id, session_id, new_summary, older)
+            logger.info("Folded messages into summary", extra={"project_id": project_id, "session_id": session_id, "messages": folded})
+        except Exception as e:
+            logger.warning("Error compacting history: %s", e, extra={"project_id": project_id, "session_id": session_id})
+        finally:
+            try:
+                await self.session_service.release_compact_lock(project_id, session_id)
+            except Exception as e:
+                logger.debug("Compaction lock not released, it expires on its own: %s", e, extra={"project_id": project_id, "session_id": session_id})
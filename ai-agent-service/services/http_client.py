@@ -0,0 +1,261 @@
+"""
+Shared outbound HTTP for workflow API calls
+One pooled client per process, retries with backoff, response size caps and a
+per-host circuit breaker so a failing endpoint is skipped instead of waited on
+"""
+
+from typing import Dict, Optional, Any
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+import asyncio
+import json
+import os
+import random
+import time
+import httpx
+from opentelemetry.trace import SpanKind
+from utils.tracing import tracer
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_TIMEOUT_MS = int(os.getenv("HTTP_TIMEOUT_MS", "5000"))  # Per attempt, unless the node sets its own
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE_MS = int(os.getenv("HTTP_BACKOFF_BASE_MS", "200"))
+HTTP_BACKOFF_MAX_MS = int(os.getenv("HTTP_BACKOFF_MAX_MS", "2000"))
+HTTP_MAX_RESPONSE_BYTES = int(os.getenv("HTTP_MAX_RESPONSE_BYTES", str(256 * 1024)))
+HTTP_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("HTTP_CIRCUIT_FAILURE_THRESHOLD", "5"))
+HTTP_CIRCUIT_RESET_SECONDS = float(os.getenv("HTTP_CIRCUIT_RESET_SECONDS", "30"))
+
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# Requests that are safe to resend after the server may have seen them
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the host while its circuit is open"""
+
+
+class ResponseTooLargeError(Exception):
+    """Raised when a response body exceeds the configured cap"""
+
+
+@dataclass
+class HTTPResult:
+    status_code: int
+    text: str
+    attempts: int
+    elapsed_ms: float
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures.
+    After `reset_seconds` one trial request is let through (half-open);
+    its outcome closes the circuit or opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = HTTP_CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = HTTP_CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class PooledHTTPClient:
+    """Process-wide client for workflow API calls"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats = {"requests": 0, "retries": 0, "failures": 0, "short_circuited": 0, "too_large": 0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+                ),
+                timeout=HTTP_TIMEOUT_MS / 1000
+            )
+        return self._client
+
+    def _get_breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc.lower()
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker()
+        return breaker
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        body: Optional[str] = None,
+        timeout_ms: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        max_response_bytes: Optional[int] = None
+    ) -> HTTPResult:
+        """
+        Send a request, retrying connection errors, timeouts and 429/502/503/504.
+        Non-idempotent methods are only retried when the request never reached the server.
+        """
+        method = method.upper()
+        timeout = (timeout_ms or HTTP_TIMEOUT_MS) / 1000
+        retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+        max_bytes = max_response_bytes or HTTP_MAX_RESPONSE_BYTES
+        breaker = self._get_breaker(url)
+        started = time.perf_counter()
+        self._stats["requests"] += 1
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if not breaker.allow():
+                self._stats["short_circuited"] += 1
+                raise CircuitOpenError(f"Circuit open for {urlsplit(url).netloc}")
+
+            retry_after: Optional[float] = None
+            error: Optional[Exception] = None
+            try:
+                status_code, text, response_headers = await self._send(method, url, headers, body, timeout, max_bytes)
+            except asyncio.CancelledError:
+                # Cancelled by a branch or turn timeout: release a half-open trial slot
+                breaker.trial_in_flight = False
+                raise
+            except ResponseTooLargeError:
+                # The host answered; an oversized body is a configuration problem, not an outage
+                breaker.record_success()
+                self._stats["too_large"] += 1
+                raise
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                breaker.record_failure()
+                error = e
+                retryable = True
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                error = e
+                retryable = method in IDEMPOTENT_METHODS
+            else:
+                if status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+
+                if status_code not in RETRYABLE_STATUS_CODES or method not in IDEMPOTENT_METHODS or attempt > retries:
+                    return HTTPResult(
+                        status_code=status_code,
+                        text=text,
+                        attempts=attempt,
+                        elapsed_ms=round((time.perf_counter() - started) * 1000, 1)
+                    )
+                retry_after = _parse_retry_after(response_headers.get("retry-after"))
+
+            if error is not None and (not retryable or attempt > retries):
+                self._stats["failures"] += 1
+                raise error
+
+            self._stats["retries"] += 1
+            await asyncio.sleep(retry_after if retry_after is not None else _backoff_seconds(attempt))
+
+    async def _send(self, method: str, url: str, headers, body, timeout: float, max_bytes: int):
+        """
+        Stream the body so an oversized response is abandoned without buffering it.
+        Each attempt gets a span; trace headers are not sent, these are customer APIs.
+        """
+        with tracer.start_as_current_span("http.request", kind=SpanKind.CLIENT) as span:
+            span.set_attributes({"http.method": method, "server.address": urlsplit(url).netloc})
+            async with self._get_client().stream(method, url, headers=headers, content=body, timeout=timeout) as response:
+                span.set_attribute("http.status_code", response.status_code)
+                declared = response.headers.get("content-length")
+                if declared and declared.isdigit() and int(declared) > max_bytes:
+                    raise ResponseTooLargeError(f"Response of {declared} bytes exceeds {max_bytes}")
+
+                chunks = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ResponseTooLargeError(f"Response exceeds {max_bytes} bytes")
+                    chunks.append(chunk)
+
+                text = b"".join(chunks).decode(response.encoding or "utf-8", errors="replace")
+                return response.status_code, text, response.headers
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "circuits": {
+                host: {"state": breaker.state, "consecutive_failures": breaker.failures}
+                for host, breaker in self._breakers.items()
+            }
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _backoff_seconds(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    ceiling = min(HTTP_BACKOFF_MAX_MS, HTTP_BACKOFF_BASE_MS * (2 ** (attempt - 1)))
+    return random.uniform(0, ceiling) / 1000
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Honor Retry-After seconds, bounded by the backoff ceiling so a turn never stalls"""
+    if not value or not value.strip().isdigit():
+        return None
+    return min(float(value), HTTP_BACKOFF_MAX_MS / 1000)
+
+
+_http_client: Optional[PooledHTTPClient] = None
+
+
+def get_http_client() -> PooledHTTPClient:
+    """Shared client for the process; connections are opened lazily."""
+    global _http_client
+    if _http_client is None:
+        _http_client = PooledHTTPClient()
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
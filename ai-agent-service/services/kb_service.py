@@ -1,27 +1,48 @@
 import httpx
+import logging
 import os
 from typing import List, Dict, Any
+from utils.single_flight import SingleFlight, flight_key
+from utils.tracing import tracer, inject_headers
+from opentelemetry.trace import SpanKind
+
+logger = logging.getLogger(__name__)
 
 KNOWLEDGE_BASE_URL = os.getenv("KNOWLEDGE_BASE_URL", "http://localhost:8000")
 
 class KBService:
+    def __init__(self):
+        # Identical concurrent lookups (same project, question and limit) share one request
+        self.flight = SingleFlight()
+
     async def get_relevant_context(self, query: str, project_id: str, limit: int = 3) -> List[Dict[str, Any]]:
         """
         Query the Knowledge Base service for relevant chunks.
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{KNOWLEDGE_BASE_URL}/query",
-                    data={
-                        "query": query,
-                        "project_id": project_id,
-                        "limit": limit
-                    },
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return response.json()
-            except Exception as e:
-                print(f"Error querying Knowledge Base: {e}")
-                return []
+        return await self.flight.do(
+            flight_key(project_id, query, limit),
+            lambda: self._query_knowledge_base(query, project_id, limit)
+        )
+
+    async def _query_knowledge_base(self, query: str, project_id: str, limit: int) -> List[Dict[str, Any]]:
+        # Trace context goes along so /query shows up inside this chat turn's trace
+        with tracer.start_as_current_span("kb.query", kind=SpanKind.CLIENT) as span:
+            span.set_attribute("kb.limit", limit)
+            async with httpx.AsyncClient() as client:
+                try:
+                    response = await client.post(
+                        f"{KNOWLEDGE_BASE_URL}/query",
+                        data={
+                            "query": query,
+                            "project_id": project_id,
+                            "limit": limit
+                        },
+                        headers=inject_headers(),
+                        timeout=10.0
+                    )
+                    span.set_attribute("http.status_code", response.status_code)
+                    response.raise_for_status()
+                    return response.json()
+                except Exception as e:
+                    logger.warning("Error querying Knowledge Base: %s", e, extra={"project_id": project_id})
+                    return []
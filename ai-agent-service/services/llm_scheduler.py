@@ -0,0 +1,393 @@
+"""
+Admission control for LLM calls
+Global and per-project concurrency limits, weighted fair queueing between
+projects and bounded queues, so one tenant's burst cannot take every slot.
+Slots are counted in Redis so the limits hold across workers.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import itertools
+import logging
+import math
+import os
+import time
+import uuid
+from utils.metrics import LLM_QUEUE_SECONDS, LLM_REJECTED, project_label
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))  # All projects, all workers
+LLM_PROJECT_MAX_CONCURRENCY = int(os.getenv("LLM_PROJECT_MAX_CONCURRENCY", "4"))
+LLM_QUEUE_MAX_PER_PROJECT = int(os.getenv("LLM_QUEUE_MAX_PER_PROJECT", "16"))  # Per worker
+LLM_QUEUE_MAX_TOTAL = int(os.getenv("LLM_QUEUE_MAX_TOTAL", "256"))  # Per worker
+LLM_QUEUE_TIMEOUT_MS = int(os.getenv("LLM_QUEUE_TIMEOUT_MS", "10000"))
+# "project_a=3,project_b=0.5"; unlisted projects have weight 1
+LLM_PROJECT_WEIGHTS = os.getenv("LLM_PROJECT_WEIGHTS", "")
+# A slot held longer than this (crashed worker) is reclaimed
+LLM_SLOT_LEASE_SECONDS = int(os.getenv("LLM_SLOT_LEASE_SECONDS", "300"))
+# How often queued requests re-check Redis for slots freed by other workers
+LLM_SCHEDULER_POLL_MS = int(os.getenv("LLM_SCHEDULER_POLL_MS", "50"))
+
+GLOBAL_FULL = "global"
+PROJECT_FULL = "project"
+
+# Recent samples kept for queue-time and hold-time percentiles
+STATS_WINDOW = 1024
+
+
+class AdmissionRejected(Exception):
+    """Raised when a project's queue is full or a request waited too long; maps to HTTP 429"""
+
+    def __init__(self, project_id: str, reason: str, retry_after: int = 1):
+        super().__init__(f"LLM capacity exceeded for project {project_id} ({reason})")
+        self.project_id = project_id
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    weights = {}
+    for item in value.split(","):
+        project_id, _, weight = item.strip().partition("=")
+        if project_id and weight:
+            try:
+                weights[project_id] = max(float(weight), 0.01)
+            except ValueError:
+                logger.warning("Ignoring invalid LLM weight %r", weight, extra={"project_id": project_id})
+    return weights
+
+
+class LocalSlotBackend:
+    """In-process slot counters; the stand-in for Redis in tests and single-worker setups"""
+
+    def __init__(self):
+        self._leases: Dict[str, str] = {}  # lease id -> project id
+        self._per_project: Dict[str, int] = {}
+
+    async def try_acquire(self, project_id: str, global_limit: int, project_limit: int) -> Tuple[Optional[str], Optional[str]]:
+        """Returns (lease_id, None) on success or (None, GLOBAL_FULL | PROJECT_FULL)"""
+        if len(self._leases) >= global_limit:
+            return None, GLOBAL_FULL
+        if self._per_project.get(project_id, 0) >= project_limit:
+            return None, PROJECT_FULL
+
+        lease_id = uuid.uuid4().hex
+        self._leases[lease_id] = project_id
+        self._per_project[project_id] = self._per_project.get(project_id, 0) + 1
+        return lease_id, None
+
+    async def release(self, project_id: str, lease_id: str):
+        if self._leases.pop(lease_id, None) is None:
+            return
+        remaining = self._per_project.get(project_id, 1) - 1
+        if remaining > 0:
+            self._per_project[project_id] = remaining
+        else:
+            self._per_project.pop(project_id, None)
+
+    @property
+    def notifies_release(self) -> bool:
+        """Releases happen in this process, so waiters never need to poll"""
+        return True
+
+
+# Sorted sets of lease ids scored by expiry; expired leases (crashed workers) are dropped first
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then return 1 end
+if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[4]) then return 2 end
+local expires = tonumber(ARGV[1]) + tonumber(ARGV[2])
+redis.call('ZADD', KEYS[1], expires, ARGV[5])
+redis.call('ZADD', KEYS[2], expires, ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 0
+"""
+
+
+class RedisSlotBackend:
+    """
+    Slot counters shared by every worker. Keys use one hash tag so the script
+    also runs on Redis Cluster. If Redis is unreachable, admission falls back to
+    per-worker counting rather than failing chat requests.
+    """
+
+    def __init__(self, redis_client, key_prefix: str = "llm_slots", lease_seconds: int = LLM_SLOT_LEASE_SECONDS):
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.lease_seconds = lease_seconds
+        self._script = redis_client.register_script(_ACQUIRE_SCRIPT)
+        self._fallback = LocalSlotBackend()
+        self.redis_errors = 0
+
+    def _keys(self, project_id: str) -> List[str]:
+        return [f"{{{self.key_prefix}}}:global", f"{{{self.key_prefix}}}:project:{project_id}"]
+
+    async def try_acquire(self, project_id: str, global_limit: int, project_limit: int) -> Tuple[Optional[str], Optional[str]]:
+        lease_id = uuid.uuid4().hex
+        try:
+            result = await self._script(
+                keys=self._keys(project_id),
+                args=[time.time(), self.lease_seconds, global_limit, project_limit, lease_id]
+            )
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning("LLM scheduler Redis error, counting slots locally: %s", e)
+            local_lease, reason = await self._fallback.try_acquire(project_id, global_limit, project_limit)
+            return (f"local:{local_lease}" if local_lease else None), reason
+
+        if int(result) == 1:
+            return None, GLOBAL_FULL
+        if int(result) == 2:
+            return None, PROJECT_FULL
+        return lease_id, None
+
+    async def release(self, project_id: str, lease_id: str):
+        if lease_id.startswith("local:"):
+            await self._fallback.release(project_id, lease_id[len("local:"):])
+            return
+        try:
+            global_key, project_key = self._keys(project_id)
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.zrem(global_key, lease_id)
+            pipe.zrem(project_key, lease_id)
+            await pipe.execute()
+        except Exception as e:
+            # The lease expires on its own after lease_seconds
+            self.redis_errors += 1
+            logger.warning("LLM scheduler failed to release slot: %s", e, extra={"lease_id": lease_id})
+
+    @property
+    def notifies_release(self) -> bool:
+        """Slots are also freed by other workers, so waiters poll"""
+        return False
+
+
+class _Waiter:
+    __slots__ = ("project_id", "finish_tag", "sequence", "future", "enqueued_at")
+
+    def __init__(self, project_id: str, finish_tag: float, sequence: int):
+        self.project_id = project_id
+        self.finish_tag = finish_tag
+        self.sequence = sequence
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.perf_counter()
+
+
+class LLMScheduler:
+    """
+    Requests take a slot before calling the model and give it back when done.
+    When no slot is free they queue; queued requests are served in weighted
+    fair order (start-time fair queueing: each request gets a virtual finish
+    tag of max(virtual time, project's last tag) + 1/weight), so a project
+    with a deep backlog cannot starve one that sends a single request.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        project_max_concurrency: int = LLM_PROJECT_MAX_CONCURRENCY,
+        queue_max_per_project: int = LLM_QUEUE_MAX_PER_PROJECT,
+        queue_max_total: int = LLM_QUEUE_MAX_TOTAL,
+        queue_timeout_ms: int = LLM_QUEUE_TIMEOUT_MS,
+        weights: Optional[Dict[str, float]] = None,
+        poll_ms: int = LLM_SCHEDULER_POLL_MS
+    ):
+        self.backend = backend or LocalSlotBackend()
+        self.max_concurrency = max_concurrency
+        self.project_max_concurrency = project_max_concurrency
+        self.queue_max_per_project = queue_max_per_project
+        self.queue_max_total = queue_max_total
+        self.queue_timeout_ms = queue_timeout_ms
+        self.weights = parse_weights(LLM_PROJECT_WEIGHTS) if weights is None else weights
+        self.poll_interval = poll_ms / 1000
+
+        self._queue: List[_Waiter] = []
+        self._queued_per_project: Dict[str, int] = {}
+        self._last_finish_tag: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._active: Dict[str, int] = {}
+
+        self._queue_times_ms: deque = deque(maxlen=STATS_WINDOW)
+        self._hold_times_ms: deque = deque(maxlen=STATS_WINDOW)
+        self._stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    def weight(self, project_id: str) -> float:
+        return self.weights.get(project_id, 1.0)
+
+    @asynccontextmanager
+    async def slot(self, project_id: str):
+        """Hold one LLM slot for the duration of the block"""
+        # The span covers queueing only, so time spent waiting for capacity stands out
+        with tracer.start_as_current_span("llm.admission") as span:
+            queued = time.perf_counter()
+            lease_id = await self.acquire(project_id)
+            span.set_attribute("llm.queue_ms", round((time.perf_counter() - queued) * 1000, 1))
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._hold_times_ms.append((time.perf_counter() - started) * 1000)
+            await self.release(project_id, lease_id)
+
+    def check_admission(self, project_id: str):
+        """
+        Reject up front when the request would be refused anyway, for endpoints
+        that must choose their status code before work starts (e.g. streaming)
+        """
+        if len(self._queue) >= self.queue_max_total or self._queued_per_project.get(project_id, 0) >= self.queue_max_per_project:
+            self._stats["rejected_queue_full"] += 1
+            LLM_REJECTED.labels(project_label(project_id), "queue_full").inc()
+            raise AdmissionRejected(project_id, "queue_full", self._retry_after())
+
+    async def acquire(self, project_id: str) -> str:
+        project_id = project_id or "default"
+
+        # Fast path: nothing waiting, so taking a free slot cannot jump the queue
+        if not self._queue:
+            lease_id, _ = await self.backend.try_acquire(project_id, self.max_concurrency, self.project_max_concurrency)
+            if lease_id:
+                self._admitted(project_id, 0.0)
+                return lease_id
+
+        self.check_admission(project_id)
+        waiter = self._enqueue(project_id)
+        try:
+            lease_id = await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                self._stats["rejected_timeout"] += 1
+                LLM_REJECTED.labels(project_label(project_id), "queue_timeout").inc()
+                raise AdmissionRejected(project_id, "queue_timeout", self._retry_after())
+            lease_id = waiter.future.result()
+        except asyncio.CancelledError:
+            if not self._abandon(waiter):
+                # Granted while we were being cancelled: hand the slot back
+                await self.release(project_id, waiter.future.result())
+            raise
+
+        self._admitted(project_id, (time.perf_counter() - waiter.enqueued_at) * 1000)
+        return lease_id
+
+    async def release(self, project_id: str, lease_id: str):
+        project_id = project_id or "default"
+        remaining = self._active.get(project_id, 1) - 1
+        if remaining > 0:
+            self._active[project_id] = remaining
+        else:
+            self._active.pop(project_id, None)
+        await self.backend.release(project_id, lease_id)
+        self._wakeup.set()
+
+    def _admitted(self, project_id: str, queue_time_ms: float):
+        self._stats["admitted"] += 1
+        self._active[project_id] = self._active.get(project_id, 0) + 1
+        self._queue_times_ms.append(queue_time_ms)
+        LLM_QUEUE_SECONDS.observe(queue_time_ms / 1000)
+
+    def _enqueue(self, project_id: str) -> _Waiter:
+        start = max(self._virtual_time, self._last_finish_tag.get(project_id, 0.0))
+        finish_tag = start + 1 / self.weight(project_id)
+        self._last_finish_tag[project_id] = finish_tag
+
+        waiter = _Waiter(project_id, finish_tag, next(self._sequence))
+        self._queue.append(waiter)
+        self._queued_per_project[project_id] = self._queued_per_project.get(project_id, 0) + 1
+        self._stats["queued"] += 1
+
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        return waiter
+
+    def _remove(self, waiter: _Waiter):
+        self._queue.remove(waiter)
+        remaining = self._queued_per_project.get(waiter.project_id, 1) - 1
+        if remaining > 0:
+            self._queued_per_project[waiter.project_id] = remaining
+        else:
+            self._queued_per_project.pop(waiter.project_id, None)
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Drop a waiter that gave up; False if it was granted a slot in the meantime"""
+        if waiter.future.done():
+            return False
+        waiter.future.cancel()
+        self._remove(waiter)
+        return True
+
+    async def _dispatch_loop(self):
+        while self._queue:
+            self._wakeup.clear()
+            await self._dispatch()
+            if not self._queue:
+                break
+            if self.backend.notifies_release:
+                await self._wakeup.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _dispatch(self):
+        """Grant free slots in finish-tag order, skipping projects at their own limit"""
+        blocked = set()
+        for waiter in sorted(self._queue, key=lambda w: (w.finish_tag, w.sequence)):
+            if waiter.project_id in blocked or waiter.future.done():
+                continue
+
+            lease_id, reason = await self.backend.try_acquire(
+                waiter.project_id, self.max_concurrency, self.project_max_concurrency
+            )
+            if reason == GLOBAL_FULL:
+                break
+            if reason == PROJECT_FULL:
+                blocked.add(waiter.project_id)
+                continue
+
+            if waiter.future.done():
+                # Timed out or cancelled while the slot was being taken
+                await self.backend.release(waiter.project_id, lease_id)
+                continue
+            self._remove(waiter)
+            self._virtual_time = max(self._virtual_time, waiter.finish_tag - 1 / self.weight(waiter.project_id))
+            waiter.future.set_result(lease_id)
+
+    def _retry_after(self) -> int:
+        """Seconds a rejected client should wait: about one typical slot hold"""
+        if not self._hold_times_ms:
+            return 1
+        return max(1, math.ceil(_percentile(self._hold_times_ms, 50) / 1000))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "queue_depth": len(self._queue),
+            "queued_by_project": dict(self._queued_per_project),
+            "active_by_project": dict(self._active),
+            "queue_time_ms": {
+                "p50": round(_percentile(self._queue_times_ms, 50), 1),
+                "p95": round(_percentile(self._queue_times_ms, 95), 1),
+                "p99": round(_percentile(self._queue_times_ms, 99), 1),
+                "max": round(max(self._queue_times_ms, default=0.0), 1)
+            },
+            "redis_errors": getattr(self.backend, "redis_errors", 0)
+        }
+
+
+def _percentile(samples, percentile: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(percentile / 100 * len(ordered)) - 1))
+    return ordered[index]
@@ -1,68 +1,170 @@
-from litellm import completion
+import logging
 import os
 import json
-from typing import List, Dict, Any, AsyncGenerator, Optional
+from functools import lru_cache
+from typing import List, Dict, Any, AsyncGenerator, Optional, Callable, Awaitable
 from services.persona_builder import PersonaBuilder
 from services.tools_service import ToolsService
+from services.llm_scheduler import LLMScheduler, AdmissionRejected
+from services.model_router import ModelRouter, fallback_models
+from utils.single_flight import SingleFlight, SingleFlightStream, flight_key
+from utils.metrics import record_tokens, record_usage
+from utils.tracing import tracer
+from litellm import token_counter
+
+logger = logging.getLogger(__name__)
 
 # Configure LiteLLM
 os.environ["GEMINI_API_KEY"] = os.getenv("GOOGLE_API_KEY", "")
 MODEL_NAME = os.getenv("LITELLM_MODEL", "gemini/gemini-2.5-flash")
+# Mark the static system prompt with an explicit cache breakpoint (Anthropic, Gemini
+# explicit context caching). Gemini 2.5 models already cache stable prefixes implicitly.
+PROMPT_CACHE_CONTROL = os.getenv("LLM_PROMPT_CACHE_CONTROL", "false").lower() == "true"
+SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))
+# Share one completion between concurrent identical first-turn questions
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "true").lower() == "true"
+
+SUMMARY_PROMPT = """You maintain a running summary of a customer chat.
+Merge the existing summary with the new messages into one updated summary.
+Keep facts the user shared, their goals, open questions and any answers already given.
+Write plain prose, at most 150 words, and do not address the user."""
 
 class LLMService:
-    def __init__(self, tools_service: Optional[ToolsService] = None):
+    def __init__(self, tools_service: Optional[ToolsService] = None, scheduler: Optional[LLMScheduler] = None, router: Optional[ModelRouter] = None):
         self.tools_service = tools_service
+        # MODEL_NAME first, then LLM_FALLBACK_MODELS; hedges slow calls and fails over on errors
+        self.router = router or ModelRouter([MODEL_NAME] + fallback_models())
+        # Every model call takes a slot; a single-flight leader takes one for all its followers
+        self.scheduler = scheduler or LLMScheduler()
+        self.response_flight = SingleFlight()
+        self.stream_flight = SingleFlightStream()
 
-    def _construct_system_prompt(self, context_chunks: List[Dict[str, Any]], persona_config: Dict[str, str] = None) -> str:
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _static_system_prompt(tone: str, agent_type: str, response_length: str, custom_instructions: str) -> str:
         """
-        Construct the system prompt with retrieved context and persona settings.
+        The stable part of the system prompt: persona, rules and final instruction.
+        Memoized per persona config, and kept free of per-turn data so it forms a
+        cacheable prefix for providers that support prompt caching.
         """
-        if not persona_config:
-            persona_config = {}
-            
         base_prompt = PersonaBuilder.build_system_prompt(
-            tone=persona_config.get("tone", "friendly"),
-            agent_type=persona_config.get("agentType", "general"),
-            response_length=persona_config.get("responseLength", "medium"),
-            custom_instructions=persona_config.get("customInstructions", "")
+            tone=tone,
+            agent_type=agent_type,
+            response_length=response_length,
+            custom_instructions=custom_instructions
         )
         
-        print(f"🤖 Generated System Prompt:\n{base_prompt}")
-        
-        context_text = "\n\n".join([f"- {chunk['content']}" for chunk in context_chunks])
-        
         # Get response length instruction for final reminder
         length_reminder = PersonaBuilder.RESPONSE_LENGTH_INSTRUCTIONS.get(
-            persona_config.get("responseLength", "medium"),
+            response_length,
             PersonaBuilder.RESPONSE_LENGTH_INSTRUCTIONS["medium"]
         )
         
-        return f"{base_prompt}\n### Training Data Context:\n{context_text}\n\n=== CRITICAL FINAL INSTRUCTION ===\n{length_reminder}\n\nREMINDER: You MUST stay in character as defined by your Role and Tone above."
+        return f"{base_prompt}\nAnswer using the Training Data Context provided with the user's latest message.\n\n=== CRITICAL FINAL INSTRUCTION ===\n{length_reminder}\n\nREMINDER: You MUST stay in character as defined by your Role and Tone above."
 
-    async def generate_response(self, query: str, context_chunks: List[Dict[str, Any]], history: List[Dict[str, str]] = [], persona_config: Dict[str, str] = None, project_id: str = None) -> str:
+    def _construct_system_prompt(self, persona_config: Dict[str, str] = None) -> str:
         """
-        Generate a response using LiteLLM (Gemini) with support for Tool Usage.
+        Construct the static system prompt from persona settings.
+        """
+        if not persona_config:
+            persona_config = {}
+            
+        return self._static_system_prompt(
+            persona_config.get("tone", "friendly"),
+            persona_config.get("agentType", "general"),
+            persona_config.get("responseLength", "medium"),
+            persona_config.get("customInstructions", "") or ""
+        )
+
+    def _build_messages(self, query: str, context_chunks: List[Dict[str, Any]], history: List[Dict[str, str]], persona_config: Dict[str, str] = None, conversation_summary: Optional[str] = None) -> List[Dict[str, Any]]:
         """
-        system_prompt = self._construct_system_prompt(context_chunks, persona_config)
+        Lay out messages from most to least stable:
+        static system prompt -> rolling summary -> history -> retrieved context + query.
+        Everything before the last message is a prefix shared with earlier turns.
+        """
+        system_prompt = self._construct_system_prompt(persona_config)
+        
+        if PROMPT_CACHE_CONTROL:
+            # Explicit cache breakpoint for providers that need one (litellm maps it per provider)
+            messages = [{
+                "role": "system",
+                "content": [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+            }]
+        else:
+            messages = [{"role": "system", "content": system_prompt}]
+        
+        if conversation_summary:
+            messages.append({"role": "system", "content": f"### Earlier Conversation Summary:\n{conversation_summary}"})
+        
+        messages.extend(history)
+        
+        if context_chunks:
+            context_text = "\n\n".join([f"- {chunk['content']}" for chunk in context_chunks])
+            messages.append({"role": "user", "content": f"### Training Data Context:\n{context_text}\n\n### User Message:\n{query}"})
+        else:
+            messages.append({"role": "user", "content": query})
         
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(history[-10:])
-        messages.append({"role": "user", "content": query})
+        return messages
 
-        # Get tools if available
-        tools = []
+    async def _load_tools(self, project_id: Optional[str], tools: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        if tools is not None:
+            return tools
         if self.tools_service and project_id:
-            tools = self.tools_service.get_tools_for_llm(project_id)
+            return await self.tools_service.get_tools_for_llm(project_id)
+        return []
+
+    def _flight_key(self, query: str, history: List[Dict[str, str]], persona_config: Optional[Dict[str, str]], project_id: Optional[str], conversation_summary: Optional[str], tools: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Only stateless turns are shared: with history or a summary the answer
+        depends on the visitor's conversation and must not be reused. Nor with
+        tools: a tool call may act for this visitor or read their data, so each
+        request runs its own.
+        """
+        if not LLM_SINGLE_FLIGHT or history or conversation_summary or tools:
+            return None
+        return flight_key(project_id, query, persona_config or {})
+
+    async def generate_response(self, query: str, context_chunks: List[Dict[str, Any]], history: List[Dict[str, str]] = [], persona_config: Dict[str, str] = None, project_id: str = None, conversation_summary: Optional[str] = None, tools: Optional[List[Dict[str, Any]]] = None, on_tool_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> str:
+        """
+        Generate a response, joining an identical in-flight request when there is
+        one (only for requests without tools, see _flight_key).
+        Raises AdmissionRejected when the project is over its LLM capacity.
+        """
+        # Loaded up front: whether the request may be shared depends on them
+        tools = await self._load_tools(project_id, tools)
+
+        async def run() -> str:
+            with tracer.start_as_current_span("llm.generate") as span:
+                span.set_attribute("llm.model", self.router.primary_model)
+                async with self.scheduler.slot(project_id):
+                    return await self._generate_response(query, context_chunks, history, persona_config, project_id, conversation_summary, tools, on_tool_event)
+        
+        key = self._flight_key(query, history, persona_config, project_id, conversation_summary, tools)
+        if key is None:
+            return await run()
+        return await self.response_flight.do(key, run)
+
+    async def _generate_response(self, query: str, context_chunks: List[Dict[str, Any]], history: List[Dict[str, str]] = [], persona_config: Dict[str, str] = None, project_id: str = None, conversation_summary: Optional[str] = None, tools: Optional[List[Dict[str, Any]]] = None, on_tool_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> str:
+        """
+        Generate a response using LiteLLM (Gemini) with support for Tool Usage.
+        History is expected to be already budgeted by HistoryManager.
+        Pass `tools` when they were already loaded (e.g. by ChatContextLoader).
+        `on_tool_event` is awaited with {"name", "status"} as each tool starts and finishes.
+        """
+        messages = self._build_messages(query, context_chunks, history, persona_config, conversation_summary)
+
+        # Get tools if available
+        tools = await self._load_tools(project_id, tools)
 
         try:
-            # First LLM Call
-            response = completion(
-                model=MODEL_NAME,
+            # First LLM Call (async so concurrent turns and workflow branches don't block the loop)
+            response = await self.router.complete(
                 messages=messages,
                 temperature=0.7,
                 tools=tools if tools else None,
                 tool_choice="auto" if tools else None
             )
+            record_usage(project_id, response)
             
             response_msg = response.choices[0].message
             
@@ -71,11 +173,13 @@ class LLMService:
                 # Add assistant's tool call message to history
                 messages.append(response_msg)
                 
-                print(f"🛠️ LLM Requested Tools: {len(response_msg.tool_calls)}")
+                logger.debug("LLM requested %d tool calls", len(response_msg.tool_calls), extra={"project_id": project_id})
                 
                 # Execute each tool
                 for tool_call in response_msg.tool_calls:
                     function_name = tool_call.function.name
+                    if on_tool_event:
+                        await on_tool_event({"name": function_name, "status": "started"})
                     try:
                         function_args = json.loads(tool_call.function.arguments)
                         
@@ -83,6 +187,8 @@ class LLMService:
                         tool_result = await self.tools_service.execute_tool_call(
                             project_id, function_name, function_args
                         )
+                        if on_tool_event:
+                            await on_tool_event({"name": function_name, "status": "finished"})
                         
                         # Append result message
                         messages.append({
@@ -93,7 +199,9 @@ class LLMService:
                         })
                         
                     except Exception as e:
-                        print(f"Error executing tool {function_name}: {e}")
+                        logger.warning("Error executing tool: %s", e, extra={"tool": function_name, "project_id": project_id})
+                        if on_tool_event:
+                            await on_tool_event({"name": function_name, "status": "failed"})
                         messages.append({
                             "tool_call_id": tool_call.id,
                             "role": "tool",
@@ -102,20 +210,52 @@ class LLMService:
                         })
 
                 # Second LLM Call (with tool results)
-                second_response = completion(
-                    model=MODEL_NAME,
+                second_response = await self.router.complete(
                     messages=messages,
                     temperature=0.7
                 )
+                record_usage(project_id, second_response)
                 return second_response.choices[0].message.content
 
             return response_msg.content
             
-        except Exception as e:
-            print(f"Error generating response: {e}")
+        except Exception:
+            logger.exception("Error generating response", extra={"project_id": project_id})
             return "I apologize, but I'm having trouble processing your request right now."
 
-    async def generate_stream_response(self, query: str, context_chunks: List[Dict[str, Any]], history: List[Dict[str, str]] = [], persona_config: Dict[str, str] = None, project_id: str = None) -> AsyncGenerator[str, None]:
+    async def generate_stream_response(self, query: str, context_chunks: List[Dict[str, Any]], history: List[Dict[str, str]] = [], persona_config: Dict[str, str] = None, project_id: str = None, conversation_summary: Optional[str] = None, tools: Optional[List[Dict[str, Any]]] = None, on_tool_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> AsyncGenerator[str, None]:
+        """
+        Stream a response; identical concurrent requests without tools subscribe
+        to one upstream stream instead of each opening their own.
+        Raises AdmissionRejected when the project is over its LLM capacity.
+        """
+        tools = await self._load_tools(project_id, tools)
+
+        async def stream() -> AsyncGenerator[str, None]:
+            # Not made the current span: a generator's context does not survive its yields
+            span = tracer.start_span("llm.stream")
+            span.set_attribute("llm.model", self.router.primary_model)
+            first = True
+            try:
+                # The slot is held until the last token has been read
+                async with self.scheduler.slot(project_id):
+                    async for chunk in self._generate_stream_response(query, context_chunks, history, persona_config, project_id, conversation_summary, tools, on_tool_event):
+                        if first:
+                            span.add_event("first_token")
+                            first = False
+                        yield chunk
+            finally:
+                span.end()
+        
+        key = self._flight_key(query, history, persona_config, project_id, conversation_summary, tools)
+        if key is None:
+            async for chunk in stream():
+                yield chunk
+            return
+        async for chunk in self.stream_flight.subscribe(key, stream):
+            yield chunk
+
+    async def _generate_stream_response(self, query: str, context_chunks: List[Dict[str, Any]], history: List[Dict[str, str]] = [], persona_config: Dict[str, str] = None, project_id: str = None, conversation_summary: Optional[str] = None, tools: Optional[List[Dict[str, Any]]] = None, on_tool_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> AsyncGenerator[str, None]:
         """
         Generate a streaming response using LiteLLM.
         Note: Simple streaming implementation for now. Tool usage in streaming requires complex frontend handling.
@@ -123,28 +263,73 @@ class LLMService:
         """
         # For MVP: If tools are enabled, we do non-streaming logic first, then stream the final answer
         # This avoids complex client-side protocol changes
-        if self.tools_service and project_id and self.tools_service.get_actions(project_id):
+        tools = await self._load_tools(project_id, tools)
+        if tools:
              # Use generate_response logic to handle tools synchronously
-             full_response = await self.generate_response(query, context_chunks, history, persona_config, project_id)
+             full_response = await self._generate_response(query, context_chunks, history, persona_config, project_id, conversation_summary, tools, on_tool_event)
              yield full_response
              return
 
         # Original Streaming Logic (No Tools)
-        system_prompt = self._construct_system_prompt(context_chunks, persona_config)
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(history[-10:])
-        messages.append({"role": "user", "content": query})
+        messages = self._build_messages(query, context_chunks, history, persona_config, conversation_summary)
 
+        parts = []
+        usage = None
         try:
-            response = completion(
-                model=MODEL_NAME,
+            # Hedged on time to first chunk, then committed to one provider
+            async for chunk in self.router.stream(
                 messages=messages,
-                temperature=0.7,
-                stream=True
-            )
-            for chunk in response:
-                if chunk.choices[0].delta.content:
+                temperature=0.7
+            ):
+                usage = getattr(chunk, "usage", None) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
                     yield chunk.choices[0].delta.content
-        except Exception as e:
-            print(f"Error generating stream: {e}")
+            self._record_stream_usage(project_id, messages, "".join(parts), usage)
+        except Exception:
+            logger.exception("Error generating stream", extra={"project_id": project_id})
             yield "I apologize, but I'm having trouble processing your request right now."
+
+    def _record_stream_usage(self, project_id: Optional[str], messages: List[Dict[str, Any]], output: str, usage: Any):
+        """Token usage for a stream: provider-reported when a chunk carried it, else counted locally"""
+        if usage:
+            record_tokens(project_id, getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+            return
+        try:
+            record_tokens(
+                project_id,
+                token_counter(model=self.router.primary_model, messages=messages),
+                token_counter(model=self.router.primary_model, text=output)
+            )
+        except Exception as e:
+            # litellm has no tokenizer for some models; the stream itself already succeeded
+            logger.debug("Stream token usage not recorded: %s", e, extra={"project_id": project_id, "model": self.router.primary_model})
+
+    async def summarize_conversation(self, messages: List[Dict[str, str]], previous_summary: Optional[str] = None, project_id: Optional[str] = None) -> Optional[str]:
+        """
+        Fold older messages into the rolling conversation summary.
+        Returns None on failure (or when the project is at capacity) so the caller
+        keeps the messages for a later attempt.
+        """
+        transcript = "\n".join(f"{m.get('role', 'user')}: {m.get('content', '')}" for m in messages)
+        prompt = f"Existing summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+
+        try:
+            async with self.scheduler.slot(project_id):
+                # Background work: fail over on errors, but never pay for a hedge
+                response = await self.router.complete(
+                    hedge=False,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.2,
+                    max_tokens=SUMMARY_MAX_TOKENS
+                )
+            record_usage(project_id, response)
+            return response.choices[0].message.content
+        except AdmissionRejected:
+            return None
+        except Exception as e:
+            logger.warning("Error summarizing conversation: %s", e, extra={"project_id": project_id})
+            return None
@@ -0,0 +1,310 @@
+"""
+Model routing for LLM completions
+An ordered list of litellm models: a hedged second request when the first is
+slower than usual, failover on errors, and temporary ejection of providers that
+keep failing. The completion function is injectable so stub providers can stand
+in for real ones.
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Awaitable, AsyncGenerator, Tuple
+from collections import deque
+import asyncio
+import logging
+import math
+import os
+import time
+from litellm import acompletion
+from utils.metrics import LLM_ATTEMPT_SECONDS, LLM_HEDGES, LLM_FAILOVERS
+from utils.tracing import tracer
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+logger = logging.getLogger(__name__)
+
+# Models tried after LITELLM_MODEL, in order, e.g. "openai/gpt-4o-mini,anthropic/claude-3-5-haiku-latest"
+LLM_FALLBACK_MODELS = os.getenv("LLM_FALLBACK_MODELS", "")
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+# The hedge fires once the first attempt is slower than this percentile of its recent latencies
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_DELAY_MS = int(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "300"))
+LLM_HEDGE_MAX_DELAY_MS = int(os.getenv("LLM_HEDGE_MAX_DELAY_MS", "5000"))
+# Used until a provider has enough samples for a percentile
+LLM_HEDGE_DEFAULT_DELAY_MS = int(os.getenv("LLM_HEDGE_DEFAULT_DELAY_MS", "2000"))
+LLM_ATTEMPT_TIMEOUT_MS = int(os.getenv("LLM_ATTEMPT_TIMEOUT_MS", "30000"))
+LLM_EJECT_AFTER_FAILURES = int(os.getenv("LLM_EJECT_AFTER_FAILURES", "3"))
+LLM_EJECT_SECONDS = float(os.getenv("LLM_EJECT_SECONDS", "30"))
+
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+CompletionFn = Callable[..., Awaitable[Any]]
+
+
+class ProviderHealth:
+    """
+    Recent latencies (full response and time to first chunk) and consecutive failures.
+    A provider is ejected for `eject_seconds` after `eject_after` failures in a row;
+    once back, a single further failure ejects it again until a call succeeds.
+    """
+
+    def __init__(self, eject_after: int = LLM_EJECT_AFTER_FAILURES, eject_seconds: float = LLM_EJECT_SECONDS):
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.latencies_ms: Dict[str, deque] = {
+            "complete": deque(maxlen=LATENCY_WINDOW),
+            "stream": deque(maxlen=LATENCY_WINDOW)
+        }
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.stats = {"attempts": 0, "successes": 0, "failures": 0, "wins": 0, "ejections": 0}
+
+    @property
+    def ejected(self) -> bool:
+        return time.monotonic() < self.ejected_until
+
+    def record_success(self, kind: str, elapsed_ms: float):
+        self.consecutive_failures = 0
+        self.stats["successes"] += 1
+        self.latencies_ms[kind].append(elapsed_ms)
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.stats["failures"] += 1
+        if self.consecutive_failures >= self.eject_after and not self.ejected:
+            self.ejected_until = time.monotonic() + self.eject_seconds
+            self.stats["ejections"] += 1
+
+    def percentile(self, kind: str, percentile: float) -> Optional[float]:
+        samples = self.latencies_ms[kind]
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(percentile / 100 * len(ordered)) - 1))]
+
+
+class ModelRouter:
+    """
+    `complete` races at most two attempts: the first healthy provider, then, if it
+    has not answered within its hedge delay, the next one. The first success wins
+    and the other attempt is cancelled. An attempt that fails starts the next
+    provider straight away. With a single provider the hedge and the failover go
+    to that same model.
+
+    `stream` hedges on time to the first chunk; once a stream has produced a
+    chunk it is committed to, since tokens already sent cannot be taken back.
+    """
+
+    def __init__(
+        self,
+        models: List[str],
+        completion: CompletionFn = acompletion,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+        attempt_timeout_ms: int = LLM_ATTEMPT_TIMEOUT_MS,
+        eject_after: int = LLM_EJECT_AFTER_FAILURES,
+        eject_seconds: float = LLM_EJECT_SECONDS
+    ):
+        if not models:
+            raise ValueError("ModelRouter needs at least one model")
+        self.models = models
+        self.completion = completion
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.attempt_timeout = attempt_timeout_ms / 1000
+        self.health = {model: ProviderHealth(eject_after, eject_seconds) for model in models}
+        self._stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0, "exhausted": 0}
+
+    @property
+    def primary_model(self) -> str:
+        return self.models[0]
+
+    def _candidates(self) -> List[str]:
+        """Healthy models in configured order; if every one is ejected, the soonest to recover first"""
+        healthy = [model for model in self.models if not self.health[model].ejected]
+        if not healthy:
+            healthy = sorted(self.models, key=lambda model: self.health[model].ejected_until)
+        if len(healthy) == 1:
+            healthy = healthy * 2
+        return healthy
+
+    def hedge_delay(self, model: str, kind: str) -> float:
+        """Seconds to wait on `model` before hedging"""
+        observed = self.health[model].percentile(kind, self.hedge_percentile)
+        delay_ms = LLM_HEDGE_DEFAULT_DELAY_MS if observed is None else observed
+        return min(max(delay_ms, LLM_HEDGE_MIN_DELAY_MS), LLM_HEDGE_MAX_DELAY_MS) / 1000
+
+    async def complete(self, hedge: bool = True, **kwargs) -> Any:
+        """acompletion(**kwargs) against the routed model (without `model`)"""
+        async def attempt(model: str):
+            return await self.completion(model=model, **kwargs)
+
+        response, _ = await self._race(attempt, "complete", hedge)
+        return response
+
+    async def stream(self, hedge: bool = True, **kwargs) -> AsyncGenerator[Any, None]:
+        """acompletion(stream=True, **kwargs), yielding raw chunks from the winning model"""
+        async def attempt(model: str):
+            response = await self.completion(model=model, stream=True, **kwargs)
+            iterator = response.__aiter__()
+            try:
+                first = await iterator.__anext__()
+            except StopAsyncIteration:
+                first = None
+            return response, iterator, first
+
+        (response, iterator, first), model = await self._race(attempt, "stream", hedge, discard=_close_stream)
+        try:
+            if first is None:
+                return
+            yield first
+            async for chunk in iterator:
+                yield chunk
+        except Exception:
+            self.health[model].record_failure()
+            raise
+        finally:
+            await _close_stream((response, iterator, first))
+
+    async def _race(
+        self,
+        start: Callable[[str], Awaitable[Any]],
+        kind: str,
+        hedge: bool,
+        discard: Optional[Callable[[Any], Awaitable[None]]] = None
+    ) -> Tuple[Any, str]:
+        self._stats["requests"] += 1
+        candidates = self._candidates()
+        loop = asyncio.get_running_loop()
+        hedge_at = loop.time() + self.hedge_delay(candidates[0], kind)
+        hedge = hedge and self.hedge
+
+        pending: Dict[asyncio.Task, str] = {}
+        hedge_tasks = set()
+        next_index = 0
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def launch(reason: str = "first") -> asyncio.Task:
+            nonlocal next_index
+            model = candidates[next_index]
+            next_index += 1
+            task = asyncio.create_task(self._attempt(model, start, kind, reason))
+            pending[task] = model
+            return task
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if hedge and not hedged and len(pending) == 1 and next_index < len(candidates):
+                    timeout = max(0.0, hedge_at - loop.time())
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self._stats["hedges"] += 1
+                    LLM_HEDGES.labels(candidates[next_index]).inc()
+                    hedge_tasks.add(launch("hedge"))
+                    continue
+
+                winner = None
+                for task in done:
+                    model = pending.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                    elif winner is None:
+                        winner = (task, model)
+                    elif discard:
+                        await discard(task.result())
+
+                if winner:
+                    task, model = winner
+                    self.health[model].stats["wins"] += 1
+                    if task in hedge_tasks:
+                        self._stats["hedge_wins"] += 1
+                    return task.result(), model
+
+                if next_index < len(candidates):
+                    self._stats["failovers"] += 1
+                    LLM_FAILOVERS.labels(candidates[next_index]).inc()
+                    hedge_at = loop.time() + self.hedge_delay(candidates[next_index], kind)
+                    launch("failover")
+
+            self._stats["exhausted"] += 1
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_consume_result)
+            if discard and pending:
+                # A loser may finish before it sees the cancellation; release what it opened
+                for outcome in await asyncio.gather(*pending, return_exceptions=True):
+                    if not isinstance(outcome, BaseException):
+                        await discard(outcome)
+
+    async def _attempt(self, model: str, start: Callable[[str], Awaitable[Any]], kind: str, reason: str = "first") -> Any:
+        health = self.health[model]
+        health.stats["attempts"] += 1
+        started = time.perf_counter()
+        with tracer.start_as_current_span("llm.attempt", kind=SpanKind.CLIENT, record_exception=False) as span:
+            span.set_attributes({"llm.model": model, "llm.kind": kind, "llm.reason": reason})
+            try:
+                result = await asyncio.wait_for(start(model), self.attempt_timeout)
+            except asyncio.CancelledError:
+                # Lost the race; says nothing about the provider
+                span.set_attribute("llm.outcome", "cancelled")
+                LLM_ATTEMPT_SECONDS.labels(model, kind, "cancelled").observe(time.perf_counter() - started)
+                raise
+            except Exception as e:
+                health.record_failure()
+                span.set_attribute("llm.outcome", "error")
+                span.set_status(Status(StatusCode.ERROR, f"{type(e).__name__}: {e}"))
+                LLM_ATTEMPT_SECONDS.labels(model, kind, "error").observe(time.perf_counter() - started)
+                logger.warning("LLM attempt failed: %s: %s", type(e).__name__, e, extra={"model": model, "kind": kind})
+                raise
+            span.set_attribute("llm.outcome", "ok")
+        elapsed = time.perf_counter() - started
+        health.record_success(kind, elapsed * 1000)
+        LLM_ATTEMPT_SECONDS.labels(model, kind, "ok").observe(elapsed)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        providers = {}
+        for model in self.models:
+            health = self.health[model]
+            providers[model] = {
+                **health.stats,
+                "state": "ejected" if health.ejected else "healthy",
+                "consecutive_failures": health.consecutive_failures,
+                "hedge_delay_ms": round(self.hedge_delay(model, "complete") * 1000, 1),
+                "p50_ms": _round(health.percentile("complete", 50)),
+                "p95_ms": _round(health.percentile("complete", 95)),
+                "first_chunk_p95_ms": _round(health.percentile("stream", 95))
+            }
+        return {**self._stats, "providers": providers}
+
+
+async def _close_stream(opened: Tuple[Any, Any, Any]):
+    response, iterator, _ = opened
+    for target in (iterator, response):
+        close = getattr(target, "aclose", None)
+        if close is None:
+            continue
+        try:
+            await close()
+        except Exception:
+            pass
+        return
+
+
+def _consume_result(task: asyncio.Task):
+    """Retrieve a cancelled loser's outcome so late errors are not reported as unhandled"""
+    if not task.cancelled():
+        task.exception()
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 1)
+
+
+def fallback_models() -> List[str]:
+    return [model.strip() for model in LLM_FALLBACK_MODELS.split(",") if model.strip()]
@@ -48,6 +48,7 @@ Do NOT give brief answers - expand on your explanations."""
     ) -> str:
         """
         Builds the complete system prompt based on persona settings.
+        Not cached here: LLMService._static_system_prompt memoizes the full static prompt.
         """
         
         # Get base templates (fallback to defaults if invalid key)
@@ -0,0 +1,78 @@
+"""
+Per-action SQL statistics
+Recent latencies, errors and where each database action was served from
+(replica or primary), kept per worker for GET /projects/{project_id}/actions/stats.
+Prometheus gets the same timings without the action label (db_query_seconds).
+"""
+
+from typing import Any, Dict, Optional, Tuple
+from collections import deque
+import math
+import threading
+from utils.metrics import DB_QUERY_SECONDS
+
+ACTION_STATS_WINDOW = 200
+
+
+def _percentile(ordered, percentile: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(percentile / 100 * len(ordered)) - 1))]
+
+
+class _ActionStats:
+    __slots__ = ("latencies_ms", "calls", "errors", "replica", "primary")
+
+    def __init__(self):
+        self.latencies_ms: deque = deque(maxlen=ACTION_STATS_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.replica = 0
+        self.primary = 0
+
+
+class ActionQueryStats:
+    """Thread-safe; queries are timed in the worker threads that run them"""
+
+    def __init__(self):
+        self._actions: Dict[Tuple[str, str], _ActionStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, project_id: str, action_id: Optional[str], elapsed_seconds: float, target: str, ok: bool):
+        """`target` is "primary" or "replica"; failed attempts on a replica are recorded too"""
+        DB_QUERY_SECONDS.labels(target, "ok" if ok else "error").observe(elapsed_seconds)
+        if action_id is None:
+            return
+        with self._lock:
+            stats = self._actions.setdefault((project_id, action_id), _ActionStats())
+            stats.calls += 1
+            if ok:
+                stats.latencies_ms.append(elapsed_seconds * 1000)
+                if target == "replica":
+                    stats.replica += 1
+                else:
+                    stats.primary += 1
+            else:
+                stats.errors += 1
+
+    def get_stats(self, project_id: str) -> Dict[str, Any]:
+        with self._lock:
+            actions = {
+                action_id: (stats.calls, stats.errors, stats.replica, stats.primary, sorted(stats.latencies_ms))
+                for (project, action_id), stats in self._actions.items()
+                if project == project_id
+            }
+        return {
+            action_id: {
+                "calls": calls,
+                "errors": errors,
+                "served_by": {"replica": replica, "primary": primary},
+                "latency_ms": {
+                    "p50": round(_percentile(ordered, 50), 1),
+                    "p95": round(_percentile(ordered, 95), 1),
+                    "p99": round(_percentile(ordered, 99), 1),
+                    "max": round(ordered[-1], 1) if ordered else 0.0
+                }
+            }
+            for action_id, (calls, errors, replica, primary, ordered) in actions.items()
+        }
@@ -0,0 +1,250 @@
+"""
+Project registries (database connections, agent actions) shared by every worker
+Records are stored in MongoDB. Each process keeps a read-through cache per
+project, so lookups on the chat path are dictionary reads. A write publishes
+the project id on a Redis channel and every other process drops its copy;
+cached entries also expire after REGISTRY_CACHE_TTL_SECONDS, because pub/sub
+delivery is at most once.
+"""
+
+from typing import Any, Dict, Generic, List, Optional, Tuple, Type, TypeVar
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from pydantic import BaseModel
+from utils.single_flight import SingleFlight
+from utils.redis_client import RedisClient
+from utils.mongo_client import get_mongo_db
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_BACKEND = os.getenv("REGISTRY_BACKEND", "mongo")  # mongo, or memory for a single process
+REGISTRY_CACHE_TTL_SECONDS = float(os.getenv("REGISTRY_CACHE_TTL_SECONDS", "300"))
+REGISTRY_CHANNEL = os.getenv("REGISTRY_CHANNEL", "registry:invalidate")
+# Backoff before resubscribing after the invalidation listener loses Redis
+REGISTRY_RESUBSCRIBE_SECONDS = float(os.getenv("REGISTRY_RESUBSCRIBE_SECONDS", "1"))
+
+M = TypeVar("M", bound=BaseModel)
+
+
+class MemoryRegistryBackend:
+    """Records in this process only; the stand-in for MongoDB in single-worker setups"""
+
+    def __init__(self):
+        self._records: Dict[str, Dict[str, Dict[str, Any]]] = {}  # project id -> record id -> document
+
+    async def load(self, project_id: str) -> List[Dict[str, Any]]:
+        return [dict(document, id=record_id) for record_id, document in self._records.get(project_id, {}).items()]
+
+    async def save(self, project_id: str, record_id: str, document: Dict[str, Any]):
+        self._records.setdefault(project_id, {})[record_id] = document
+
+
+class MongoRegistryBackend:
+    """One collection per registry, keyed by record id; pymongo calls run in a worker thread"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._indexed = False
+
+    def _ensure_index(self):
+        if not self._indexed:
+            self.collection.create_index("project_id")
+            self._indexed = True
+
+    def _load(self, project_id: str) -> List[Dict[str, Any]]:
+        self._ensure_index()
+        documents = []
+        for document in self.collection.find({"project_id": project_id}):
+            document["id"] = document.pop("_id")
+            documents.append(document)
+        return documents
+
+    def _save(self, record_id: str, document: Dict[str, Any]):
+        self._ensure_index()
+        self.collection.replace_one({"_id": record_id}, document, upsert=True)
+
+    async def load(self, project_id: str) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._load, project_id)
+
+    async def save(self, project_id: str, record_id: str, document: Dict[str, Any]):
+        await asyncio.to_thread(self._save, record_id, document)
+
+
+class ProjectRegistry(Generic[M]):
+    """
+    Read-through cache of one kind of record, grouped by project.
+    Concurrent misses for a project share one load; a load that overlaps an
+    invalidation is returned to its callers but not cached.
+    """
+
+    def __init__(self, kind: str, model: Type[M], backend, invalidator: Optional["RegistryInvalidator"] = None,
+                 ttl_seconds: float = REGISTRY_CACHE_TTL_SECONDS):
+        self.kind = kind
+        self.model = model
+        self.backend = backend
+        self.invalidator = invalidator
+        self.ttl_seconds = ttl_seconds
+        # project id -> (loaded_at, record id -> record)
+        self._cache: Dict[str, Tuple[float, Dict[str, M]]] = {}
+        # Bumped on every invalidation, so a load that overlaps one is not cached
+        self._generation = 0
+        self._loads = SingleFlight()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "load_errors": 0, "stale_served": 0}
+        if invalidator:
+            invalidator.register(self)
+
+    async def get_all(self, project_id: str) -> Dict[str, M]:
+        """Records of a project by id; do not mutate the returned mapping"""
+        entry = self._cache.get(project_id)
+        if entry and time.monotonic() - entry[0] < self.ttl_seconds:
+            self._stats["hits"] += 1
+            return entry[1]
+
+        self._stats["misses"] += 1
+        try:
+            return await self._loads.do(f"{self.kind}:{project_id}", lambda: self._load(project_id))
+        except Exception as e:
+            self._stats["load_errors"] += 1
+            if entry:
+                # An expired copy beats failing the chat turn while the store is down
+                self._stats["stale_served"] += 1
+                logger.warning("Registry load failed, serving cached %s: %s", self.kind, e, extra={"project_id": project_id})
+                return entry[1]
+            raise
+
+    async def get(self, project_id: str, record_id: str) -> Optional[M]:
+        return (await self.get_all(project_id)).get(record_id)
+
+    async def put(self, project_id: str, record_id: str, record: M):
+        """Persist a record and tell the other workers to reload the project"""
+        document = record.model_dump(exclude={"id"})
+        await self.backend.save(project_id, record_id, document)
+
+        self.invalidate(project_id)
+        if self.invalidator:
+            await self.invalidator.publish(self.kind, project_id)
+
+    def invalidate(self, project_id: Optional[str] = None):
+        """Drop the cached records of one project, or of every project"""
+        self._stats["invalidations"] += 1
+        self._generation += 1
+        if project_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(project_id, None)
+
+    async def _load(self, project_id: str) -> Dict[str, M]:
+        generation = self._generation
+        documents = await self.backend.load(project_id)
+        records = {str(document["id"]): self.model.model_validate(document) for document in documents}
+        if self._generation == generation:
+            self._cache[project_id] = (time.monotonic(), records)
+        return records
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            "cached_projects": len(self._cache),
+            "backend": type(self.backend).__name__
+        }
+
+
+class RegistryInvalidator:
+    """
+    Publishes registry changes on REGISTRY_CHANNEL and applies the ones from
+    other processes. Whenever the subscription is (re)established every cache
+    is dropped, since changes made in the meantime were missed.
+    """
+
+    def __init__(self, redis_client: Optional[RedisClient]):
+        self.redis_client = redis_client
+        self.origin = uuid.uuid4().hex
+        self._registries: Dict[str, ProjectRegistry] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"published": 0, "received": 0, "publish_errors": 0, "resubscribes": 0}
+
+    def register(self, registry: ProjectRegistry):
+        self._registries[registry.kind] = registry
+
+    async def publish(self, kind: str, project_id: str):
+        if not self.redis_client:
+            return
+        message = json.dumps({"kind": kind, "project_id": project_id, "origin": self.origin})
+        try:
+            await self.redis_client.publish(REGISTRY_CHANNEL, message)
+            self._stats["published"] += 1
+        except Exception as e:
+            # Other workers pick the change up when their cached copy expires
+            self._stats["publish_errors"] += 1
+            logger.warning("Registry invalidation publish failed: %s", e, extra={"kind": kind, "project_id": project_id})
+
+    def start(self):
+        if self._task or not self._registries or not self.redis_client:
+            return
+        if not hasattr(self.redis_client, "pubsub"):
+            logger.warning("Redis client has no pub/sub; registry caches rely on REGISTRY_CACHE_TTL_SECONDS")
+            return
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _invalidate_all(self):
+        for registry in self._registries.values():
+            registry.invalidate()
+
+    def _apply(self, data: str):
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if message.get("origin") == self.origin:
+            return
+        registry = self._registries.get(message.get("kind"))
+        if registry and message.get("project_id"):
+            self._stats["received"] += 1
+            registry.invalidate(message["project_id"])
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(REGISTRY_CHANNEL)
+                self._invalidate_all()
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._apply(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["resubscribes"] += 1
+                logger.warning("Registry invalidation listener lost Redis: %s", e)
+                await asyncio.sleep(REGISTRY_RESUBSCRIBE_SECONDS)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "listening": bool(self._task and not self._task.done())}
+
+
+def create_registry(kind: str, model: Type[M], invalidator: Optional[RegistryInvalidator] = None) -> ProjectRegistry[M]:
+    """Registry on the configured backend; only MongoDB-backed ones are kept in sync across workers"""
+    if REGISTRY_BACKEND == "memory":
+        return ProjectRegistry(kind, model, MemoryRegistryBackend())
+
+    return ProjectRegistry(kind, model, MongoRegistryBackend(get_mongo_db()[kind]), invalidator)
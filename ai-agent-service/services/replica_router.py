@@ -0,0 +1,155 @@
+"""
+Read-replica routing for SQL tool actions
+Read-only actions go to the connection's replicas in turn, skipping any that
+lag the primary by more than the connection's limit or failed recently; when
+none is usable the primary serves the read. Replication lag is measured on the
+replica itself and cached for DB_REPLICA_LAG_CHECK_SECONDS.
+"""
+
+from typing import Any, Dict, List, Optional
+import itertools
+import logging
+import os
+import threading
+import time
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from models.db_connection import DatabaseConnection
+from services.engine_registry import EngineCapacityError, EngineRegistry
+
+logger = logging.getLogger(__name__)
+
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))  # Unless the connection sets its own
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.getenv("DB_REPLICA_LAG_CHECK_SECONDS", "10"))
+DB_REPLICA_RETRY_SECONDS = float(os.getenv("DB_REPLICA_RETRY_SECONDS", "30"))  # A failed replica is skipped this long
+
+# Seconds the replica is behind; 0 when it has replayed everything it received
+_POSTGRES_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+_MYSQL_LAG = text("SHOW REPLICA STATUS")
+_MYSQL_LAG_LEGACY = text("SHOW SLAVE STATUS")  # Before MySQL 8.0.22
+
+
+class _ReplicaState:
+    __slots__ = ("lag_seconds", "checked_at", "failed_until")
+
+    def __init__(self):
+        self.lag_seconds: Optional[float] = None
+        self.checked_at = 0.0
+        self.failed_until = 0.0
+
+
+def replica_connection(connection: DatabaseConnection, index: int) -> DatabaseConnection:
+    """The connection config pointed at one of its replicas (its own engine and pool)"""
+    replica = connection.replicas[index]
+    return connection.model_copy(update={
+        "id": f"{connection.id}:replica:{replica.host}:{replica.port}",
+        "host": replica.host,
+        "port": replica.port,
+        "replicas": []
+    })
+
+
+class ReplicaRouter:
+    """Thread-safe; called from the worker threads that run queries"""
+
+    def __init__(self, engines: EngineRegistry):
+        self.engines = engines
+        self._states: Dict[str, _ReplicaState] = {}
+        self._turns: Dict[str, itertools.count] = {}
+        self._lock = threading.Lock()
+        self._stats = {"replica_reads": 0, "primary_fallbacks": 0, "lagging_skips": 0, "failures": 0, "lag_checks": 0}
+
+    def read_targets(self, connection: DatabaseConnection) -> List[DatabaseConnection]:
+        """Usable replicas in round-robin order, then the primary"""
+        if not connection.replicas:
+            return [connection]
+
+        max_lag = connection.max_replica_lag_seconds or DB_REPLICA_MAX_LAG_SECONDS
+        with self._lock:
+            turn = next(self._turns.setdefault(connection.id or "", itertools.count()))
+        count = len(connection.replicas)
+
+        targets = []
+        for offset in range(count):
+            replica = replica_connection(connection, (turn + offset) % count)
+            if self._usable(replica, max_lag):
+                targets.append(replica)
+        return targets + [connection]
+
+    def _state(self, replica: DatabaseConnection) -> _ReplicaState:
+        with self._lock:
+            return self._states.setdefault(replica.id, _ReplicaState())
+
+    def _usable(self, replica: DatabaseConnection, max_lag: float) -> bool:
+        state = self._state(replica)
+        now = time.monotonic()
+        if now < state.failed_until:
+            return False
+        if now - state.checked_at >= DB_REPLICA_LAG_CHECK_SECONDS and not self._check_lag(replica, state):
+            return False
+        if state.lag_seconds is None or state.lag_seconds > max_lag:
+            self._stats["lagging_skips"] += 1
+            return False
+        return True
+
+    def _check_lag(self, replica: DatabaseConnection, state: _ReplicaState) -> bool:
+        self._stats["lag_checks"] += 1
+        state.checked_at = time.monotonic()
+        try:
+            with self.engines.connect(replica) as (_, connection):
+                state.lag_seconds = self._measure_lag(replica.type, connection)
+            return True
+        except EngineCapacityError:
+            # No room for the replica's engine on this worker; check again on the next read
+            state.checked_at = 0.0
+            return False
+        except Exception as e:
+            self.record_failure(replica)
+            logger.warning("Replica lag check failed: %s", e, extra={"connection_id": replica.id})
+            return False
+
+    @staticmethod
+    def _measure_lag(db_type: str, connection) -> Optional[float]:
+        if db_type == "postgres":
+            lag = connection.execute(_POSTGRES_LAG).scalar()
+            return float(lag or 0)
+
+        try:
+            row = connection.execute(_MYSQL_LAG).mappings().first()
+        except DBAPIError:
+            connection.rollback()
+            row = connection.execute(_MYSQL_LAG_LEGACY).mappings().first()
+        if row is None:
+            # Not replicating: the "replica" is a primary and cannot lag
+            return 0.0
+        lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        # NULL means replication is stopped
+        return float(lag) if lag is not None else None
+
+    def record_read(self, target: DatabaseConnection, primary: DatabaseConnection):
+        if target is primary:
+            if primary.replicas:
+                self._stats["primary_fallbacks"] += 1
+        else:
+            self._stats["replica_reads"] += 1
+
+    def record_failure(self, replica: DatabaseConnection):
+        """Skip a replica that failed a query or a lag check for DB_REPLICA_RETRY_SECONDS"""
+        self._stats["failures"] += 1
+        self._state(replica).failed_until = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            replicas = {
+                key: {
+                    "lag_seconds": state.lag_seconds,
+                    "checked_seconds_ago": round(now - state.checked_at, 1) if state.checked_at else None,
+                    "skipped_for_seconds": round(max(0.0, state.failed_until - now), 1)
+                }
+                for key, state in self._states.items()
+            }
+        return {**self._stats, "replicas": replicas}
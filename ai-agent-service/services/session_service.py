@@ -1,54 +1,191 @@
 import redis
 import json
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from datetime import timedelta
+from utils.redis_client import RedisClient, supports_transactions
+from utils.metrics import observe_redis
+
+# Hard cap on stored messages; older turns are normally folded into the
+# rolling summary by HistoryManager well before this is reached
+MAX_HISTORY_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "50"))
+# One compaction per session across workers; the lock expires if a worker dies holding it
+COMPACT_LOCK_SECONDS = int(os.getenv("HISTORY_COMPACT_LOCK_SECONDS", "120"))
+
+# Drop the folded messages (ARGV, oldest first) from the head of the history.
+# append_messages may have capped the list since they were read, removing some
+# of them already: the head is matched against every suffix of the folded
+# messages, longest first, and only what is still there is removed. Messages
+# that were never summarized are never trimmed.
+_FOLD_SCRIPT = """
+local n = #ARGV
+local head = redis.call('LRANGE', KEYS[1], 0, n - 1)
+for shift = 0, n - 1 do
+  local remaining = n - shift
+  if #head >= remaining then
+    local match = true
+    for i = 1, remaining do
+      if head[i] ~= ARGV[shift + i] then
+        match = false
+        break
+      end
+    end
+    if match then
+      redis.call('LTRIM', KEYS[1], remaining, -1)
+      return remaining
+    end
+  end
+end
+return 0
+"""
 
 class SessionService:
-    def __init__(self):
-        redis_host = os.getenv("REDIS_HOST", "redis")
-        redis_port = int(os.getenv("REDIS_PORT", "6379"))
-        self.redis_client = redis.Redis(
-            host=redis_host,
-            port=redis_port,
-            decode_responses=True
-        )
+    def __init__(self, redis_client: RedisClient):
+        self.redis_client = redis_client
+        # Redis Cluster cannot run MULTI/EXEC; pipelines there are plain batches
+        self.transactional = supports_transactions(redis_client)
         self.session_ttl = timedelta(hours=24)  # Sessions expire after 24 hours
-    
+        self.max_messages = MAX_HISTORY_MESSAGES
+        self._fold_script = redis_client.register_script(_FOLD_SCRIPT)
+
     def get_session_key(self, project_id: str, session_id: str) -> str:
         """Generate Redis key for session"""
         return f"chat_session:{project_id}:{session_id}"
-    
-    def get_conversation_history(self, project_id: str, session_id: str) -> List[Dict[str, str]]:
-        """Retrieve conversation history from Redis"""
+
+    def get_summary_key(self, project_id: str, session_id: str) -> str:
+        """Generate Redis key for the rolling conversation summary"""
+        return f"chat_summary:{project_id}:{session_id}"
+
+    def get_compact_lock_key(self, project_id: str, session_id: str) -> str:
+        return f"chat_compact:{project_id}:{session_id}"
+
+    @observe_redis("get_history")
+    async def get_conversation_history(self, project_id: str, session_id: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        """Retrieve conversation history from Redis, optionally only the last `limit` messages"""
+        key = self.get_session_key(project_id, session_id)
+        start = -limit if limit else 0
+
+        try:
+            items = await self.redis_client.lrange(key, start, -1)
+        except redis.exceptions.ResponseError:
+            # Session written before history became a list
+            items = (await self._migrate_legacy_history(key))[start:]
+
+        return [json.loads(item) for item in items]
+
+    @observe_redis("get_history_with_summary")
+    async def get_history_with_summary(self, project_id: str, session_id: str) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """Retrieve conversation history and its rolling summary in one round trip"""
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.lrange(self.get_session_key(project_id, session_id), 0, -1)
+                pipe.get(self.get_summary_key(project_id, session_id))
+                items, summary = await pipe.execute()
+        except redis.exceptions.ResponseError:
+            return (
+                await self.get_conversation_history(project_id, session_id),
+                await self.redis_client.get(self.get_summary_key(project_id, session_id))
+            )
+
+        return [json.loads(item) for item in items], summary
+
+    @observe_redis("compact_lock")
+    async def acquire_compact_lock(self, project_id: str, session_id: str) -> bool:
+        """True if no other worker is compacting this session"""
+        key = self.get_compact_lock_key(project_id, session_id)
+        return bool(await self.redis_client.set(key, "1", nx=True, ex=COMPACT_LOCK_SECONDS))
+
+    async def release_compact_lock(self, project_id: str, session_id: str):
+        await self.redis_client.delete(self.get_compact_lock_key(project_id, session_id))
+
+    @observe_redis("compact_history")
+    async def compact_history(self, project_id: str, session_id: str, summary: str, folded: List[Dict[str, str]]) -> int:
+        """
+        Store a new rolling summary and drop the `folded` messages it covers from
+        the head of the history, returning how many were dropped. The trim checks
+        the stored messages (see _FOLD_SCRIPT), so turns appended or capped while
+        the summary was being generated are handled.
+        """
+        async with self.redis_client.pipeline(transaction=self.transactional) as pipe:
+            pipe.setex(self.get_summary_key(project_id, session_id), self.session_ttl, summary)
+            await self._fold_script(
+                keys=[self.get_session_key(project_id, session_id)],
+                args=[json.dumps(message) for message in folded],
+                client=pipe
+            )
+            _, trimmed = await pipe.execute()
+        return int(trimmed)
+
+    @observe_redis("save_history")
+    async def save_conversation_history(self, project_id: str, session_id: str, history: List[Dict[str, str]]):
+        """Replace the whole conversation history in Redis"""
         key = self.get_session_key(project_id, session_id)
-        history_json = self.redis_client.get(key)
-        
-        if history_json:
-            return json.loads(history_json)
-        return []
-    
-    def save_conversation_history(self, project_id: str, session_id: str, history: List[Dict[str, str]]):
-        """Save conversation history to Redis"""
+        async with self.redis_client.pipeline(transaction=self.transactional) as pipe:
+            pipe.delete(key)
+            if history:
+                pipe.rpush(key, *[json.dumps(message) for message in history[-self.max_messages:]])
+                pipe.expire(key, self.session_ttl)
+            await pipe.execute()
+
+    @observe_redis("append_messages")
+    async def append_messages(self, project_id: str, session_id: str, messages: List[Dict[str, str]]):
+        """
+        Append messages to conversation history in a single MULTI/EXEC.
+        RPUSH + LTRIM + EXPIRE is constant cost per turn and safe for concurrent turns.
+        """
+        if not messages:
+            return
+
         key = self.get_session_key(project_id, session_id)
-        self.redis_client.setex(
-            key,
-            self.session_ttl,
-            json.dumps(history)
-        )
-    
-    def add_message_to_history(self, project_id: str, session_id: str, role: str, content: str):
+        summary_key = self.get_summary_key(project_id, session_id)
+        encoded = [json.dumps(message) for message in messages]
+
+        try:
+            await self._append_encoded(key, summary_key, encoded)
+        except redis.exceptions.ResponseError:
+            await self._migrate_legacy_history(key)
+            await self._append_encoded(key, summary_key, encoded)
+
+    async def _append_encoded(self, key: str, summary_key: str, encoded: List[str]):
+        async with self.redis_client.pipeline(transaction=self.transactional) as pipe:
+            pipe.rpush(key, *encoded)
+            # Keep only last N messages to avoid token limits
+            pipe.ltrim(key, -self.max_messages, -1)
+            pipe.expire(key, self.session_ttl)
+            # The summary lives as long as the history it belongs to
+            pipe.expire(summary_key, self.session_ttl)
+            await pipe.execute()
+
+    async def add_turn(self, project_id: str, session_id: str, user_message: str, assistant_message: str):
+        """Append a user message and the assistant reply in one operation"""
+        await self.append_messages(project_id, session_id, [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": assistant_message}
+        ])
+
+    async def add_message_to_history(self, project_id: str, session_id: str, role: str, content: str):
         """Add a single message to conversation history"""
-        history = self.get_conversation_history(project_id, session_id)
-        history.append({"role": role, "content": content})
-        
-        # Keep only last 20 messages to avoid token limits
-        if len(history) > 20:
-            history = history[-20:]
-        
-        self.save_conversation_history(project_id, session_id, history)
-    
-    def clear_session(self, project_id: str, session_id: str):
+        await self.append_messages(project_id, session_id, [{"role": role, "content": content}])
+
+    async def _migrate_legacy_history(self, key: str) -> List[str]:
+        """Convert a JSON-blob history into a Redis list, returning the encoded messages"""
+        history_json = await self.redis_client.get(key)
+        history = json.loads(history_json) if history_json else []
+        encoded = [json.dumps(message) for message in history[-self.max_messages:]]
+
+        async with self.redis_client.pipeline(transaction=self.transactional) as pipe:
+            pipe.delete(key)
+            if encoded:
+                pipe.rpush(key, *encoded)
+                pipe.expire(key, self.session_ttl)
+            await pipe.execute()
+
+        return encoded
+
+    @observe_redis("clear_session")
+    async def clear_session(self, project_id: str, session_id: str):
         """Clear conversation history for a session"""
-        key = self.get_session_key(project_id, session_id)
-        self.redis_client.delete(key)
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.delete(self.get_session_key(project_id, session_id))
+            pipe.delete(self.get_summary_key(project_id, session_id))
+            await pipe.execute()
@@ -0,0 +1,130 @@
+"""
+Result cache for read-only tool actions
+Two tiers: a per-process LRU with TTL and an optional shared Redis tier
+"""
+
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+TOOL_CACHE_MAX_SIZE = int(os.getenv("TOOL_CACHE_MAX_SIZE", "1024"))
+
+
+class ToolResultCache:
+    """
+    Caches tool results keyed by (project, action, normalized arguments).
+    The local tier is always used; the Redis tier is shared between workers
+    when a client is provided.
+    """
+
+    def __init__(self, max_size: int = TOOL_CACHE_MAX_SIZE, redis_client=None, key_prefix: str = "tool_cache"):
+        self.max_size = max_size
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        # key -> (expires_at, value), ordered from least to most recently used
+        self._local: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "local_hits": 0,
+            "redis_hits": 0,
+            "evictions": 0,
+            "redis_errors": 0,
+        }
+
+    @staticmethod
+    def _normalize(value: Any) -> Any:
+        """Normalize arguments so equivalent calls share a cache entry"""
+        if isinstance(value, dict):
+            return {str(k): ToolResultCache._normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [ToolResultCache._normalize(v) for v in value]
+        if isinstance(value, str):
+            return value.strip()
+        return value
+
+    def make_key(self, project_id: str, action_id: str, arguments: Dict[str, Any]) -> str:
+        """Build the cache key for an action invocation"""
+        normalized = json.dumps(self._normalize(arguments or {}), sort_keys=True, separators=(",", ":"), default=str)
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}:{project_id}:{action_id}:{digest}"
+
+    def _get_local(self, key: str) -> Optional[str]:
+        entry = self._local.get(key)
+        if not entry:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._local[key]
+            return None
+
+        self._local.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: str, ttl: float):
+        self._local[key] = (time.monotonic() + ttl, value)
+        self._local.move_to_end(key)
+
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look up a cached result, checking the local tier before Redis"""
+        value = self._get_local(key)
+        if value is not None:
+            self._stats["hits"] += 1
+            self._stats["local_hits"] += 1
+            return value
+
+        if self.redis_client:
+            try:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    pipe.get(key)
+                    pipe.pttl(key)
+                    value, pttl = await pipe.execute()
+
+                if value is not None and pttl and pttl > 0:
+                    # Keep the local copy no longer than the shared one
+                    self._set_local(key, value, pttl / 1000)
+                    self._stats["hits"] += 1
+                    self._stats["redis_hits"] += 1
+                    return value
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning("Tool cache Redis read failed: %s", e)
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: str, ttl: int):
+        """Store a result in both tiers"""
+        if ttl <= 0:
+            return
+
+        self._set_local(key, value, ttl)
+
+        if self.redis_client:
+            try:
+                await self.redis_client.setex(key, ttl, value)
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning("Tool cache Redis write failed: %s", e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the cache"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            "size": len(self._local),
+            "max_size": self.max_size,
+            "redis_enabled": self.redis_client is not None,
+        }
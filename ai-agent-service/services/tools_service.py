@@ -1,18 +1,30 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from models.tool_action import AgentAction, CreateAgentActionRequest, ParameterDefinition
 from services.database_service import DatabaseService
+from services.registry_store import ProjectRegistry, MemoryRegistryBackend
+from services.tool_cache import ToolResultCache
+from utils.metrics import TOOL_CALLS, observe_tool
+from utils.tracing import tracer
+import httpx
+import logging
 import uuid
 import json
 
-# In-memory storage for MVP
-# Map: project_id -> Action ID -> AgentAction
-_ACTIONS_DB: Dict[str, Dict[str, AgentAction]] = {}
+logger = logging.getLogger(__name__)
 
 class ToolsService:
-    def __init__(self, database_service: DatabaseService = None):
+    def __init__(
+        self,
+        database_service: DatabaseService = None,
+        result_cache: Optional[ToolResultCache] = None,
+        registry: Optional[ProjectRegistry[AgentAction]] = None
+    ):
         self.db_service = database_service or DatabaseService()
+        self.result_cache = result_cache
+        # Actions are shared by every worker (see services/registry_store.py)
+        self.registry = registry or ProjectRegistry("actions", AgentAction, MemoryRegistryBackend())
 
-    def create_action(self, project_id: str, request: CreateAgentActionRequest) -> AgentAction:
+    async def create_action(self, project_id: str, request: CreateAgentActionRequest) -> AgentAction:
         """Create a new named action (tool) for the agent."""
         action_id = str(uuid.uuid4())
         
@@ -22,32 +34,36 @@ class ToolsService:
             connection_id=request.connection_id,
             name=request.name,
             description=request.description,
+            action_type=request.action_type,
             sql_query=request.sql_query,
-            parameters=request.parameters
+            api_config=request.api_config,
+            parameters=request.parameters,
+            read_only=request.read_only,
+            cache_ttl_seconds=request.cache_ttl_seconds
         )
         
-        if project_id not in _ACTIONS_DB:
-            _ACTIONS_DB[project_id] = {}
-            
-        _ACTIONS_DB[project_id][action_id] = action
+        await self.registry.put(project_id, action_id, action)
         return action
 
-    def get_actions(self, project_id: str) -> List[AgentAction]:
+    async def get_actions(self, project_id: str) -> List[AgentAction]:
         """Get all actions defined for a project."""
-        if project_id not in _ACTIONS_DB:
-            return []
-        return list(_ACTIONS_DB[project_id].values())
+        return list((await self.registry.get_all(project_id)).values())
+
+    async def get_action(self, project_id: str, action_id: str) -> Optional[AgentAction]:
+        return await self.registry.get(project_id, action_id)
 
-    def get_action(self, project_id: str, action_id: str) -> Optional[AgentAction]:
-        if project_id in _ACTIONS_DB and action_id in _ACTIONS_DB[project_id]:
-            return _ACTIONS_DB[project_id][action_id]
-        return None
+    async def get_tools_for_llm(self, project_id: str) -> List[Dict[str, Any]]:
+        """Tool definitions for a project's actions (see build_tools)."""
+        return self.build_tools(await self.get_actions(project_id))
 
-    def get_tools_for_llm(self, project_id: str) -> List[Dict[str, Any]]:
+    @staticmethod
+    def build_tools(actions: List[AgentAction]) -> List[Dict[str, Any]]:
         """
         Convert defined Actions into LiteLLM/OpenAI Tool definitions.
+        Sorted by name so the tool block is byte-identical across turns and workers
+        (tools are part of the provider-side cached prompt prefix).
         """
-        actions = self.get_actions(project_id)
+        actions = sorted(actions, key=lambda a: a.name)
         tools = []
         
         for action in actions:
@@ -80,41 +96,60 @@ class ToolsService:
         return tools
 
 
-    async def execute_tool_call(self, tool_call: Dict[str, Any], project_id: str) -> str:
+    async def execute_tool_call(self, project_id: str, function_name: str, arguments: Dict[str, Any]) -> str:
         """
         Execute a tool call requested by the LLM.
+        Results of cacheable read-only actions are served from the result cache.
         """
-        function_name = tool_call.get("function", {}).get("name")
-        arguments_json = tool_call.get("function", {}).get("arguments", "{}")
-        
-        try:
-            arguments = json.loads(arguments_json)
-        except json.JSONDecodeError:
-            return f"Error: Invalid JSON arguments for tool {function_name}"
+        # Argument names only: values come from the conversation
+        logger.debug("Executing action %s", function_name, extra={"project_id": project_id, "arguments": sorted(arguments)})
 
-        print(f"🔧 Executing Action: {function_name} with params: {arguments}")
+        with tracer.start_as_current_span("tool.execute") as span:
+            span.set_attribute("tool.name", function_name)
+            # Find the action definition for the given project
+            project_actions = await self.registry.get_all(project_id)
+            action = next((a for a in project_actions.values() if a.name == function_name), None)
 
-        # Find the action definition for the given project
-        # This assumes _ACTIONS_DB is the source of truth and self.actions is not pre-populated
-        project_actions = _ACTIONS_DB.get(project_id, {})
-        action = next((a for a in project_actions.values() if a.name == function_name), None)
-        
-        if not action:
-            return f"Error: Tool {function_name} not found for project {project_id}."
+            if not action:
+                TOOL_CALLS.labels("unknown", "not_found").inc()
+                return f"Error: Tool {function_name} not found for project {project_id}."
+
+            cacheable = bool(self.result_cache and action.read_only and action.cache_ttl_seconds)
+            if cacheable:
+                cache_key = self.result_cache.make_key(project_id, action.id, arguments)
+                cached = await self.result_cache.get(cache_key)
+                if cached is not None:
+                    TOOL_CALLS.labels(action.action_type, "cached").inc()
+                    span.set_attribute("tool.cached", True)
+                    return cached
+
+            with observe_tool(action.action_type) as observation:
+                result, success = await self._run_action(project_id, action, arguments)
+                observation["outcome"] = "ok" if success else "error"
+
+            # Never cache failures, so a transient error is retried on the next turn
+            if cacheable and success:
+                await self.result_cache.set(cache_key, result, action.cache_ttl_seconds)
+
+            return result
 
+    async def _run_action(self, project_id: str, action: AgentAction, arguments: Dict[str, Any]) -> Tuple[str, bool]:
+        """Run an action against its backend, returning (result, success)."""
         try:
             if action.action_type == "database":
                 if not action.connection_id or not action.sql_query:
-                     return "Error: Misconfigured Database Action."
+                     return "Error: Misconfigured Database Action.", False
                 
                 # Execute SQL via DatabaseService
-                result = self.db_service.execute_query(
+                result = await self.db_service.execute_named_query(
                     project_id=project_id,
                     connection_id=action.connection_id,
-                    sql_query=action.sql_query,
-                    params=arguments
+                    query_template=action.sql_query,
+                    params=arguments,
+                    read_only=action.read_only,
+                    action_id=action.id
                 )
-                return json.dumps(result, default=str)
+                return json.dumps(result, default=str), True
             
             elif action.action_type == "api" and action.api_config:
                 # Execute API Request
@@ -150,15 +185,15 @@ class ToolsService:
                     
                     # Return success or error
                     if response.status_code >= 400:
-                         return f"API Error {response.status_code}: {response.text}"
+                         return f"API Error {response.status_code}: {response.text}", False
                     
                     try:
-                        return json.dumps(response.json(), default=str)
+                        return json.dumps(response.json(), default=str), True
                     except:
-                        return response.text
+                        return response.text, True
 
-            return "Error: Unknown action type or configuration."
+            return "Error: Unknown action type or configuration.", False
 
         except Exception as e:
-            print(f"❌ Execution Error: {e}")
-            return f"Error executing tool: {str(e)}"
+            logger.warning("Tool execution error: %s", e, extra={"action_id": action.id, "action_type": action.action_type})
+            return f"Error executing tool: {str(e)}", False
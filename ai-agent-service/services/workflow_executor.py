@@ -1,11 +1,42 @@
 """
-Workflow execution engine for backend nodes
-Handles AI Agent, API Call, and Handoff node execution
+Workflow execution engine
+Runs every node type server-side, advancing until a node needs user input
 """
 
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
-import httpx
+import asyncio
+import copy
+import json
+import logging
+import os
+import re
+from services.http_client import CircuitOpenError, get_http_client
+from services.llm_scheduler import AdmissionRejected
+from services.workflow_graph import CompiledWorkflow, CompiledNode, INPUT_NODE_TYPES
+from utils.json_path import extract
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on nodes executed for one user turn
+WORKFLOW_MAX_STEPS = int(os.getenv("WORKFLOW_MAX_STEPS", "50"))
+# Default budget for each branch of a parallel node (overridable per node)
+WORKFLOW_BRANCH_TIMEOUT_MS = int(os.getenv("WORKFLOW_BRANCH_TIMEOUT_MS", "10000"))
+# Largest value an API call may write into a variable (state is saved to Redis every turn)
+WORKFLOW_MAX_VARIABLE_BYTES = int(os.getenv("WORKFLOW_MAX_VARIABLE_BYTES", "4096"))
+# Only the most recent visited node ids are persisted with the state
+MAX_EXECUTION_HISTORY = 100
+
+_TEMPLATE_PATTERN = re.compile(r"\{\{\s*([\w.-]+)\s*\}\}")
+
+
+def _cap_variable(value: Any) -> Any:
+    """Keep a value if its JSON form fits the variable budget, else store truncated text"""
+    encoded = value if isinstance(value, str) else json.dumps(value, default=str)
+    if len(encoded.encode('utf-8')) <= WORKFLOW_MAX_VARIABLE_BYTES:
+        return value
+    return encoded.encode('utf-8')[:WORKFLOW_MAX_VARIABLE_BYTES].decode('utf-8', errors='ignore')
 
 
 @dataclass
@@ -29,24 +60,26 @@ class NodeExecutionResult:
 
 class WorkflowExecutor:
     """
-    Backend workflow executor for hybrid execution
-    Executes backend-required nodes (AI Agent, API Call, Handoff)
+    Backend workflow executor
+    Executes all node types so a whole user turn completes in one request
     """
     
     def __init__(
         self,
-        workflow_definition: Dict[str, Any],
+        workflow: CompiledWorkflow,
         session_id: str,
         project_id: str,
         llm_service=None,
         kb_service=None
     ):
-        self.workflow = workflow_definition
+        self.workflow = workflow
         self.session_id = session_id
         self.project_id = project_id
         self.llm_service = llm_service
         self.kb_service = kb_service
         self.state: Optional[WorkflowState] = None
+        # True while this turn's user input is still waiting to answer an input node
+        self._input_pending = False
     
     def load_state(self, state_dict: Dict[str, Any]):
         """Load execution state from frontend"""
@@ -56,6 +89,7 @@ class WorkflowExecutor:
             execution_history=state_dict.get('executionHistory', []),
             user_input=state_dict.get('userInput')
         )
+        self._input_pending = self.state.user_input is not None and self._is_waiting_for_input()
     
     async def execute_current_node(self) -> NodeExecutionResult:
         """Execute the current node"""
@@ -71,8 +105,13 @@ class WorkflowExecutor:
                 is_complete=True
             )
         
+        with tracer.start_as_current_span("workflow.node") as span:
+            span.set_attributes({"workflow.node_id": current_node.id, "workflow.node_type": current_node.type})
+            return await self._execute_node(current_node)
+
+    async def _execute_node(self, current_node: CompiledNode) -> NodeExecutionResult:
         # Execute based on node type
-        node_type = current_node.get('type')
+        node_type = current_node.type
         
         if node_type == 'ai-agent':
             return await self._execute_ai_agent_node(current_node)
@@ -80,19 +119,79 @@ class WorkflowExecutor:
             return await self._execute_api_call_node(current_node)
         elif node_type == 'handoff':
             return await self._execute_handoff_node(current_node)
+        elif node_type == 'message':
+            return self._execute_message_node(current_node)
+        elif node_type in INPUT_NODE_TYPES:
+            return self._execute_input_node(current_node)
+        elif node_type == 'condition':
+            return self._execute_condition_node(current_node)
+        elif node_type == 'variable-set':
+            return self._execute_variable_set_node(current_node)
+        elif node_type == 'parallel':
+            return await self._execute_parallel_node(current_node)
+        elif node_type == 'end':
+            return NodeExecutionResult(messages=[], next_node_id=None, variables=self.state.variables, is_complete=True)
         else:
-            # Shouldn't reach here in hybrid execution
+            # Start, join and unknown types just pass through
+            next_node_id = self._get_next_node_id(current_node)
             return NodeExecutionResult(
                 messages=[],
-                next_node_id=self._get_next_node_id(current_node),
-                is_complete=False
+                next_node_id=next_node_id,
+                is_complete=not next_node_id
             )
     
+    async def run_until_input(self, max_steps: int = WORKFLOW_MAX_STEPS) -> NodeExecutionResult:
+        """
+        Execute consecutive nodes until one waits for user input or the workflow ends.
+        Messages from every executed node are accumulated into one result. If the step
+        budget runs out, execution pauses on the current node and resumes next turn.
+        """
+        if not self.state:
+            raise ValueError("State not loaded")
+        
+        if not self.state.current_node_id:
+            # A new run: declared defaults first, overridden by anything the client already set
+            self.state.current_node_id = self.workflow.start_node_id
+            self.state.variables = {**self.workflow.variables, **self.state.variables}
+            self.state.execution_history.append(self.workflow.start_node_id)
+        
+        messages: List[str] = []
+        for _ in range(max_steps):
+            result = await self.execute_current_node()
+            messages.extend(result.messages)
+            
+            if result.requires_input:
+                return NodeExecutionResult(
+                    messages=messages,
+                    next_node_id=result.next_node_id,
+                    variables=self.state.variables,
+                    requires_input=True
+                )
+            
+            if result.is_complete or not result.next_node_id:
+                self.state.current_node_id = ''
+                return NodeExecutionResult(
+                    messages=messages,
+                    next_node_id=None,
+                    variables=self.state.variables,
+                    is_complete=True
+                )
+            
+            self.state.current_node_id = result.next_node_id
+            self.state.execution_history.append(result.next_node_id)
+        
+        logger.warning("Workflow step budget exhausted", extra={"max_steps": max_steps, "node_id": self.state.current_node_id})
+        return NodeExecutionResult(
+            messages=messages,
+            next_node_id=self.state.current_node_id,
+            variables=self.state.variables
+        )
+    
     async def process_user_input(self, user_input: str) -> NodeExecutionResult:
-        """Process user input and execute workflow"""
+        """Process user input and execute workflow until it needs more input"""
         # Initialize state if not exists
         if not self.state:
-            start_node = next((n for n in self.workflow['nodes'] if n['type'] == 'start'), None)
+            start_node = self._find_node(self.workflow.start_node_id)
             if not start_node:
                 return NodeExecutionResult(
                     messages=["Error: No start node found"],
@@ -101,30 +200,184 @@ class WorkflowExecutor:
                 )
             
             self.state = WorkflowState(
-                current_node_id=start_node['id'],
-                variables=self.workflow.get('variables', {}),
-                execution_history=[start_node['id']],
+                current_node_id=start_node.id,
+                variables=dict(self.workflow.variables),
+                execution_history=[start_node.id],
                 user_input=user_input
             )
-            
-            # Move to next node after start
-            next_id = self._get_next_node_id(start_node)
-            if next_id:
-                self.state.current_node_id = next_id
         else:
             self.state.user_input = user_input
+            self._input_pending = self._is_waiting_for_input()
+        
+        return await self.run_until_input()
+    
+    def _is_waiting_for_input(self) -> bool:
+        """Whether execution is paused on an input node that the next user message answers"""
+        node = self._find_node(self.state.current_node_id) if self.state else None
+        return bool(node and node.type in INPUT_NODE_TYPES)
+    
+    def _execute_message_node(self, node: CompiledNode) -> NodeExecutionResult:
+        """Execute Message node, substituting {{variable}} placeholders"""
+        next_node_id = self._get_next_node_id(node)
+        return NodeExecutionResult(
+            messages=[self._render_template(node.config.message) if node.config.message else 'No message'],
+            next_node_id=next_node_id,
+            is_complete=not next_node_id
+        )
+    
+    def _execute_input_node(self, node: CompiledNode) -> NodeExecutionResult:
+        """Execute User Input node: consume this turn's input or pause for it"""
+        if not self._input_pending:
+            return NodeExecutionResult(
+                messages=[node.config.prompt] if node.config.prompt else [],
+                next_node_id=node.id,  # Stay on this node
+                variables=self.state.variables,
+                requires_input=True
+            )
+        
+        self._input_pending = False
+        next_node_id = self._get_next_node_id(node)
+        return NodeExecutionResult(
+            messages=[],
+            next_node_id=next_node_id,
+            is_complete=not next_node_id
+        )
+    
+    def _execute_condition_node(self, node: CompiledNode) -> NodeExecutionResult:
+        """Execute Condition node against the latest user input"""
+        user_input = self.state.user_input or ''
+        
+        for condition in node.config.conditions:
+            if condition.target_node_id and self._evaluate_condition(condition.type, condition.value, user_input):
+                return NodeExecutionResult(messages=[], next_node_id=condition.target_node_id)
         
-        return await self.execute_current_node()
+        # No condition matched: default target, then the outgoing edge
+        next_node_id = node.config.default_target_node_id or self._get_next_node_id(node)
+        return NodeExecutionResult(
+            messages=[],
+            next_node_id=next_node_id,
+            is_complete=not next_node_id
+        )
+    
+    def _evaluate_condition(self, condition_type: str, value: str, user_input: str) -> bool:
+        """Evaluate a condition (same semantics as the frontend executor)"""
+        if condition_type == 'keyword':
+            return value.lower() in user_input.lower()
+        elif condition_type == 'regex':
+            try:
+                return re.search(value, user_input, re.IGNORECASE) is not None
+            except re.error:
+                return False
+        elif condition_type == 'variable':
+            return self.state.variables.get(value) is True
+        return False
     
-    async def _execute_ai_agent_node(self, node: Dict[str, Any]) -> NodeExecutionResult:
+    def _execute_variable_set_node(self, node: CompiledNode) -> NodeExecutionResult:
+        """Execute Variable Set node"""
+        config = node.config
+        if config.variable_name:
+            if config.value_type == 'static':
+                self.state.variables[config.variable_name] = config.value
+            else:
+                self.state.variables[config.variable_name] = self._render_template(str(config.value))
+        
+        next_node_id = self._get_next_node_id(node)
+        return NodeExecutionResult(
+            messages=[],
+            next_node_id=next_node_id,
+            variables=self.state.variables,
+            is_complete=not next_node_id
+        )
+    
+    def _render_template(self, template: str) -> str:
+        """Substitute {{variable}} (and {{input}} for the latest user input) without evaluating code"""
+        def replace(match):
+            name = match.group(1)
+            if name == 'input':
+                return self.state.user_input or ''
+            value = self.state.variables.get(name)
+            return '' if value is None else str(value)
+        
+        return _TEMPLATE_PATTERN.sub(replace, template)
+    
+    async def _execute_parallel_node(self, node: CompiledNode) -> NodeExecutionResult:
+        """
+        Execute Parallel node: run every branch concurrently, then continue at the join.
+        Each branch works on its own copy of the variables; changes are merged in branch
+        (edge) order, so on conflicting writes the later branch wins deterministically.
+        """
+        plan = self.workflow.parallel_plans[node.id]
+        timeout_ms = node.config.branch_timeout_ms or WORKFLOW_BRANCH_TIMEOUT_MS
+        snapshot = self.state.variables
+        
+        outcomes = await asyncio.gather(*(
+            self._run_branch(branch, snapshot, timeout_ms) for branch in plan.branches
+        ))
+        
+        messages: List[str] = []
+        merged = dict(snapshot)
+        for branch, (branch_messages, branch_variables) in zip(plan.branches, outcomes):
+            messages.extend(branch_messages)
+            for name, value in branch_variables.items():
+                if name not in snapshot or snapshot[name] != value:
+                    merged[name] = value
+            self.state.execution_history.extend(branch)
+        
+        self.state.variables = merged
+        return NodeExecutionResult(
+            messages=messages,
+            next_node_id=plan.join_node_id,
+            variables=self.state.variables
+        )
+    
+    async def _run_branch(
+        self,
+        branch: Tuple[str, ...],
+        snapshot: Dict[str, Any],
+        timeout_ms: int
+    ) -> Tuple[List[str], Dict[str, Any]]:
+        """Run one branch on an isolated state; returns (messages, variables)"""
+        branch_executor = WorkflowExecutor(
+            workflow=self.workflow,
+            session_id=self.session_id,
+            project_id=self.project_id,
+            llm_service=self.llm_service,
+            kb_service=self.kb_service
+        )
+        branch_executor.state = WorkflowState(
+            current_node_id='',
+            variables=copy.deepcopy(snapshot),
+            execution_history=[],
+            user_input=self.state.user_input
+        )
+        messages: List[str] = []
+        
+        async def run():
+            for node_id in branch:
+                branch_executor.state.current_node_id = node_id
+                result = await branch_executor.execute_current_node()
+                messages.extend(result.messages)
+                if not result.next_node_id:
+                    # The node failed (e.g. API error); keep what the branch produced so far
+                    break
+        
+        try:
+            await asyncio.wait_for(run(), timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            logger.warning("Workflow branch timed out, its results are discarded", extra={"branch": branch[0], "timeout_ms": timeout_ms})
+            return [], {}
+        
+        return messages, branch_executor.state.variables
+    
+    async def _execute_ai_agent_node(self, node: CompiledNode) -> NodeExecutionResult:
         """Execute AI Agent node"""
         try:
             # Get node configuration
-            use_kb = node.get('data', {}).get('useKnowledgeBase', True)
-            custom_prompt = node.get('data', {}).get('prompt', '')
+            use_kb = node.config.use_knowledge_base
+            custom_prompt = node.config.prompt
             
             # Get context from knowledge base if enabled
-            context = ""
+            context = []
             if use_kb and self.kb_service:
                 context = await self.kb_service.get_relevant_context(
                     self.state.user_input or '',
@@ -138,9 +391,10 @@ class WorkflowExecutor:
                 
                 response = await self.llm_service.generate_response(
                     query=prompt,
-                    context=context,
+                    context_chunks=context,
                     history=[],  # Could load from session
-                    persona={}   # Could load from project config
+                    persona_config={},  # Could load from project config
+                    project_id=self.project_id
                 )
                 
                 messages = [response]
@@ -157,69 +411,79 @@ class WorkflowExecutor:
                 is_complete=not next_node_id
             )
             
+        except AdmissionRejected:
+            # Surface as 429 so the client retries the turn; state is not advanced
+            raise
         except Exception as e:
-            print(f"Error executing AI Agent node: {e}")
+            logger.exception("Error executing AI Agent node", extra={"node_id": node.id})
             return NodeExecutionResult(
                 messages=[f"Error: {str(e)}"],
                 next_node_id=None,
                 is_complete=True
             )
     
-    async def _execute_api_call_node(self, node: Dict[str, Any]) -> NodeExecutionResult:
-        """Execute API Call node"""
+    async def _execute_api_call_node(self, node: CompiledNode) -> NodeExecutionResult:
+        """
+        Execute API Call node through the shared pooled client.
+        With `extract` configured only the selected JSONPath values are stored;
+        otherwise the body is stored, capped so workflow state stays small.
+        """
+        config = node.config
+        if not config.url:
+            return NodeExecutionResult(
+                messages=["Error: No URL specified for API call"],
+                next_node_id=None,
+                is_complete=True
+            )
+        
         try:
-            # Get node configuration
-            method = node.get('data', {}).get('method', 'GET')
-            url = node.get('data', {}).get('url', '')
-            headers = node.get('data', {}).get('headers', {})
-            body = node.get('data', {}).get('body', '')
-            response_var = node.get('data', {}).get('responseVariable', 'api_response')
-            
-            if not url:
-                return NodeExecutionResult(
-                    messages=["Error: No URL specified for API call"],
-                    next_node_id=None,
-                    is_complete=True
-                )
-            
-            # Make API call
-            async with httpx.AsyncClient() as client:
-                if method == 'GET':
-                    response = await client.get(url, headers=headers, timeout=10.0)
-                elif method == 'POST':
-                    response = await client.post(url, headers=headers, content=body, timeout=10.0)
-                elif method == 'PUT':
-                    response = await client.put(url, headers=headers, content=body, timeout=10.0)
-                elif method == 'DELETE':
-                    response = await client.delete(url, headers=headers, timeout=10.0)
-                else:
-                    raise ValueError(f"Unsupported method: {method}")
-                
-                # Store response in variables
-                self.state.variables[response_var] = response.text
-                
-                # Get next node
-                next_node_id = self._get_next_node_id(node)
-                
-                return NodeExecutionResult(
-                    messages=[],  # API calls don't send messages to user
-                    next_node_id=next_node_id,
-                    variables=self.state.variables,
-                    is_complete=not next_node_id
-                )
-                
+            result = await get_http_client().request(
+                config.method,
+                config.url,
+                headers=config.headers,
+                body=config.body or None,
+                timeout_ms=config.timeout_ms,
+                max_retries=config.max_retries,
+                max_response_bytes=config.max_response_bytes
+            )
+        except CircuitOpenError as e:
+            logger.warning("API Call node skipped: %s", e, extra={"node_id": node.id})
+            return NodeExecutionResult(
+                messages=["API Error: service temporarily unavailable"],
+                next_node_id=None,
+                is_complete=True
+            )
         except Exception as e:
-            print(f"Error executing API Call node: {e}")
+            logger.warning("Error executing API Call node: %r", e, extra={"node_id": node.id})
             return NodeExecutionResult(
-                messages=[f"API Error: {str(e)}"],
+                messages=[f"API Error: {str(e) or type(e).__name__}"],
                 next_node_id=None,
                 is_complete=True
             )
+        
+        if config.extract:
+            try:
+                data = result.json()
+            except ValueError:
+                data = None
+            for variable, path in config.extract.items():
+                self.state.variables[variable] = _cap_variable(extract(data, path))
+        else:
+            self.state.variables[config.response_variable] = _cap_variable(result.text)
+        self.state.variables[f"{config.response_variable}_status"] = result.status_code
+        
+        next_node_id = self._get_next_node_id(node)
+        return NodeExecutionResult(
+            messages=[],  # API calls don't send messages to user
+            next_node_id=next_node_id,
+            variables=self.state.variables,
+            is_complete=not next_node_id
+        )
     
-    async def _execute_handoff_node(self, node: Dict[str, Any]) -> NodeExecutionResult:
+    async def _execute_handoff_node(self, node: CompiledNode) -> NodeExecutionResult:
         """Execute Handoff node"""
-        target = node.get('data', {}).get('target', 'human')
-        message = node.get('data', {}).get('message', 'Transferring to human agent...')
+        target = node.config.target
+        message = node.config.message
         
         # In a real implementation, this would trigger handoff logic
         # For now, just return a message
@@ -229,15 +493,13 @@ class WorkflowExecutor:
             is_complete=True
         )
     
-    def _find_node(self, node_id: str) -> Optional[Dict[str, Any]]:
+    def _find_node(self, node_id: str) -> Optional[CompiledNode]:
         """Find a node by ID"""
-        return next((n for n in self.workflow['nodes'] if n['id'] == node_id), None)
+        return self.workflow.get_node(node_id)
     
-    def _get_next_node_id(self, node: Dict[str, Any]) -> Optional[str]:
+    def _get_next_node_id(self, node: CompiledNode) -> Optional[str]:
         """Get the next node ID from edges"""
-        node_id = node['id']
-        edge = next((e for e in self.workflow['edges'] if e['source'] == node_id), None)
-        return edge['target'] if edge else None
+        return self.workflow.next_node_id(node.id)
     
     def get_state(self) -> Dict[str, Any]:
         """Get current state as dict"""
@@ -247,6 +509,7 @@ class WorkflowExecutor:
         return {
             'currentNodeId': self.state.current_node_id,
             'variables': self.state.variables,
-            'executionHistory': self.state.execution_history,
-            'userInput': self.state.user_input
+            'executionHistory': self.state.execution_history[-MAX_EXECUTION_HISTORY:],
+            'userInput': self.state.user_input,
+            'workflowHash': self.workflow.hash
         }
@@ -0,0 +1,394 @@
+"""
+Compiled workflow graphs
+Definitions are validated and indexed once, then cached by content hash
+"""
+
+from typing import Dict, List, Optional, Any, Callable, Tuple
+from dataclasses import dataclass, field
+from collections import OrderedDict
+import hashlib
+import json
+import os
+from utils.json_path import JSONPathError, parse_path
+
+WORKFLOW_CACHE_SIZE = int(os.getenv("WORKFLOW_CACHE_SIZE", "256"))
+
+# Node types that wait for the visitor; a loop through one of them is bounded by user turns
+INPUT_NODE_TYPES = {'input', 'user-input'}
+
+# Node types allowed between a parallel node and its join: each branch is a straight chain
+BRANCH_NODE_TYPES = {'message', 'ai-agent', 'api-call', 'variable-set'}
+
+
+class WorkflowValidationError(ValueError):
+    """Raised when a workflow definition cannot be compiled"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+# --- Typed node configurations ---
+
+@dataclass(frozen=True)
+class MessageConfig:
+    message: str
+
+
+@dataclass(frozen=True)
+class InputConfig:
+    prompt: str
+
+
+@dataclass(frozen=True)
+class ConditionRule:
+    type: str
+    value: str
+    target_node_id: Optional[str]
+
+
+@dataclass(frozen=True)
+class ConditionConfig:
+    conditions: List[ConditionRule]
+    default_target_node_id: Optional[str]
+
+
+@dataclass(frozen=True)
+class AIAgentConfig:
+    prompt: str
+    use_knowledge_base: bool
+    temperature: Optional[float]
+
+
+@dataclass(frozen=True)
+class APICallConfig:
+    method: str
+    url: str
+    headers: Dict[str, str]
+    body: str
+    response_variable: str
+    extract: Dict[str, str]  # variable name -> JSONPath into the response body
+    timeout_ms: Optional[int]
+    max_retries: Optional[int]
+    max_response_bytes: Optional[int]
+
+
+@dataclass(frozen=True)
+class VariableSetConfig:
+    variable_name: str
+    value: Any
+    value_type: str
+
+
+@dataclass(frozen=True)
+class HandoffConfig:
+    target: str
+    target_id: Optional[str]
+    message: str
+
+
+@dataclass(frozen=True)
+class ParallelConfig:
+    branch_timeout_ms: Optional[int]
+
+
+def _optional_int(value: Any) -> Optional[int]:
+    return int(value) if value not in (None, '') else None
+
+
+def _parse_json_object(value: Any) -> Dict[str, str]:
+    """The editor stores some objects (headers, extract) as JSON text"""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value.strip() else {}
+        except ValueError:
+            return {}
+    return {str(k): str(v) for k, v in value.items()} if isinstance(value, dict) else {}
+
+
+def _parse_condition(data: Dict[str, Any]) -> ConditionConfig:
+    return ConditionConfig(
+        conditions=[
+            ConditionRule(
+                type=c.get('type', 'keyword'),
+                value=c.get('value', ''),
+                target_node_id=c.get('targetNodeId')
+            )
+            for c in data.get('conditions', [])
+        ],
+        default_target_node_id=data.get('defaultTargetNodeId')
+    )
+
+
+NODE_CONFIG_PARSERS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    'message': lambda d: MessageConfig(message=d.get('message', '')),
+    'input': lambda d: InputConfig(prompt=d.get('prompt', '')),
+    'user-input': lambda d: InputConfig(prompt=d.get('prompt', '')),
+    'condition': _parse_condition,
+    'ai-agent': lambda d: AIAgentConfig(
+        prompt=d.get('prompt', ''),
+        use_knowledge_base=d.get('useKnowledgeBase', True),
+        temperature=d.get('temperature')
+    ),
+    'api-call': lambda d: APICallConfig(
+        method=d.get('method', 'GET'),
+        url=d.get('url', ''),
+        headers=_parse_json_object(d.get('headers')),
+        body=d.get('body', ''),
+        response_variable=d.get('responseVariable', 'api_response'),
+        extract=_parse_json_object(d.get('extract')),
+        timeout_ms=_optional_int(d.get('timeoutMs')),
+        max_retries=_optional_int(d.get('retries')),
+        max_response_bytes=_optional_int(d.get('maxResponseBytes'))
+    ),
+    'variable-set': lambda d: VariableSetConfig(
+        variable_name=d.get('variableName', ''),
+        value=d.get('value', ''),
+        value_type=d.get('valueType', 'static')
+    ),
+    'handoff': lambda d: HandoffConfig(
+        target=d.get('target', 'human'),
+        target_id=d.get('targetId'),
+        message=d.get('message', 'Transferring to human agent...')
+    ),
+    'parallel': lambda d: ParallelConfig(branch_timeout_ms=_optional_int(d.get('branchTimeoutMs'))),
+}
+
+
+@dataclass(frozen=True)
+class CompiledNode:
+    id: str
+    type: str
+    config: Any  # One of the *Config dataclasses above, or None for start/join/end
+
+
+@dataclass(frozen=True)
+class ParallelPlan:
+    """Branches of a parallel node (node ids in execution order) and the join they meet at"""
+    branches: Tuple[Tuple[str, ...], ...]
+    join_node_id: str
+
+
+@dataclass
+class CompiledWorkflow:
+    """Indexed, validated workflow: O(1) node and edge lookup per step"""
+    hash: str
+    nodes: Dict[str, CompiledNode]
+    outgoing: Dict[str, List[str]]  # node id -> target ids, in definition order
+    start_node_id: Optional[str]
+    variables: Dict[str, Any] = field(default_factory=dict)
+    parallel_plans: Dict[str, ParallelPlan] = field(default_factory=dict)  # parallel node id -> plan
+
+    def get_node(self, node_id: str) -> Optional[CompiledNode]:
+        return self.nodes.get(node_id)
+
+    def next_node_id(self, node_id: str) -> Optional[str]:
+        targets = self.outgoing.get(node_id)
+        return targets[0] if targets else None
+
+
+def canonicalize_workflow(definition: Dict[str, Any]) -> str:
+    """Canonical JSON of the parts that affect execution (layout is ignored)"""
+    canonical = {
+        'nodes': sorted(
+            ({'id': n.get('id'), 'type': n.get('type'), 'data': n.get('data', {})} for n in definition.get('nodes', [])),
+            key=lambda n: str(n['id'])
+        ),
+        'edges': [
+            {'source': e.get('source'), 'target': e.get('target'), 'sourceHandle': e.get('sourceHandle')}
+            for e in definition.get('edges', [])
+        ],
+        'variables': definition.get('variables', {}),
+    }
+    return json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def hash_workflow(definition: Dict[str, Any]) -> str:
+    return hashlib.sha256(canonicalize_workflow(definition).encode('utf-8')).hexdigest()
+
+
+def compile_workflow(definition: Dict[str, Any], workflow_hash: Optional[str] = None) -> CompiledWorkflow:
+    """Validate a workflow definition and build its indexed graph"""
+    errors: List[str] = []
+    nodes: Dict[str, CompiledNode] = {}
+
+    for raw in definition.get('nodes', []):
+        node_id = raw.get('id')
+        node_type = raw.get('type')
+        if not node_id or not node_type:
+            errors.append("Every node needs an id and a type")
+            continue
+        if node_id in nodes:
+            errors.append(f"Duplicate node id '{node_id}'")
+            continue
+
+        parser = NODE_CONFIG_PARSERS.get(node_type)
+        try:
+            config = parser(raw.get('data') or {}) if parser else None
+        except (TypeError, ValueError) as e:
+            errors.append(f"Node '{node_id}' has invalid configuration: {e}")
+            continue
+
+        if isinstance(config, APICallConfig):
+            for variable, path in config.extract.items():
+                try:
+                    parse_path(path)
+                except JSONPathError as e:
+                    errors.append(f"API Call node '{node_id}': invalid path for '{variable}': {e}")
+
+        nodes[node_id] = CompiledNode(id=node_id, type=node_type, config=config)
+
+    outgoing: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+    for edge in definition.get('edges', []):
+        source, target = edge.get('source'), edge.get('target')
+        if source not in nodes or target not in nodes:
+            errors.append(f"Edge '{edge.get('id', '')}' connects unknown nodes {source} -> {target}")
+            continue
+        outgoing[source].append(target)
+
+    for node in nodes.values():
+        if isinstance(node.config, ConditionConfig):
+            targets = [c.target_node_id for c in node.config.conditions] + [node.config.default_target_node_id]
+            for target in targets:
+                if target and target not in nodes:
+                    errors.append(f"Condition node '{node.id}' points to unknown node '{target}'")
+
+    start_nodes = [n.id for n in nodes.values() if n.type == 'start']
+    if len(start_nodes) != 1:
+        errors.append("Workflow must have exactly one Start node")
+
+    parallel_plans: Dict[str, ParallelPlan] = {}
+    for node in nodes.values():
+        if node.type == 'parallel':
+            plan = _plan_parallel(node, nodes, outgoing, errors)
+            if plan:
+                parallel_plans[node.id] = plan
+
+    if not errors:
+        cycle = _find_unbounded_cycle(nodes, outgoing)
+        if cycle:
+            errors.append(f"Workflow loops without waiting for user input: {' -> '.join(cycle)}")
+
+    if errors:
+        raise WorkflowValidationError(errors)
+
+    return CompiledWorkflow(
+        hash=workflow_hash or hash_workflow(definition),
+        nodes=nodes,
+        outgoing=outgoing,
+        start_node_id=start_nodes[0],
+        variables=dict(definition.get('variables') or {}),
+        parallel_plans=parallel_plans
+    )
+
+
+def _plan_parallel(
+    node: CompiledNode,
+    nodes: Dict[str, CompiledNode],
+    outgoing: Dict[str, List[str]],
+    errors: List[str]
+) -> Optional[ParallelPlan]:
+    """Follow each outgoing edge of a parallel node to the join all branches must share"""
+    if len(outgoing[node.id]) < 2:
+        errors.append(f"Parallel node '{node.id}' needs at least two outgoing branches")
+        return None
+
+    branches: List[Tuple[str, ...]] = []
+    joins = set()
+    for current in outgoing[node.id]:
+        chain: List[str] = []
+        while current and nodes[current].type != 'join':
+            if nodes[current].type not in BRANCH_NODE_TYPES:
+                errors.append(f"Parallel node '{node.id}': '{nodes[current].type}' node '{current}' is not allowed inside a branch")
+                return None
+            if current in chain or len(outgoing[current]) > 1:
+                errors.append(f"Parallel node '{node.id}': branch through '{current}' must be a straight chain")
+                return None
+            chain.append(current)
+            current = outgoing[current][0] if outgoing[current] else None
+
+        if not current:
+            errors.append(f"Parallel node '{node.id}': branch starting at '{chain[0]}' never reaches a Join node")
+            return None
+        joins.add(current)
+        branches.append(tuple(chain))
+
+    if len(joins) != 1:
+        errors.append(f"Parallel node '{node.id}': all branches must meet at the same Join node")
+        return None
+
+    return ParallelPlan(branches=tuple(branches), join_node_id=joins.pop())
+
+
+def _successors(node: CompiledNode, outgoing: Dict[str, List[str]]) -> List[str]:
+    targets = list(outgoing.get(node.id, []))
+    if isinstance(node.config, ConditionConfig):
+        targets += [c.target_node_id for c in node.config.conditions if c.target_node_id]
+        if node.config.default_target_node_id:
+            targets.append(node.config.default_target_node_id)
+    return targets
+
+
+def _find_unbounded_cycle(nodes: Dict[str, CompiledNode], outgoing: Dict[str, List[str]]) -> Optional[List[str]]:
+    """
+    Find a cycle that never passes through an input node.
+    Such a loop would spin forever within one turn, so it is rejected at compile time.
+    """
+    WHITE, GREY, BLACK = 0, 1, 2
+    color = {node_id: WHITE for node_id in nodes}
+
+    for root in nodes:
+        if color[root] != WHITE or nodes[root].type in INPUT_NODE_TYPES:
+            continue
+
+        # Iterative DFS keeping the current path for reporting
+        path: List[str] = [root]
+        stack = [iter(_successors(nodes[root], outgoing))]
+        color[root] = GREY
+
+        while stack:
+            target = next(stack[-1], None)
+            if target is None:
+                stack.pop()
+                color[path.pop()] = BLACK
+                continue
+
+            if nodes[target].type in INPUT_NODE_TYPES:
+                continue
+            if color[target] == GREY:
+                return path[path.index(target):] + [target]
+            if color[target] == WHITE:
+                color[target] = GREY
+                path.append(target)
+                stack.append(iter(_successors(nodes[target], outgoing)))
+
+    return None
+
+
+class WorkflowGraphCache:
+    """LRU cache of compiled workflows keyed by project and content hash"""
+
+    def __init__(self, max_size: int = WORKFLOW_CACHE_SIZE):
+        self.max_size = max_size
+        self._graphs: "OrderedDict[Tuple[str, str], CompiledWorkflow]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, project_id: str, workflow_hash: str) -> Optional[CompiledWorkflow]:
+        compiled = self._graphs.get((project_id, workflow_hash))
+        if compiled:
+            self._graphs.move_to_end((project_id, workflow_hash))
+            self._stats["hits"] += 1
+        else:
+            self._stats["misses"] += 1
+        return compiled
+
+    def put(self, project_id: str, compiled: CompiledWorkflow):
+        key = (project_id, compiled.hash)
+        self._graphs[key] = compiled
+        self._graphs.move_to_end(key)
+        while len(self._graphs) > self.max_size:
+            self._graphs.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "size": len(self._graphs), "max_size": self.max_size}
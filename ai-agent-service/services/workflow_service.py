@@ -3,41 +3,133 @@ Workflow state management service using Redis
 """
 
 from typing import Dict, Optional, Any
+import hashlib
 import json
-import redis
+import logging
+from utils.redis_client import RedisClient
+from utils.metrics import observe_redis
+from services.workflow_graph import (
+    CompiledWorkflow,
+    WorkflowGraphCache,
+    canonicalize_workflow,
+    compile_workflow
+)
+
+logger = logging.getLogger(__name__)
+
+# Definitions are shared by project and hash across workers; the TTL is refreshed whenever a worker uses one
+WORKFLOW_DEFINITION_TTL = 7 * 86400
 
 
 class WorkflowService:
     """Service for managing workflow execution state in Redis"""
     
-    def __init__(self, redis_url: str = "redis://redis:6379/0"):
-        try:
-            self.redis_client = redis.from_url(redis_url, decode_responses=True)
-        except Exception as e:
-            print(f"Warning: Could not connect to Redis: {e}")
-            self.redis_client = None
+    def __init__(self, redis_client: Optional[RedisClient], graph_cache: Optional[WorkflowGraphCache] = None):
+        self.redis_client = redis_client
+        self.graph_cache = graph_cache or WorkflowGraphCache()
     
     def _get_workflow_key(self, project_id: str, session_id: str) -> str:
         """Generate Redis key for workflow state"""
         return f"workflow:{project_id}:{session_id}"
     
-    def get_workflow_state(self, project_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+    def _get_definition_key(self, project_id: str, workflow_hash: str) -> str:
+        """Generate Redis key for a workflow definition; a hash only resolves within its project"""
+        return f"workflow_def:{project_id}:{workflow_hash}"
+    
+    async def resolve_workflow(
+        self,
+        project_id: str,
+        definition: Optional[Dict[str, Any]] = None,
+        workflow_hash: Optional[str] = None
+    ) -> Optional[CompiledWorkflow]:
+        """
+        Return the compiled workflow for a full definition or a hash previously seen
+        in this project.
+        Raises WorkflowValidationError for invalid definitions; returns None for an
+        unknown hash so the caller can ask the client for the full definition.
+        """
+        if definition:
+            canonical = canonicalize_workflow(definition)
+            workflow_hash = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+            compiled = self.graph_cache.get(project_id, workflow_hash)
+            if compiled:
+                await self._touch_definition(project_id, workflow_hash)
+                return compiled
+            
+            compiled = compile_workflow(definition, workflow_hash)
+            self.graph_cache.put(project_id, compiled)
+            await self._save_definition(project_id, workflow_hash, canonical)
+            return compiled
+        
+        if not workflow_hash:
+            return None
+        
+        compiled = self.graph_cache.get(project_id, workflow_hash)
+        if compiled:
+            await self._touch_definition(project_id, workflow_hash)
+            return compiled
+        
+        # Another worker may have seen the definition
+        canonical = await self._load_definition(project_id, workflow_hash)
+        if not canonical:
+            return None
+        
+        compiled = compile_workflow(json.loads(canonical), workflow_hash)
+        self.graph_cache.put(project_id, compiled)
+        return compiled
+    
+    @observe_redis("save_workflow_definition")
+    async def _save_definition(self, project_id: str, workflow_hash: str, canonical: str):
+        if not self.redis_client:
+            return
+        
+        try:
+            await self.redis_client.setex(self._get_definition_key(project_id, workflow_hash), WORKFLOW_DEFINITION_TTL, canonical)
+        except Exception as e:
+            logger.warning("Error saving workflow definition: %s", e, extra={"project_id": project_id})
+    
+    @observe_redis("touch_workflow_definition")
+    async def _touch_definition(self, project_id: str, workflow_hash: str):
+        """Keep a definition in use available to other workers, after a local cache hit"""
+        if not self.redis_client:
+            return
+        
+        try:
+            await self.redis_client.expire(self._get_definition_key(project_id, workflow_hash), WORKFLOW_DEFINITION_TTL)
+        except Exception as e:
+            logger.warning("Error refreshing workflow definition: %s", e, extra={"project_id": project_id})
+    
+    @observe_redis("load_workflow_definition")
+    async def _load_definition(self, project_id: str, workflow_hash: str) -> Optional[str]:
+        if not self.redis_client:
+            return None
+        
+        try:
+            # GETEX refreshes the TTL in the same round trip
+            return await self.redis_client.getex(self._get_definition_key(project_id, workflow_hash), ex=WORKFLOW_DEFINITION_TTL)
+        except Exception as e:
+            logger.warning("Error loading workflow definition: %s", e, extra={"project_id": project_id})
+            return None
+    
+    @observe_redis("get_workflow_state")
+    async def get_workflow_state(self, project_id: str, session_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve workflow state from Redis"""
         if not self.redis_client:
             return None
         
         try:
             key = self._get_workflow_key(project_id, session_id)
-            state_json = self.redis_client.get(key)
+            state_json = await self.redis_client.get(key)
             
             if state_json:
                 return json.loads(state_json)
             return None
         except Exception as e:
-            print(f"Error getting workflow state: {e}")
+            logger.warning("Error getting workflow state: %s", e)
             return None
     
-    def set_workflow_state(
+    @observe_redis("set_workflow_state")
+    async def set_workflow_state(
         self,
         project_id: str,
         session_id: str,
@@ -51,34 +143,35 @@ class WorkflowService:
         try:
             key = self._get_workflow_key(project_id, session_id)
             state_json = json.dumps(state)
-            self.redis_client.setex(key, ttl, state_json)
+            await self.redis_client.setex(key, ttl, state_json)
             return True
         except Exception as e:
-            print(f"Error setting workflow state: {e}")
+            logger.warning("Error setting workflow state: %s", e)
             return False
     
-    def reset_workflow_state(self, project_id: str, session_id: str) -> bool:
+    @observe_redis("reset_workflow_state")
+    async def reset_workflow_state(self, project_id: str, session_id: str) -> bool:
         """Delete workflow state from Redis"""
         if not self.redis_client:
             return False
         
         try:
             key = self._get_workflow_key(project_id, session_id)
-            self.redis_client.delete(key)
+            await self.redis_client.delete(key)
             return True
         except Exception as e:
-            print(f"Error resetting workflow state: {e}")
+            logger.warning("Error resetting workflow state: %s", e)
             return False
     
-    def update_workflow_variables(
+    async def update_workflow_variables(
         self,
         project_id: str,
         session_id: str,
         variables: Dict[str, Any]
     ) -> bool:
         """Update workflow variables in existing state"""
-        state = self.get_workflow_state(project_id, session_id)
+        state = await self.get_workflow_state(project_id, session_id)
         if state:
             state['variables'] = {**state.get('variables', {}), **variables}
-            return self.set_workflow_state(project_id, session_id, state)
+            return await self.set_workflow_state(project_id, session_id, state)
         return False
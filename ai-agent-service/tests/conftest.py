@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Tests import the service's top-level packages (services, utils, models) like main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# No network at import time: litellm's bundled cost map, in-process LLM scheduler
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+os.environ.setdefault("LLM_SCHEDULER_BACKEND", "local")
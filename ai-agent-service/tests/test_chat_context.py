@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+from services import chat_context
+from services.chat_context import ChatContextLoader
+
+HISTORY = [{"role": "user", "content": "earlier"}]
+CHUNKS = [{"content": "Opening hours are 9 to 5", "score": 0.9}]
+TOOLS = [{"type": "function", "function": {"name": "lookup_order"}}]
+
+
+class _History:
+    async def get_prompt_history(self, project_id, session_id, fallback_history=None):
+        return HISTORY, "summary"
+
+
+class _KB:
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+
+    async def get_relevant_context(self, query, project_id):
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return CHUNKS
+
+
+class _Tools(_KB):
+    async def get_tools_for_llm(self, project_id):
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return TOOLS
+
+
+@pytest.fixture(autouse=True)
+def short_budgets(monkeypatch):
+    monkeypatch.setattr(chat_context, "KB_TIMEOUT_MS", 50)
+    monkeypatch.setattr(chat_context, "TOOLS_TIMEOUT_MS", 50)
+
+
+def _load(kb, tools):
+    loader = ChatContextLoader(_History(), kb, tools)
+    return asyncio.run(loader.load("when are you open?", "proj_test", "sess_test"))
+
+
+def test_all_sources_answer():
+    context = _load(_KB(), _Tools())
+
+    assert (context.history, context.summary, context.context_chunks, context.tools) == (HISTORY, "summary", CHUNKS, TOOLS)
+    assert context.degraded == []
+    assert set(context.timings) == {"history", "kb", "tools", "pre_llm"}
+
+
+def test_slow_knowledge_base_is_skipped():
+    context = _load(_KB(delay=5), _Tools())
+
+    assert context.context_chunks == []
+    assert context.tools == TOOLS and context.history == HISTORY
+    assert context.degraded == ["kb"]
+    assert 40 <= context.timings["kb"] < 1000
+    assert context.timings["pre_llm"] < 1000
+
+
+def test_failing_tools_lookup_is_skipped():
+    context = _load(_KB(), _Tools(error=ConnectionError("mongo down")))
+
+    assert context.tools == []
+    assert context.context_chunks == CHUNKS
+    assert context.degraded == ["tools"]
+    assert "tools" in context.timings
+
+
+def test_both_sources_failing_still_gives_a_context():
+    context = _load(_KB(error=RuntimeError("kb 500")), _Tools(delay=5))
+
+    assert (context.context_chunks, context.tools, context.history) == ([], [], HISTORY)
+    assert sorted(context.degraded) == ["kb", "tools"]
+    assert {"kb", "tools", "pre_llm"} <= set(context.timings)
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import pytest
+from fastapi import WebSocketDisconnect
+from services import chat_socket
+from services.chat_socket import ChatSocketConnection
+
+
+class _Socket:
+    """In-memory WebSocket: frames pushed to `incoming` are received, sent frames are decoded"""
+
+    def __init__(self, stall: bool = False):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self.stall = stall
+
+    async def receive_text(self):
+        frame = await self.incoming.get()
+        if frame is None:
+            raise WebSocketDisconnect(1000)
+        return json.dumps(frame)
+
+    async def send_text(self, text):
+        if self.stall:
+            await asyncio.Event().wait()
+        self.sent.append(json.loads(text))
+
+
+async def _until(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+async def _serve(connection, handler, socket):
+    task = asyncio.create_task(connection.serve(handler))
+    return task, lambda: _close(task, socket)
+
+
+async def _close(task, socket):
+    await socket.incoming.put(None)
+    with pytest.raises(WebSocketDisconnect):
+        await task
+
+
+def _frames(socket, frame_type):
+    return [f for f in socket.sent if f.get("type") == frame_type]
+
+
+def test_two_requests_interleave_on_one_socket():
+    async def handler(connection, request_id, message):
+        for i in range(3):
+            await connection.send({"type": "delta", "request_id": request_id, "i": i})
+            await asyncio.sleep(0)
+        await connection.send({"type": "done", "request_id": request_id})
+
+    async def scenario():
+        socket = _Socket()
+        _, close = await _serve(ChatSocketConnection(socket, "sess"), handler, socket)
+        await socket.incoming.put({"request_id": "a", "query": "one"})
+        await socket.incoming.put({"request_id": "b", "query": "two"})
+        await _until(lambda: len(_frames(socket, "done")) == 2)
+        await close()
+        return socket
+
+    order = [(f["request_id"], f["i"]) for f in _frames(asyncio.run(scenario()), "delta")]
+    assert [i for rid, i in order if rid == "a"] == [0, 1, 2]
+    assert [i for rid, i in order if rid == "b"] == [0, 1, 2]
+    positions = {rid: [n for n, (r, _) in enumerate(order) if r == rid] for rid in "ab"}
+    assert positions["b"][0] < positions["a"][-1]
+
+
+def test_cancel_stops_only_its_own_request():
+    started, cancelled = [], []
+
+    async def handler(connection, request_id, message):
+        started.append(request_id)
+        try:
+            await asyncio.sleep(0.2 if request_id == "b" else 10)
+        except asyncio.CancelledError:
+            cancelled.append(request_id)
+            raise
+        await connection.send({"type": "done", "request_id": request_id})
+
+    async def scenario():
+        socket = _Socket()
+        _, close = await _serve(ChatSocketConnection(socket, "sess"), handler, socket)
+        await socket.incoming.put({"request_id": "a", "query": "long"})
+        await socket.incoming.put({"request_id": "b", "query": "short"})
+        await _until(lambda: len(started) == 2)
+        await socket.incoming.put({"type": "cancel", "request_id": "a"})
+        await _until(lambda: _frames(socket, "done"))
+        await close()
+        return socket
+
+    socket = asyncio.run(scenario())
+    assert cancelled == ["a"]
+    assert {"type": "cancelled", "request_id": "a"} in socket.sent
+    assert [f["request_id"] for f in _frames(socket, "done")] == ["b"]
+
+
+def test_requests_over_the_inflight_limit_are_rejected():
+    release = None
+
+    async def handler(connection, request_id, message):
+        await release.wait()
+        await connection.send({"type": "done", "request_id": request_id})
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        socket = _Socket()
+        _, close = await _serve(ChatSocketConnection(socket, "sess", max_inflight=1), handler, socket)
+        await socket.incoming.put({"request_id": "a", "query": "first"})
+        await socket.incoming.put({"request_id": "b", "query": "second"})
+        await _until(lambda: _frames(socket, "error"))
+        release.set()
+        await _until(lambda: _frames(socket, "done"))
+        await close()
+        return socket
+
+    socket = asyncio.run(scenario())
+    assert _frames(socket, "error") == [{"type": "error", "request_id": "b", "code": "too_many_requests"}]
+    assert [f["request_id"] for f in _frames(socket, "done")] == ["a"]
+
+
+def test_stalled_reader_is_dropped_after_the_send_timeout(monkeypatch):
+    monkeypatch.setattr(chat_socket, "WS_SEND_QUEUE_SIZE", 2)
+    monkeypatch.setattr(chat_socket, "WS_SEND_TIMEOUT_SECONDS", 0.05)
+    progress = []
+
+    async def handler(connection, request_id, message):
+        try:
+            for i in range(10):
+                await connection.send({"type": "delta", "request_id": request_id, "i": i})
+                progress.append(i)
+        except asyncio.CancelledError:
+            progress.append("cancelled")
+            raise
+
+    async def scenario():
+        socket = _Socket(stall=True)
+        connection = ChatSocketConnection(socket, "sess")
+        await socket.incoming.put({"request_id": "a", "query": "flood"})
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(connection.serve(handler), 2)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    # The writer holds one frame and the outbox two more, so the handler blocks
+    # instead of buffering all ten, and is cancelled once the socket is dropped
+    assert progress[-1] == "cancelled"
+    assert len(progress) - 1 < 10
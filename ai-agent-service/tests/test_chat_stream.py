@@ -0,0 +1,93 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from services.chat_context import ChatContext
+import main
+
+
+class _EndlessRouter:
+    """Streams tokens until cancelled, recording whether it was"""
+
+    primary_model = "test-model"
+
+    def __init__(self):
+        self.sent = 0
+        self.cancelled = False
+
+    async def stream(self, messages, **kwargs):
+        try:
+            while True:
+                self.sent += 1
+                yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=f"t{self.sent} "))])
+                await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+async def _stream_until_first_token(app, path, payload):
+    """
+    Call the ASGI app directly and disconnect once the first token arrives.
+    TestClient buffers the whole body and only reports a disconnect after the
+    response has finished, so it cannot leave a stream early.
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [(b"host", b"testserver"), (b"content-type", b"application/json")],
+        "client": ("testclient", 50000), "server": ("testserver", 80)
+    }
+    body = json.dumps(payload).encode()
+    left = asyncio.Event()
+    requested = False
+    messages = []
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await left.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+        if b"event: token" in message.get("body", b""):
+            left.set()
+
+    await asyncio.wait_for(app(scope, receive, send), 5)
+    return messages
+
+
+def test_client_disconnect_cancels_generation_and_frees_the_slot(monkeypatch):
+    router = _EndlessRouter()
+    saved = []
+
+    async def load(query, project_id, session_id, fallback_history=None):
+        return ChatContext(history=[], summary=None, context_chunks=[], tools=[])
+
+    async def add_turn(*args):
+        saved.append(args)
+
+    monkeypatch.setattr(main.chat_context_loader, "load", load)
+    monkeypatch.setattr(main.llm_service, "router", router)
+    monkeypatch.setattr(main.session_service, "add_turn", add_turn)
+
+    async def scenario():
+        messages = await _stream_until_first_token(main.app, "/chat/stream", {"query": "hi", "project_id": "proj_stream"})
+        # Let the cancelled producer unwind
+        for _ in range(20):
+            if router.cancelled and not main.llm_scheduler.get_stats()["active_by_project"]:
+                break
+            await asyncio.sleep(0.01)
+        sent = router.sent
+        await asyncio.sleep(0.05)
+        return messages, sent
+
+    messages, sent_at_disconnect = asyncio.run(scenario())
+
+    assert messages[0]["status"] == 200
+    assert router.cancelled
+    assert router.sent == sent_at_disconnect
+    assert "proj_stream" not in main.llm_scheduler.get_stats()["active_by_project"]
+    assert saved == []
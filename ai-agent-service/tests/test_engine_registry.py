@@ -0,0 +1,107 @@
+import threading
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+from models.db_connection import DatabaseConnection
+from services.engine_registry import EngineCapacityError, EngineRegistry
+
+
+class _SqliteRegistry(EngineRegistry):
+    """Real pools on in-memory SQLite; records which engines were disposed"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.disposed = set()
+
+    def _create_engine(self, connection, pool_size, max_overflow):
+        engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=pool_size, max_overflow=max_overflow,
+                               pool_timeout=1, connect_args={"check_same_thread": False})
+        original_dispose = engine.dispose
+
+        def dispose(*args, **kwargs):
+            self.disposed.add(id(engine))
+            original_dispose(*args, **kwargs)
+
+        engine.dispose = dispose
+        return engine
+
+
+def _connection(connection_id: str, host: str = "db.internal") -> DatabaseConnection:
+    return DatabaseConnection(
+        id=connection_id, project_id="proj", type="postgres", name=connection_id, host=host, port=5432,
+        username="app", encrypted_password="", database="app", pool_size=1, max_overflow=0
+    )
+
+
+def test_engine_is_not_evicted_between_lookup_and_checkout():
+    registry = _SqliteRegistry(max_engines=1, max_total_connections=1, idle_seconds=0)
+    first, second = _connection("first"), _connection("second")
+    engine = registry.get(first)
+    seen = {}
+    checkout = engine.connect
+
+    def evict_before_checkout():
+        # connect() has looked the engine up and released the registry lock, nothing is checked out yet
+        seen["evicted"] = registry.evict_idle()
+        with pytest.raises(EngineCapacityError):
+            registry.get(second)
+        return checkout()
+
+    engine.connect = evict_before_checkout
+
+    with registry.connect(first) as (leased, connection):
+        assert leased is engine
+        assert connection.execute(text("select 1")).scalar() == 1
+
+    assert seen["evicted"] == 0
+    assert id(engine) not in registry.disposed
+    # Released: now it may go
+    assert registry.evict_idle() == 1
+    assert id(engine) in registry.disposed
+
+
+def test_replaced_engine_is_disposed_after_its_last_lease():
+    registry = _SqliteRegistry(max_engines=2, max_total_connections=2)
+    with registry.connect(_connection("conn")) as (old, _):
+        registry.get(_connection("conn", host="db2.internal"))
+        assert id(old) not in registry.disposed
+        # The old pool's connection is still open and still counted
+        assert registry.get_stats()["pool_capacity"] == 2
+    assert id(old) in registry.disposed
+    assert registry.get_stats()["pool_capacity"] == 1
+
+
+def test_concurrent_connects_and_evictions_never_dispose_a_leased_engine():
+    registry = _SqliteRegistry(max_engines=2, max_total_connections=2, idle_seconds=0)
+    connections = [_connection(f"conn-{i}") for i in range(4)]
+    errors, stop = [], threading.Event()
+
+    def query(connection):
+        for _ in range(50):
+            try:
+                with registry.connect(connection) as (engine, db_connection):
+                    db_connection.execute(text("select 1"))
+                    if id(engine) in registry.disposed:
+                        errors.append(f"{connection.id}: engine disposed while leased")
+            except EngineCapacityError:
+                pass
+            stats = registry.get_stats()
+            if stats["pool_capacity"] > stats["max_total_connections"]:
+                errors.append(f"capacity {stats['pool_capacity']} over the limit")
+
+    def evict():
+        while not stop.is_set():
+            registry.evict_idle()
+
+    evictor = threading.Thread(target=evict)
+    evictor.start()
+    workers = [threading.Thread(target=query, args=(connection,)) for connection in connections]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    stop.set()
+    evictor.join()
+
+    assert errors == []
+    assert all(entry["leases"] == 0 for entry in registry.get_stats()["by_connection"])
@@ -0,0 +1,157 @@
+import asyncio
+import httpx
+import pytest
+from services import http_client, workflow_executor
+from services.http_client import (
+    HTTP_CIRCUIT_FAILURE_THRESHOLD, CircuitBreaker, CircuitOpenError, PooledHTTPClient, ResponseTooLargeError
+)
+from services.workflow_executor import WORKFLOW_MAX_VARIABLE_BYTES, WorkflowExecutor
+from services.workflow_graph import compile_workflow
+
+
+class _MockedClient(PooledHTTPClient):
+    """Pooled client whose requests are answered by `handler` (counted in `calls`)"""
+
+    def __init__(self, handler):
+        super().__init__()
+        self.calls = 0
+
+        def counted(request):
+            self.calls += 1
+            return handler(request)
+
+        self._client = httpx.AsyncClient(transport=httpx.MockTransport(counted))
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(http_client, "HTTP_BACKOFF_BASE_MS", 1)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(http_client.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_circuit_opens_then_half_opens_and_closes(clock):
+    healthy = [False]
+    client = _MockedClient(lambda request: httpx.Response(200 if healthy[0] else 500, text="ok"))
+
+    async def get():
+        return await client.request("GET", "https://api.test/status", max_retries=0)
+
+    async def scenario():
+        for _ in range(HTTP_CIRCUIT_FAILURE_THRESHOLD):
+            assert (await get()).status_code == 500
+        with pytest.raises(CircuitOpenError):
+            await get()
+        opened = (client.calls, client.get_stats()["circuits"]["api.test"]["state"])
+
+        clock[0] += http_client.HTTP_CIRCUIT_RESET_SECONDS
+        healthy[0] = True
+        half_open = client.get_stats()["circuits"]["api.test"]["state"]
+        trial = await get()
+        return opened, half_open, trial.status_code, client.get_stats()["circuits"]["api.test"]["state"]
+
+    opened, half_open, trial, closed = asyncio.run(scenario())
+    assert opened == (HTTP_CIRCUIT_FAILURE_THRESHOLD, "open")
+    assert (half_open, trial, closed) == ("half-open", 200, "closed")
+
+
+def test_half_open_circuit_lets_one_trial_through_and_reopens_on_failure(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock[0] += 30
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_post_is_not_resent_after_a_transport_error():
+    def handler(request):
+        raise httpx.ReadError("connection reset", request=request)
+
+    post, get = _MockedClient(handler), _MockedClient(handler)
+
+    with pytest.raises(httpx.ReadError):
+        asyncio.run(post.request("POST", "https://api.test/orders", body="{}", max_retries=2))
+    with pytest.raises(httpx.ReadError):
+        asyncio.run(get.request("GET", "https://api.test/orders", max_retries=2))
+
+    assert post.calls == 1
+    assert get.calls == 3
+
+
+def test_post_is_retried_when_it_never_reached_the_server():
+    attempts = []
+
+    def handler(request):
+        attempts.append(request.method)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(201, text="created")
+
+    result = asyncio.run(_MockedClient(handler).request("POST", "https://api.test/orders", body="{}"))
+
+    assert (result.status_code, result.attempts) == (201, 2)
+
+
+def test_oversized_streamed_body_is_abandoned():
+    sent = []
+
+    async def body():
+        for _ in range(100):
+            sent.append(1024)
+            yield b"x" * 1024
+
+    client = _MockedClient(lambda request: httpx.Response(200, content=body()))
+
+    with pytest.raises(ResponseTooLargeError):
+        asyncio.run(client.request("GET", "https://api.test/export", max_response_bytes=4096))
+
+    assert len(sent) < 10
+    assert client.get_stats()["too_large"] == 1
+    # The host answered, so its circuit is not penalised
+    assert client.get_stats()["circuits"]["api.test"]["consecutive_failures"] == 0
+
+
+def test_declared_content_length_over_the_cap_is_rejected_before_reading():
+    client = _MockedClient(lambda request: httpx.Response(200, content=b"x" * 10_000))
+
+    with pytest.raises(ResponseTooLargeError, match="10000 bytes"):
+        asyncio.run(client.request("GET", "https://api.test/export", max_response_bytes=4096))
+
+
+def test_api_call_node_stores_extracted_values_capped(monkeypatch):
+    payload = {"data": {"city": "Lisbon", "notes": "é" * 3000, "tags": [{"name": "a"}, {"name": "b"}]}}
+    client = _MockedClient(lambda request: httpx.Response(200, json=payload))
+    monkeypatch.setattr(workflow_executor, "get_http_client", lambda: client)
+    workflow = compile_workflow({
+        "nodes": [
+            {"id": "start", "type": "start", "data": {}},
+            {"id": "lookup", "type": "api-call", "data": {
+                "url": "https://api.test/weather",
+                "responseVariable": "weather",
+                "extract": {"city": "$.data.city", "notes": "$.data.notes", "tags": "$.data.tags[*].name"}
+            }}
+        ],
+        "edges": [{"id": "e1", "source": "start", "target": "lookup"}]
+    })
+    executor = WorkflowExecutor(workflow, session_id="sess_test", project_id="proj_test")
+    executor.load_state({"userInput": "weather"})
+
+    asyncio.run(executor.run_until_input())
+    variables = executor.state.variables
+
+    assert variables["city"] == "Lisbon"
+    assert variables["tags"] == ["a", "b"]
+    assert variables["weather_status"] == 200
+    assert "weather" not in variables
+    # 6000 bytes of two-byte characters: cut at the byte budget without splitting one
+    assert variables["notes"] == "é" * (WORKFLOW_MAX_VARIABLE_BYTES // 2)
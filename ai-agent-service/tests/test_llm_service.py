@@ -0,0 +1,58 @@
+import asyncio
+from types import SimpleNamespace
+from services.llm_service import LLMService
+
+LOOKUP_TOOL = {"type": "function", "function": {"name": "lookup_order", "parameters": {"type": "object", "properties": {}}}}
+
+
+class _SlowRouter:
+    """Answers after a short delay so concurrent identical requests overlap"""
+
+    primary_model = "fake/model"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def complete(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        message = SimpleNamespace(content=f"answer {self.calls}", tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class _Tools:
+    def __init__(self, tools):
+        self.tools = tools
+
+    async def get_tools_for_llm(self, project_id):
+        return self.tools
+
+
+def _ask_twice(service: LLMService, **kwargs):
+    async def run():
+        return await asyncio.gather(*(
+            service.generate_response("Where is my order?", [], [], project_id="proj", **kwargs) for _ in range(2)
+        ))
+    return asyncio.run(run())
+
+
+def test_identical_first_turns_without_tools_share_one_completion():
+    router = _SlowRouter()
+    answers = _ask_twice(LLMService(router=router, tools_service=_Tools([])))
+
+    assert router.calls == 1
+    assert answers[0] == answers[1]
+
+
+def test_first_turns_with_project_tools_are_not_shared():
+    router = _SlowRouter()
+    _ask_twice(LLMService(router=router, tools_service=_Tools([LOOKUP_TOOL])))
+
+    assert router.calls == 2
+
+
+def test_first_turns_with_passed_tools_are_not_shared():
+    router = _SlowRouter()
+    _ask_twice(LLMService(router=router), tools=[LOOKUP_TOOL])
+
+    assert router.calls == 2
@@ -0,0 +1,113 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+from services import model_router
+from services.llm_scheduler import AdmissionRejected, LLMScheduler
+from services.llm_service import LLMService
+from services.model_router import ModelRouter
+
+PRIMARY, FALLBACK = "stub/primary", "stub/fallback"
+
+
+class StubProviders:
+    """Local stand-ins for LLM providers: per-model latency and failures, counting calls"""
+
+    def __init__(self):
+        self.latency = {PRIMARY: lambda call: 0.01, FALLBACK: lambda call: 0.01}
+        self.failing = set()
+        self.calls = {PRIMARY: 0, FALLBACK: 0}
+
+    async def completion(self, model, **kwargs):
+        self.calls[model] += 1
+        await asyncio.sleep(self.latency[model](self.calls[model]))
+        if model in self.failing:
+            raise ConnectionError(f"{model} unavailable")
+        message = SimpleNamespace(content=f"from {model}", tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None, model=model)
+
+
+@pytest.fixture(autouse=True)
+def short_hedge_delays(monkeypatch):
+    monkeypatch.setattr(model_router, "LLM_HEDGE_MIN_DELAY_MS", 50)
+    monkeypatch.setattr(model_router, "LLM_HEDGE_DEFAULT_DELAY_MS", 100)
+
+
+def _p99(latencies):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+
+def _brownout_latencies(hedge: bool):
+    providers = StubProviders()
+    router = ModelRouter([PRIMARY, FALLBACK], completion=providers.completion, hedge=hedge)
+
+    async def timed_call():
+        started = time.perf_counter()
+        await router.complete(messages=[])
+        return time.perf_counter() - started
+
+    async def run():
+        # Healthy traffic first, so the hedge delay comes from observed latencies
+        for _ in range(model_router.MIN_LATENCY_SAMPLES + 5):
+            await timed_call()
+        # Brownout: every fourth call to the primary stalls for a second
+        providers.latency[PRIMARY] = lambda call: 1.0 if call % 4 == 0 else 0.01
+        return await asyncio.gather(*(timed_call() for _ in range(40)))
+
+    return asyncio.run(run()), router.get_stats()
+
+
+def test_hedging_cuts_tail_latency_during_a_brownout():
+    unhedged, _ = _brownout_latencies(hedge=False)
+    hedged, stats = _brownout_latencies(hedge=True)
+
+    assert _p99(unhedged) >= 1.0
+    assert _p99(hedged) < 0.5
+    assert stats["hedges"] >= 10
+    assert stats["hedge_wins"] >= 10
+    assert stats["providers"][FALLBACK]["wins"] == stats["hedge_wins"]
+
+
+def test_failing_provider_is_ejected_and_requests_fail_over():
+    providers = StubProviders()
+    providers.failing.add(PRIMARY)
+    router = ModelRouter([PRIMARY, FALLBACK], completion=providers.completion, eject_after=3, eject_seconds=60)
+
+    async def run():
+        return [await router.complete(messages=[]) for _ in range(10)]
+
+    responses = asyncio.run(run())
+
+    assert {response.model for response in responses} == {FALLBACK}
+    # Three failures eject the primary; later requests go straight to the fallback
+    assert providers.calls[PRIMARY] == 3
+    stats = router.get_stats()
+    assert stats["failovers"] == 3
+    assert stats["providers"][PRIMARY]["state"] == "ejected"
+    assert stats["providers"][PRIMARY]["ejections"] == 1
+
+
+def test_scheduler_sheds_excess_load_while_providers_are_slow():
+    providers = StubProviders()
+    providers.latency = {PRIMARY: lambda call: 0.3, FALLBACK: lambda call: 0.3}
+    router = ModelRouter([PRIMARY, FALLBACK], completion=providers.completion, hedge=False)
+    scheduler = LLMScheduler(max_concurrency=2, project_max_concurrency=2, queue_max_per_project=3, queue_max_total=10, weights={})
+    service = LLMService(router=router, scheduler=scheduler)
+
+    async def run():
+        # Distinct questions, so single-flight does not merge them
+        return await asyncio.gather(
+            *(service.generate_response(f"question {i}", [], [], project_id="proj") for i in range(10)),
+            return_exceptions=True
+        )
+
+    outcomes = asyncio.run(run())
+
+    answered = [outcome for outcome in outcomes if isinstance(outcome, str)]
+    shed = [outcome for outcome in outcomes if isinstance(outcome, AdmissionRejected)]
+    # Two running and three queued; the rest are turned away instead of waiting on the brownout
+    assert len(answered) == 5
+    assert len(shed) == 5
+    assert {rejection.reason for rejection in shed} == {"queue_full"}
+    assert providers.calls[PRIMARY] == 5
@@ -0,0 +1,23 @@
+import asyncio
+import fakeredis.aioredis
+import redis.asyncio as aioredis
+from redis.asyncio.cluster import RedisCluster
+from services.session_service import SessionService
+from utils.redis_client import supports_transactions
+
+
+def test_cluster_client_has_no_transactions():
+    async def scenario():
+        # Nothing is contacted until the first command
+        cluster = RedisCluster(host="localhost", port=7000, decode_responses=True)
+        return supports_transactions(cluster), SessionService(cluster).transactional
+
+    assert asyncio.run(scenario()) == (False, False)
+
+
+def test_single_node_client_uses_transactions():
+    async def scenario():
+        fake = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        return supports_transactions(aioredis.Redis()), SessionService(fake).transactional
+
+    assert asyncio.run(scenario()) == (True, True)
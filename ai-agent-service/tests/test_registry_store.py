@@ -0,0 +1,142 @@
+import asyncio
+import json
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from pydantic import BaseModel
+from services import registry_store
+from services.registry_store import MemoryRegistryBackend, ProjectRegistry, RegistryInvalidator
+
+
+class _Record(BaseModel):
+    id: str
+    name: str
+
+
+class _Backend(MemoryRegistryBackend):
+    """Memory backend whose loads can be held open or made to fail"""
+
+    def __init__(self):
+        super().__init__()
+        self.loads = 0
+        self.gate = None
+        self.error = None
+
+    async def load(self, project_id):
+        self.loads += 1
+        if self.gate:
+            await self.gate.wait()
+        if self.error:
+            raise self.error
+        return await super().load(project_id)
+
+
+async def _registry(kind="actions", invalidator=None, **kwargs):
+    backend = _Backend()
+    await backend.save("proj", "r1", {"name": "first"})
+    return backend, ProjectRegistry(kind, _Record, backend, invalidator, **kwargs)
+
+
+async def _until(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+def test_load_overlapping_an_invalidation_is_not_cached():
+    async def scenario():
+        backend, registry = await _registry()
+        backend.gate = asyncio.Event()
+        load = asyncio.create_task(registry.get_all("proj"))
+        await _until(lambda: backend.loads == 1)
+        registry.invalidate("proj")
+        backend.gate.set()
+        records = await load
+        await registry.get_all("proj")
+        return records, backend.loads, registry.get_stats()
+
+    records, loads, stats = asyncio.run(scenario())
+    assert records["r1"].name == "first"
+    assert loads == 2
+    assert stats["hits"] == 0
+
+
+def test_expired_copy_is_served_while_the_backend_is_down():
+    async def scenario():
+        backend, registry = await _registry(ttl_seconds=0)
+        await registry.get_all("proj")
+        backend.error = ConnectionError("mongo down")
+        stale = await registry.get_all("proj")
+        with pytest.raises(ConnectionError):
+            await registry.get_all("other_proj")
+        return stale, registry.get_stats()
+
+    stale, stats = asyncio.run(scenario())
+    assert stale["r1"].name == "first"
+    assert stats["stale_served"] == 1
+    assert stats["load_errors"] == 2
+
+
+def test_own_and_unknown_messages_are_ignored():
+    async def scenario():
+        invalidator = RegistryInvalidator(None)
+        _, registry = await _registry("actions", invalidator)
+        await registry.get_all("proj")
+
+        def message(**fields):
+            return json.dumps({"kind": "actions", "project_id": "proj", "origin": "other_worker", **fields})
+
+        for ignored in [message(origin=invalidator.origin), message(kind="connections"), message(project_id=None), "not json"]:
+            invalidator._apply(ignored)
+        kept = registry.get_stats()["cached_projects"]
+        invalidator._apply(message())
+        return kept, registry.get_stats()["cached_projects"], invalidator.get_stats()["received"]
+
+    assert asyncio.run(scenario()) == (1, 0, 1)
+
+
+def test_change_on_another_worker_drops_the_cached_project():
+    async def scenario():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        reader, writer = RegistryInvalidator(redis), RegistryInvalidator(redis)
+        _, cached = await _registry("actions", reader)
+        _, writing = await _registry("actions", writer)
+        writing.backend = cached.backend
+        reader.start()
+        await _until(lambda: reader.get_stats()["listening"] and cached.get_stats()["invalidations"] == 1)
+
+        await cached.get_all("proj")
+        await writing.put("proj", "r1", _Record(id="r1", name="renamed"))
+        await _until(lambda: cached.get_stats()["cached_projects"] == 0)
+        records = await cached.get_all("proj")
+        await reader.stop()
+        return records
+
+    assert asyncio.run(scenario())["r1"].name == "renamed"
+
+
+def test_resubscribing_drops_every_cache(monkeypatch):
+    monkeypatch.setattr(registry_store, "REGISTRY_RESUBSCRIBE_SECONDS", 0.01)
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        invalidator = RegistryInvalidator(fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+        _, actions = await _registry("actions", invalidator)
+        _, connections = await _registry("connections", invalidator)
+
+        server.connected = False
+        invalidator.start()
+        await _until(lambda: invalidator.get_stats()["resubscribes"] >= 1)
+        # Changes published now are missed, so whatever is cached meanwhile may be stale
+        await actions.get_all("proj")
+        await connections.get_all("proj")
+        cached = [actions.get_stats()["cached_projects"], connections.get_stats()["cached_projects"]]
+
+        server.connected = True
+        await _until(lambda: invalidator.get_stats()["listening"] and actions.get_stats()["cached_projects"] == 0)
+        dropped = [actions.get_stats()["cached_projects"], connections.get_stats()["cached_projects"]]
+        await invalidator.stop()
+        return cached, dropped
+
+    assert asyncio.run(scenario()) == ([1, 1], [0, 0])
@@ -0,0 +1,147 @@
+from contextlib import contextmanager
+import pytest
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from models.db_connection import DatabaseConnection, ReplicaEndpoint
+from services import replica_router
+from services.database_service import DatabaseService
+from services.engine_registry import EngineCapacityError
+from services.replica_router import ReplicaRouter
+
+
+class _Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+    def mappings(self):
+        return self
+
+    def first(self):
+        return self.value
+
+
+class _Engines:
+    """Stands in for EngineRegistry: `lag` maps replica host -> what its lag query returns"""
+
+    def __init__(self, lag, down=()):
+        self.lag = lag
+        self.down = set(down)
+
+    @contextmanager
+    def connect(self, connection):
+        if connection.host in self.down:
+            raise OperationalError(None, None, Exception("connection refused"))
+        lag = self.lag[connection.host]
+
+        class _Connection:
+            def execute(self, statement):
+                return _Result(lag)
+
+        yield None, _Connection()
+
+
+def _primary(db_type="postgres", replicas=("r1", "r2"), max_lag=None):
+    return DatabaseConnection(
+        id="conn", project_id="proj", type=db_type, name="main", host="primary", port=5432,
+        username="app", encrypted_password="", database="app",
+        replicas=[ReplicaEndpoint(host=host, port=5432) for host in replicas], max_replica_lag_seconds=max_lag
+    )
+
+
+def _hosts(targets):
+    return [target.host for target in targets]
+
+
+def test_replicas_behind_the_lag_limit_are_skipped():
+    router = ReplicaRouter(_Engines({"r1": 30.0, "r2": 1.0}))
+
+    assert _hosts(router.read_targets(_primary(max_lag=5))) == ["r2", "primary"]
+    assert router.get_stats()["lagging_skips"] == 1
+
+
+def test_mysql_replica_with_stopped_replication_is_skipped():
+    engines = _Engines({
+        "r1": {"Seconds_Behind_Source": None},  # NULL: the SQL thread is stopped
+        "r2": None  # No replica status: not replicating, cannot lag
+    })
+    router = ReplicaRouter(engines)
+
+    assert _hosts(router.read_targets(_primary("mysql"))) == ["r2", "primary"]
+
+
+def test_replicas_are_used_in_turn():
+    router = ReplicaRouter(_Engines({"r1": 0.0, "r2": 0.0}))
+
+    firsts = [_hosts(router.read_targets(_primary()))[0] for _ in range(4)]
+
+    assert firsts == ["r1", "r2", "r1", "r2"]
+
+
+def test_failed_replica_is_skipped_until_the_retry_window_passes(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(replica_router.time, "monotonic", lambda: clock[0])
+    engines = _Engines({"r1": 0.0, "r2": 0.0}, down={"r2"})
+    router = ReplicaRouter(engines)
+
+    # r2 fails its lag check and is benched; r1 keeps serving
+    assert _hosts(router.read_targets(_primary())) == ["r1", "primary"]
+    assert _hosts(router.read_targets(_primary())) == ["r1", "primary"]
+
+    engines.down.clear()
+    clock[0] += replica_router.DB_REPLICA_RETRY_SECONDS + 1
+    assert sorted(_hosts(router.read_targets(_primary()))) == ["primary", "r1", "r2"]
+
+
+def test_primary_serves_reads_when_no_replica_is_usable():
+    router = ReplicaRouter(_Engines({"r1": 60.0}, down={"r2"}))
+
+    assert _hosts(router.read_targets(_primary())) == ["primary"]
+
+
+class _Service(DatabaseService):
+    """Real routing; `_execute` answers per host from `failures` instead of running SQL"""
+
+    def __init__(self, engines, failures):
+        super().__init__(engines=engines)
+        self.failures = failures
+        self.executed = []
+
+    def _execute(self, target, role, statement, params):
+        self.executed.append(target.host)
+        if target.host in self.failures:
+            raise self.failures[target.host]
+        return [{"host": target.host}]
+
+
+def _read(service, primary):
+    return service._run_query(primary, "SELECT 1", {}, True, "proj", "action")
+
+
+def test_unreachable_replica_falls_back_and_is_benched():
+    service = _Service(_Engines({"r1": 0.0}), {"r1": OperationalError(None, None, Exception("connection refused"))})
+    primary = _primary(replicas=("r1",))
+
+    assert _read(service, primary) == [{"host": "primary"}]
+    assert _read(service, primary) == [{"host": "primary"}]
+    assert service.executed == ["r1", "primary", "primary"]
+
+
+def test_query_error_on_a_replica_is_not_retried_on_the_primary():
+    error = ProgrammingError("SELECT missing_column FROM t", {}, Exception("no such column"))
+    service = _Service(_Engines({"r1": 0.0}), {"r1": error})
+
+    with pytest.raises(ProgrammingError):
+        _read(service, _primary(replicas=("r1",)))
+    assert service.executed == ["r1"]
+
+
+def test_engine_capacity_on_a_replica_does_not_bench_it():
+    service = _Service(_Engines({"r1": 0.0}), {"r1": EngineCapacityError("full")})
+    primary = _primary(replicas=("r1",))
+
+    assert _read(service, primary) == [{"host": "primary"}]
+    del service.failures["r1"]
+    assert _read(service, primary) == [{"host": "r1"}]
+    assert service.replicas.get_stats()["failures"] == 0
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import fakeredis.aioredis
+from services.session_service import MAX_HISTORY_MESSAGES, SessionService
+
+
+def _turn(i: int):
+    return [{"role": "user", "content": f"question {i}"}, {"role": "assistant", "content": f"answer {i}"}]
+
+
+def _run(scenario):
+    async def run():
+        return await scenario(SessionService(fakeredis.aioredis.FakeRedis(decode_responses=True)))
+    return asyncio.run(run())
+
+
+def test_fold_removes_only_the_summarized_messages():
+    async def scenario(sessions):
+        for i in range(3):
+            await sessions.append_messages("proj", "s1", _turn(i))
+        history, _ = await sessions.get_history_with_summary("proj", "s1")
+        await sessions.append_messages("proj", "s1", _turn(3))
+
+        trimmed = await sessions.compact_history("proj", "s1", "summary", history[:4])
+        return trimmed, await sessions.get_history_with_summary("proj", "s1")
+
+    trimmed, (history, summary) = _run(scenario)
+    assert trimmed == 4
+    assert history == _turn(2) + _turn(3)
+    assert summary == "summary"
+
+
+def test_fold_after_the_cap_moved_the_head_keeps_unsummarized_messages():
+    async def scenario(sessions):
+        sessions.max_messages = 6
+        for i in range(3):
+            await sessions.append_messages("proj", "s1", _turn(i))
+        history, _ = await sessions.get_history_with_summary("proj", "s1")
+        # While the summary is generated a new turn pushes the two oldest messages out
+        await sessions.append_messages("proj", "s1", _turn(3))
+
+        trimmed = await sessions.compact_history("proj", "s1", "summary", history[:4])
+        return trimmed, await sessions.get_conversation_history("proj", "s1")
+
+    trimmed, history = _run(scenario)
+    # Only turn 1 was still there to fold; turn 2 was never summarized and stays
+    assert trimmed == 2
+    assert history == _turn(2) + _turn(3)
+
+
+def test_second_fold_of_the_same_messages_trims_nothing():
+    async def scenario(sessions):
+        for i in range(3):
+            await sessions.append_messages("proj", "s1", _turn(i))
+        history, _ = await sessions.get_history_with_summary("proj", "s1")
+        first = await sessions.compact_history("proj", "s1", "summary", history[:4])
+        second = await sessions.compact_history("proj", "s1", "summary", history[:4])
+        return first, second, await sessions.get_conversation_history("proj", "s1")
+
+    first, second, history = _run(scenario)
+    assert (first, second) == (4, 0)
+    assert history == _turn(2)
+
+
+def test_compact_lock_is_held_by_one_worker_at_a_time():
+    async def scenario(sessions):
+        acquired = [await sessions.acquire_compact_lock("proj", "s1") for _ in range(2)]
+        await sessions.release_compact_lock("proj", "s1")
+        acquired.append(await sessions.acquire_compact_lock("proj", "s1"))
+        return acquired
+
+    assert _run(scenario) == [True, False, True]
+
+
+def test_legacy_json_history_becomes_a_list_on_first_read():
+    async def scenario(sessions):
+        key = sessions.get_session_key("proj", "s1")
+        await sessions.redis_client.set(key, json.dumps(_turn(0) + _turn(1)))
+        history = await sessions.get_conversation_history("proj", "s1", limit=2)
+        return history, await sessions.redis_client.type(key), await sessions.redis_client.ttl(key)
+
+    history, key_type, ttl = _run(scenario)
+    assert history == _turn(1)
+    assert key_type == "list"
+    assert ttl > 0
+
+
+def test_legacy_json_history_is_converted_before_appending():
+    async def scenario(sessions):
+        await sessions.redis_client.set(sessions.get_session_key("proj", "s1"), json.dumps(_turn(0)))
+        await sessions.append_messages("proj", "s1", _turn(1))
+        return await sessions.get_history_with_summary("proj", "s1")
+
+    assert _run(scenario) == (_turn(0) + _turn(1), None)
+
+
+def test_legacy_json_history_is_read_through_the_pipelined_path():
+    async def scenario(sessions):
+        await sessions.redis_client.set(sessions.get_session_key("proj", "s1"), json.dumps(_turn(0)))
+        return await sessions.get_history_with_summary("proj", "s1")
+
+    assert _run(scenario) == (_turn(0), None)
+
+
+def test_history_keeps_only_the_newest_messages():
+    turns = MAX_HISTORY_MESSAGES // 2 + 5
+
+    async def scenario(sessions):
+        for i in range(turns):
+            await sessions.add_turn("proj", "s1", f"question {i}", f"answer {i}")
+        return await sessions.get_conversation_history("proj", "s1")
+
+    history = _run(scenario)
+    assert len(history) == MAX_HISTORY_MESSAGES
+    assert history[-2:] == _turn(turns - 1)
+    assert history[0] == {"role": "user", "content": f"question {turns - MAX_HISTORY_MESSAGES // 2}"}
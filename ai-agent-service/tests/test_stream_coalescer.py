@@ -0,0 +1,45 @@
+import asyncio
+from utils.stream_coalescer import STREAM_COALESCE_INTERVAL_MS, STREAM_COALESCE_MAX_CHARS, coalesce_stream
+
+
+async def _deltas(pieces, first_gap=0.0, gap=0.0):
+    for n, piece in enumerate(pieces):
+        yield piece
+        await asyncio.sleep(first_gap if n == 0 else gap)
+
+
+async def _collect(stream):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    return [(piece, loop.time() - start) async for piece in stream]
+
+
+def test_first_delta_is_sent_immediately():
+    out = asyncio.run(_collect(coalesce_stream(_deltas(["Hel", "lo"], first_gap=0.3))))
+
+    assert [piece for piece, _ in out] == ["Hel", "lo"]
+    assert out[0][1] < 0.1
+
+
+def test_deltas_are_merged_up_to_the_size_limit():
+    assert STREAM_COALESCE_MAX_CHARS == 256
+    pieces = asyncio.run(_collect(coalesce_stream(_deltas(["abcd"] * 200), interval_ms=60_000)))
+    pieces = [piece for piece, _ in pieces]
+
+    assert pieces[0] == "abcd"
+    assert "".join(pieces) == "abcd" * 200
+    assert all(len(piece) == 256 for piece in pieces[1:-1])
+    assert len(pieces[-1]) <= 256
+
+
+def test_deltas_are_flushed_after_the_interval():
+    assert STREAM_COALESCE_INTERVAL_MS == 40
+    # 20 one-character deltas 10 ms apart: far below the size limit, so only the
+    # interval splits them (roughly four deltas per piece)
+    out = asyncio.run(_collect(coalesce_stream(_deltas(["x"] * 20, gap=0.01))))
+    pieces = [piece for piece, _ in out]
+
+    assert pieces[0] == "x"
+    assert "".join(pieces) == "x" * 20
+    assert 3 <= len(pieces) <= 12
+    assert max(len(piece) for piece in pieces) < 20
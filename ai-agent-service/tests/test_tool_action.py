@@ -0,0 +1,23 @@
+import pytest
+from pydantic import ValidationError
+from models.tool_action import CreateAgentActionRequest
+
+
+def _request(**kwargs):
+    return CreateAgentActionRequest(name="store_hours", description="Opening hours", sql_query="SELECT 1", **kwargs)
+
+
+@pytest.mark.parametrize("ttl", [0, -5])
+def test_cache_ttl_below_one_second_is_rejected(ttl):
+    with pytest.raises(ValidationError, match="at least 1"):
+        _request(read_only=True, cache_ttl_seconds=ttl)
+
+
+def test_cache_ttl_needs_a_read_only_action():
+    with pytest.raises(ValidationError, match="read-only"):
+        _request(cache_ttl_seconds=60)
+
+
+def test_caching_is_optional():
+    assert _request(read_only=True, cache_ttl_seconds=1).cache_ttl_seconds == 1
+    assert _request(read_only=True).cache_ttl_seconds is None
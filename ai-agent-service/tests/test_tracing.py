@@ -0,0 +1,73 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from utils import tracing
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+@pytest.fixture(scope="module")
+def spans():
+    # The global tracer provider can only be installed once per process
+    tracing.setup_tracing("ai-agent-service", exporter="memory")
+    return tracing.get_memory_exporter()
+
+
+@pytest.fixture
+def client(spans):
+    spans.clear()
+    app = FastAPI()
+    app.add_middleware(tracing.TracingMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        with tracing.tracer.start_as_current_span("kb.query"):
+            return {"outgoing": tracing.inject_headers()}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    return TestClient(app)
+
+
+def _server_spans(spans):
+    """Spans from TracingMiddleware; newer FastAPI releases add their own spans too"""
+    return [span for span in spans.get_finished_spans() if "http.target" in (span.attributes or {})]
+
+
+def _ancestors(span, spans):
+    by_id = {finished.context.span_id: finished for finished in spans.get_finished_spans()}
+    while span.parent and span.parent.span_id in by_id:
+        span = by_id[span.parent.span_id]
+        yield span
+
+
+def test_server_span_continues_the_callers_trace(client, spans):
+    response = client.get("/items/42", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+
+    assert response.status_code == 200
+    assert response.headers["x-trace-id"] == TRACE_ID
+    finished = {span.name: span for span in spans.get_finished_spans()}
+    [server] = _server_spans(spans)
+    assert server.name == "GET /items/{item_id}"
+    assert server.context.trace_id == int(TRACE_ID, 16)
+    assert server.parent.span_id == int(PARENT_ID, 16)
+    assert server.attributes["http.route"] == "/items/{item_id}"
+    assert server.attributes["http.target"] == "/items/42"
+    assert server.attributes["http.status_code"] == 200
+    assert server in _ancestors(finished["kb.query"], spans)
+
+
+def test_outgoing_traceparent_names_the_current_span(client, spans):
+    outgoing = client.get("/items/42", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"}).json()["outgoing"]
+
+    child = next(span for span in spans.get_finished_spans() if span.name == "kb.query")
+    assert outgoing["traceparent"] == f"00-{TRACE_ID}-{child.context.span_id:016x}-01"
+
+
+def test_health_checks_are_not_traced(client, spans):
+    client.get("/health")
+
+    assert _server_spans(spans) == []
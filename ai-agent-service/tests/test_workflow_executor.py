@@ -0,0 +1,156 @@
+import asyncio
+from services.workflow_executor import WorkflowExecutor
+from services.workflow_graph import compile_workflow
+
+
+def _chain(*nodes, variables=None):
+    """Workflow running start -> nodes... in a straight line"""
+    definition = {
+        "nodes": [{"id": "start", "type": "start", "data": {}}] + list(nodes),
+        "edges": [],
+        "variables": variables or {}
+    }
+    ids = [n["id"] for n in definition["nodes"]]
+    definition["edges"] = [{"id": f"e{i}", "source": a, "target": b} for i, (a, b) in enumerate(zip(ids, ids[1:]))]
+    return compile_workflow(definition)
+
+
+def _message(node_id, text):
+    return {"id": node_id, "type": "message", "data": {"message": text}}
+
+
+def _turn(workflow, state):
+    executor = WorkflowExecutor(workflow, session_id="sess_test", project_id="proj_test")
+    executor.load_state(state)
+    result = asyncio.run(executor.run_until_input())
+    return result, executor.get_state()
+
+
+def test_first_server_turn_starts_with_declared_variables():
+    workflow = _chain(_message("greet", "Hello {{name}}, plan {{plan}}"), variables={"name": "Ada", "plan": "free"})
+
+    result, state = _turn(workflow, {"variables": {"plan": "pro"}, "userInput": "hi"})
+
+    assert result.messages == ["Hello Ada, plan pro"]
+    assert result.is_complete
+    assert state["variables"] == {"name": "Ada", "plan": "pro"}
+    assert state["executionHistory"] == ["start", "greet"]
+
+
+def test_step_budget_pauses_and_the_next_turn_resumes():
+    workflow = _chain(_message("one", "1"), _message("two", "2"), _message("three", "3"))
+    executor = WorkflowExecutor(workflow, session_id="sess_test", project_id="proj_test")
+    executor.load_state({"userInput": "go"})
+
+    paused = asyncio.run(executor.run_until_input(max_steps=2))
+    assert paused.messages == ["1"]
+    assert paused.next_node_id == "two"
+    assert not paused.is_complete and not paused.requires_input
+
+    resumed, state = _turn(workflow, {**executor.get_state(), "userInput": None})
+    assert resumed.messages == ["2", "3"]
+    assert resumed.is_complete
+    assert state["executionHistory"] == ["start", "one", "two", "three"]
+
+
+def test_input_node_waits_then_consumes_the_next_message():
+    workflow = _chain(
+        {"id": "ask", "type": "user-input", "data": {"prompt": "Your name?"}},
+        {"id": "save", "type": "variable-set", "data": {"variableName": "name", "value": "{{input}}", "valueType": "template"}},
+        _message("greet", "Hi {{name}}")
+    )
+
+    asked, state = _turn(workflow, {"userInput": "hello"})
+    assert asked.messages == ["Your name?"]
+    assert asked.requires_input
+    assert state["currentNodeId"] == "ask"
+
+    answered, state = _turn(workflow, {**state, "userInput": "Bob"})
+    assert answered.messages == ["Hi Bob"]
+    assert answered.is_complete
+    assert state["variables"]["name"] == "Bob"
+
+
+class _DelayedLLM:
+    """Answers an AI Agent node with its prompt after `delays[prompt]` seconds"""
+
+    def __init__(self, delays):
+        self.delays = delays
+
+    async def generate_response(self, query, **kwargs):
+        await asyncio.sleep(self.delays.get(query, 0))
+        return query
+
+
+def _agent(node_id, prompt):
+    return {"id": node_id, "type": "ai-agent", "data": {"prompt": prompt, "useKnowledgeBase": False}}
+
+
+def _set(node_id, name, value):
+    return {"id": node_id, "type": "variable-set", "data": {"variableName": name, "value": value, "valueType": "template"}}
+
+
+def _parallel(*branches, timeout_ms=None, variables=None):
+    """start -> parallel -> each branch (a list of nodes) -> join -> after"""
+    nodes = [
+        {"id": "start", "type": "start", "data": {}},
+        {"id": "fork", "type": "parallel", "data": {"branchTimeoutMs": timeout_ms}},
+        {"id": "join", "type": "join", "data": {}},
+        _message("after", "joined")
+    ]
+    edges = [("start", "fork"), ("join", "after")]
+    for branch in branches:
+        nodes.extend(branch)
+        ids = ["fork"] + [n["id"] for n in branch] + ["join"]
+        edges.extend(zip(ids, ids[1:]))
+    return compile_workflow({
+        "nodes": nodes,
+        "edges": [{"id": f"e{i}", "source": a, "target": b} for i, (a, b) in enumerate(edges)],
+        "variables": variables or {}
+    })
+
+
+def _run_parallel(workflow, delays):
+    executor = WorkflowExecutor(workflow, session_id="sess_test", project_id="proj_test", llm_service=_DelayedLLM(delays))
+    executor.load_state({"userInput": "go"})
+    result = asyncio.run(executor.run_until_input())
+    return result, executor.get_state()
+
+
+def test_timed_out_branch_is_dropped_while_the_others_merge():
+    workflow = _parallel(
+        [_agent("slow_reply", "slow"), _set("slow_set", "slow", "yes")],
+        [_agent("fast_reply", "fast"), _set("fast_set", "fast", "yes")],
+        timeout_ms=200
+    )
+
+    result, state = _run_parallel(workflow, {"slow": 5})
+
+    assert result.messages == ["fast", "joined"]
+    assert result.is_complete
+    assert state["variables"] == {"fast": "yes"}
+
+
+def test_branches_do_not_see_each_others_writes():
+    workflow = _parallel(
+        [_set("claim", "owner", "first")],
+        [_agent("wait", "wait"), _message("report", "owner={{owner}}")],
+        variables={"owner": "nobody"}
+    )
+
+    result, state = _run_parallel(workflow, {"wait": 0.05})
+
+    assert result.messages == ["wait", "owner=nobody", "joined"]
+    assert state["variables"]["owner"] == "first"
+
+
+def test_conflicting_writes_merge_in_edge_order_not_completion_order():
+    workflow = _parallel(
+        [_agent("late", "late"), _set("late_set", "winner", "first edge")],
+        [_set("early_set", "winner", "second edge")]
+    )
+
+    result, state = _run_parallel(workflow, {"late": 0.05})
+
+    assert result.messages == ["late", "joined"]
+    assert state["variables"]["winner"] == "second edge"
@@ -0,0 +1,46 @@
+import asyncio
+import fakeredis.aioredis
+from services.workflow_graph import WorkflowGraphCache
+from services.workflow_service import WORKFLOW_DEFINITION_TTL, WorkflowService
+
+WORKFLOW = {
+    "nodes": [
+        {"id": "start", "type": "start", "data": {}},
+        {"id": "reply", "type": "message", "data": {"message": "Hello"}}
+    ],
+    "edges": [{"id": "e1", "source": "start", "target": "reply"}]
+}
+
+
+def _workers():
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    return redis, WorkflowService(redis), WorkflowService(redis, WorkflowGraphCache())
+
+
+def test_hash_resolves_on_another_worker_only_within_its_project():
+    async def scenario():
+        _, first, second = _workers()
+        compiled = await first.resolve_workflow("proj_a", definition=WORKFLOW)
+        return (
+            compiled.hash,
+            await second.resolve_workflow("proj_a", workflow_hash=compiled.hash),
+            await second.resolve_workflow("proj_b", workflow_hash=compiled.hash),
+            await first.resolve_workflow("proj_b", workflow_hash=compiled.hash)
+        )
+
+    workflow_hash, same_project, other_project, other_project_local = asyncio.run(scenario())
+    assert same_project.hash == workflow_hash
+    assert other_project is None
+    assert other_project_local is None
+
+
+def test_local_cache_hit_refreshes_the_shared_definition():
+    async def scenario():
+        redis, worker, _ = _workers()
+        compiled = await worker.resolve_workflow("proj_a", definition=WORKFLOW)
+        key = f"workflow_def:proj_a:{compiled.hash}"
+        await redis.expire(key, 60)
+        await worker.resolve_workflow("proj_a", workflow_hash=compiled.hash)
+        return await redis.ttl(key)
+
+    assert asyncio.run(scenario()) > WORKFLOW_DEFINITION_TTL - 60
@@ -1,7 +1,10 @@
 from cryptography.fernet import Fernet
+import logging
 import os
 import base64
 
+logger = logging.getLogger(__name__)
+
 # Generate a key if not present (In production, use a consistent key from env)
 # For this MVP, we will try to load from ENV, or generate one in memory (warn: memory key is lost on restart)
 _ENV_KEY = os.getenv("ENCRYPTION_KEY")
@@ -9,7 +12,7 @@ _ENV_KEY = os.getenv("ENCRYPTION_KEY")
 if not _ENV_KEY:
     # Generate a fallback key for development/demo purposes if environment var is missing
     # In a real deployed service, this MUST be persistent, otherwise we can't decrypt saved passwords
-    print("WARNING: ENCRYPTION_KEY not found in environment. Using ephemeral key.")
+    logger.warning("ENCRYPTION_KEY not found in environment. Using ephemeral key.")
     _KEY = Fernet.generate_key()
 else:
     _KEY = _ENV_KEY.encode() if isinstance(_ENV_KEY, str) else _ENV_KEY
@@ -31,5 +34,5 @@ def decrypt_value(ciphertext: str) -> str:
         decrypted_bytes = cipher_suite.decrypt(ciphertext.encode('utf-8'))
         return decrypted_bytes.decode('utf-8')
     except Exception as e:
-        print(f"Decryption error: {e}")
+        logger.warning("Decryption error: %s", e)
         return ""
@@ -0,0 +1,69 @@
+"""
+Minimal JSONPath for extracting values from API responses
+Supports $, .key, ['key'], [index] (negative allowed) and [*]
+"""
+
+from typing import Any, List, Union
+import re
+
+_TOKEN_PATTERN = re.compile(r"""\.([A-Za-z_][\w-]*)|\[\s*(-?\d+)\s*\]|\[\s*['"]([^'"]*)['"]\s*\]|\[\s*\*\s*\]|\.\*""")
+
+_WILDCARD = object()
+
+
+class JSONPathError(ValueError):
+    """Raised for expressions outside the supported subset"""
+
+
+def parse_path(path: str) -> List[Union[str, int, object]]:
+    """Split a JSONPath expression into keys, indexes and wildcards"""
+    path = path.strip()
+    if not path.startswith("$"):
+        path = "$." + path
+
+    tokens: List[Union[str, int, object]] = []
+    position = 1
+    while position < len(path):
+        match = _TOKEN_PATTERN.match(path, position)
+        if not match:
+            raise JSONPathError(f"Unsupported JSONPath near '{path[position:]}'")
+
+        key, index, quoted = match.groups()
+        if key is not None:
+            tokens.append(key)
+        elif index is not None:
+            tokens.append(int(index))
+        elif quoted is not None:
+            tokens.append(quoted)
+        else:
+            tokens.append(_WILDCARD)
+        position = match.end()
+
+    return tokens
+
+
+def extract(data: Any, path: str) -> Any:
+    """
+    Return the value at `path`, or None when it does not exist.
+    A wildcard anywhere in the path makes the result a list of matches.
+    """
+    tokens = parse_path(path)
+    matches = [data]
+    for token in tokens:
+        next_matches = []
+        for value in matches:
+            if token is _WILDCARD:
+                if isinstance(value, list):
+                    next_matches.extend(value)
+                elif isinstance(value, dict):
+                    next_matches.extend(value.values())
+            elif isinstance(token, int):
+                if isinstance(value, list) and -len(value) <= token < len(value):
+                    next_matches.append(value[token])
+            elif isinstance(value, dict) and token in value:
+                next_matches.append(value[token])
+        matches = next_matches
+
+    if any(token is _WILDCARD for token in tokens):
+        return matches
+    return matches[0] if matches else None
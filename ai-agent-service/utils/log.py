@@ -0,0 +1,197 @@
+# Copy of knowledge-base-service/services/log.py with its own defaults (see "Shared Modules" in the README)
+"""
+Structured logging
+Modules log with `logging.getLogger(__name__)`; records become JSON (or text)
+lines written by a background thread, so the request path only pays for a level
+check and, for records that pass it, a put on a bounded queue. INFO and DEBUG
+lines can be sampled per route with LOG_SAMPLE_RATES (decided once per request,
+so a kept request is kept whole); warnings and errors are always written.
+Never log message content, prompts or tool arguments: log sizes and ids.
+"""
+
+from typing import Dict, Optional, Iterable
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from opentelemetry import trace
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json or text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Records waiting for the writer; extra ones are dropped
+# Fraction of requests whose INFO/DEBUG lines are kept, by path prefix, e.g. "/chat=0.1,/ws=0.05"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+# Third-party libraries (httpx, litellm, ...) only get through at this level
+LOG_LIBRARY_LEVEL = os.getenv("LOG_LIBRARY_LEVEL", "WARNING").upper()
+
+_route: ContextVar[Optional[str]] = ContextVar("log_route", default=None)
+_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_handler: Optional["DroppingQueueHandler"] = None
+
+
+def _parse_sample_rates(raw: str) -> Dict[str, float]:
+    rates = {}
+    for item in raw.split(","):
+        prefix, _, rate = item.partition("=")
+        if prefix.strip() and rate.strip():
+            rates[prefix.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+_sample_rates = _parse_sample_rates(LOG_SAMPLE_RATES)
+
+
+def sample_rate(path: str) -> float:
+    """Rate of the longest configured prefix of `path` (1.0 when none matches)"""
+    best = None
+    for prefix in _sample_rates:
+        if path.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return 1.0 if best is None else _sample_rates[best]
+
+
+class ContextFilter(logging.Filter):
+    """
+    Runs in the caller: drops unsampled INFO/DEBUG records and stamps the
+    rest with the route and trace id, which only exist in the caller's context
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and not _sampled.get():
+            return False
+        record.route = _route.get()
+        span_context = trace.get_current_span().get_span_context()
+        record.trace_id = format(span_context.trace_id, "032x") if span_context.is_valid else None
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the writer falls behind, records are counted and dropped"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message while its arguments are still what they were; the
+        # rest of the formatting happens on the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict:
+    return {
+        key: value for key, value in vars(record).items()
+        if key not in _RECORD_ATTRIBUTES and value is not None
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service_name: str):
+        super().__init__()
+        self.service_name = service_name
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service_name,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **_extra_fields(record)
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local development: extras are appended as key=value"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in _extra_fields(record).items())
+        return f"{line} {fields}" if fields else line
+
+
+def setup_logging(service_name: str, packages: Iterable[str] = ("main", "services", "utils")):
+    """
+    Route all logging through one queue and writer thread. `packages` are this
+    service's top-level modules, logged at LOG_LEVEL; everything else at
+    LOG_LIBRARY_LEVEL. Safe to call more than once.
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter(service_name))
+
+    _handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _handler.addFilter(ContextFilter())
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LIBRARY_LEVEL)
+    for package in packages:
+        logging.getLogger(package).setLevel(LOG_LEVEL)
+
+
+def shutdown_logging():
+    """Flush queued records; called on shutdown and at exit"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler else 0
+
+
+class LogContextMiddleware:
+    """Plain ASGI middleware that sets the route and the per-request sampling decision"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        rate = sample_rate(path)
+        route_token = _route.set(path)
+        sampled_token = _sampled.set(rate >= 1.0 or random.random() < rate)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _sampled.reset(sampled_token)
+            _route.reset(route_token)
@@ -0,0 +1,197 @@
+# project_label() and render_metrics() are copied in knowledge-base-service/services/metrics.py (see "Shared Modules" in the README)
+"""
+Prometheus metrics
+Per-stage latency for chat turns, LLM attempts and tokens, Redis operations,
+tool calls and customer database pools. Project ids are used as labels only for the first
+METRICS_MAX_PROJECTS projects seen (or an explicit allowlist); everything else
+is reported as "other", so series counts stay bounded.
+"""
+
+from typing import Dict, Optional
+from contextlib import contextmanager
+import functools
+import os
+import time
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess
+)
+from utils.tracing import tracer, annotate_span
+
+METRICS_MAX_PROJECTS = int(os.getenv("METRICS_MAX_PROJECTS", "50"))
+# Comma-separated project ids to label; when set, only these get their own series
+METRICS_PROJECTS = {p.strip() for p in os.getenv("METRICS_PROJECTS", "").split(",") if p.strip()}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Chat turn stages as recorded in ChatContext.timings, mapped to metric stage names
+_STAGE_NAMES = {
+    "history": "history",
+    "kb": "kb",
+    "tools": "tools",
+    "pre_llm": "pre_llm",
+    "first_token": "llm_ttft",
+    "llm": "llm_total",
+    "workflow": "workflow"
+}
+
+CHAT_REQUESTS = Counter(
+    "chat_requests_total", "Chat turns by endpoint, project and outcome",
+    ["endpoint", "project", "outcome"]
+)
+CHAT_REQUEST_SECONDS = Histogram(
+    "chat_request_seconds", "End-to-end chat turn latency",
+    ["endpoint", "project"], buckets=LATENCY_BUCKETS
+)
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_seconds", "Latency of each stage of a chat turn",
+    ["endpoint", "stage"], buckets=LATENCY_BUCKETS
+)
+CHAT_DEGRADED = Counter(
+    "chat_degraded_total", "Pre-LLM stages skipped after a timeout or error",
+    ["stage"]
+)
+LLM_ATTEMPT_SECONDS = Histogram(
+    "llm_attempt_seconds", "Provider attempt latency (full response, or first chunk for streams)",
+    ["model", "kind", "outcome"], buckets=LATENCY_BUCKETS
+)
+LLM_HEDGES = Counter("llm_hedges_total", "Hedged second requests sent", ["model"])
+LLM_FAILOVERS = Counter("llm_failovers_total", "Attempts started after another provider failed", ["model"])
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Prompt and completion tokens",
+    ["project", "direction"]
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "llm_queue_seconds", "Time an LLM call waited for an admission slot",
+    buckets=LATENCY_BUCKETS
+)
+LLM_REJECTED = Counter("llm_admission_rejected_total", "LLM calls rejected with 429", ["project", "reason"])
+REDIS_OP_SECONDS = Histogram(
+    "redis_operation_seconds", "Latency of Redis-backed state operations",
+    ["operation", "outcome"], buckets=FAST_BUCKETS
+)
+TOOL_CALLS = Counter("tool_calls_total", "Tool calls by action type and outcome", ["action_type", "outcome"])
+TOOL_SECONDS = Histogram(
+    "tool_execution_seconds", "Latency of tool actions that ran (cache misses)",
+    ["action_type"], buckets=LATENCY_BUCKETS
+)
+DB_ENGINE_LOOKUPS = Counter("db_engine_lookups_total", "Customer database engine cache lookups", ["result"])
+DB_ENGINE_EVICTIONS = Counter("db_engine_evictions_total", "Customer database engines disposed", ["reason"])
+DB_ENGINES = Gauge("db_engines", "Customer database engines held", multiprocess_mode="livesum")
+DB_POOL_CAPACITY = Gauge(
+    "db_pool_capacity_connections", "Pooled connections the held engines may open (pool_size + max_overflow)",
+    multiprocess_mode="livesum"
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Wait for a pooled connection, including opening and pinging it",
+    ["outcome"], buckets=FAST_BUCKETS + (2.5, 5.0, 10.0)
+)
+DB_POOL_CONNECTS = Counter("db_pool_connects_total", "New connections opened to customer databases (pool misses)")
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "SQL action queries, by where they ran (primary or replica)",
+    ["target", "outcome"], buckets=LATENCY_BUCKETS
+)
+
+_labelled_projects = set()
+
+
+def project_label(project_id: Optional[str]) -> str:
+    """Project id as a metric label, or "other" once the label budget is used up"""
+    if not project_id:
+        return "none"
+    if METRICS_PROJECTS:
+        return project_id if project_id in METRICS_PROJECTS else "other"
+    if project_id in _labelled_projects:
+        return project_id
+    if len(_labelled_projects) < METRICS_MAX_PROJECTS:
+        _labelled_projects.add(project_id)
+        return project_id
+    return "other"
+
+
+def record_chat_turn(
+    endpoint: str,
+    project_id: str,
+    elapsed_seconds: float,
+    timings: Optional[Dict[str, float]] = None,
+    degraded: Optional[list] = None,
+    outcome: str = "ok"
+):
+    """Record one chat turn; `timings` are the millisecond stage timings returned to clients"""
+    project = project_label(project_id)
+    # The same timings go on the current span, so a slow trace shows where its time went
+    annotate_span("chat.timing_ms", timings or {})
+    annotate_span("chat", {"endpoint": endpoint, "outcome": outcome, "project_id": project_id})
+    CHAT_REQUESTS.labels(endpoint, project, outcome).inc()
+    CHAT_REQUEST_SECONDS.labels(endpoint, project).observe(elapsed_seconds)
+    for stage, ms in (timings or {}).items():
+        name = _STAGE_NAMES.get(stage)
+        if name:
+            CHAT_STAGE_SECONDS.labels(endpoint, name).observe(ms / 1000)
+    for stage in degraded or []:
+        CHAT_DEGRADED.labels(stage).inc()
+
+
+def record_tokens(project_id: Optional[str], prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+    project = project_label(project_id)
+    if prompt_tokens:
+        LLM_TOKENS.labels(project, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(project, "completion").inc(completion_tokens)
+
+
+def record_usage(project_id: Optional[str], response) -> None:
+    """Record token usage reported on a litellm response, if any"""
+    usage = getattr(response, "usage", None)
+    if usage:
+        record_tokens(project_id, getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+
+
+def observe_redis(operation: str):
+    """Decorator timing (and tracing) an async method that talks to Redis"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "ok"
+            with tracer.start_as_current_span(f"redis.{operation}"):
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception:
+                    outcome = "error"
+                    raise
+                finally:
+                    REDIS_OP_SECONDS.labels(operation, outcome).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def observe_tool(action_type: str):
+    """Time a tool action; the caller sets the outcome via the yielded dict"""
+    result = {"outcome": "ok"}
+    started = time.perf_counter()
+    try:
+        yield result
+    except Exception:
+        result["outcome"] = "error"
+        raise
+    finally:
+        TOOL_SECONDS.labels(action_type).observe(time.perf_counter() - started)
+        TOOL_CALLS.labels(action_type, result["outcome"]).inc()
+
+
+def render_metrics():
+    """(body, content type) for /metrics; aggregates workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,37 @@
+import logging
+import os
+from typing import Optional
+from pymongo import MongoClient
+from pymongo.database import Database
+
+logger = logging.getLogger(__name__)
+
+# Same variable as the Knowledge Base Service; this service keeps its records in its own database
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://mongo:27017")
+MONGO_DB = os.getenv("AGENT_MONGO_DB", "makkn_agent")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "20"))
+# Fail fast when MongoDB is unreachable instead of pymongo's 30s default
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "2000"))
+
+_client: Optional[MongoClient] = None
+
+
+def get_mongo_db() -> Database:
+    """Shared database handle for the process; connections are opened lazily."""
+    global _client
+    if _client is None:
+        _client = MongoClient(
+            MONGO_URL,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_TIMEOUT_MS
+        )
+    return _client[MONGO_DB]
+
+
+def close_mongo_client():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
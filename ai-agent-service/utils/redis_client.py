@@ -0,0 +1,101 @@
+import logging
+import redis.asyncio as aioredis
+from redis.asyncio.cluster import RedisCluster
+from redis.asyncio.sentinel import Sentinel
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+from typing import Optional, Union
+import os
+
+logger = logging.getLogger(__name__)
+
+# Single source of Redis configuration for every state service.
+# REDIS_URL wins; REDIS_HOST/REDIS_PORT are kept for older deployments.
+REDIS_URL = os.getenv("REDIS_URL") or f"redis://{os.getenv('REDIS_HOST', 'redis')}:{os.getenv('REDIS_PORT', '6379')}/0"
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))  # Wait for a free connection
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", "2"))
+
+# Optional topologies: "host:port,host:port" for Sentinel, or REDIS_CLUSTER=true
+REDIS_SENTINELS = os.getenv("REDIS_SENTINELS", "")
+REDIS_SENTINEL_MASTER = os.getenv("REDIS_SENTINEL_MASTER", "mymaster")
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "false").lower() == "true"
+
+RedisClient = Union[aioredis.Redis, RedisCluster]
+
+_client: Optional[RedisClient] = None
+
+
+def _common_options() -> dict:
+    return {
+        "decode_responses": True,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+        "retry": Retry(ExponentialBackoff(cap=1, base=0.05), REDIS_RETRIES),
+        "retry_on_error": [ConnectionError, TimeoutError],
+    }
+
+
+def create_redis_client() -> RedisClient:
+    """Build an async Redis client with a bounded connection pool."""
+    if REDIS_CLUSTER:
+        return RedisCluster.from_url(
+            REDIS_URL,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            **_common_options()
+        )
+
+    if REDIS_SENTINELS:
+        sentinels = []
+        for address in REDIS_SENTINELS.split(","):
+            host, _, port = address.strip().partition(":")
+            sentinels.append((host, int(port or 26379)))
+
+        sentinel = Sentinel(sentinels, socket_timeout=REDIS_SOCKET_TIMEOUT)
+        return sentinel.master_for(
+            REDIS_SENTINEL_MASTER,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+            **_common_options()
+        )
+
+    pool = aioredis.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        **_common_options()
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+
+def get_redis_client() -> RedisClient:
+    """Shared client for the process; connections are opened lazily."""
+    global _client
+    if _client is None:
+        _client = create_redis_client()
+    return _client
+
+
+def supports_transactions(client: RedisClient) -> bool:
+    """Cluster pipelines cannot use MULTI/EXEC; they fall back to plain pipelining."""
+    return not isinstance(client, RedisCluster)
+
+
+async def ping_redis() -> bool:
+    try:
+        return bool(await get_redis_client().ping())
+    except Exception as e:
+        logger.warning("Redis health check failed: %s", e)
+        return False
+
+
+async def close_redis_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,138 @@
+# Copy of knowledge-base-service/services/single_flight.py, plus SingleFlightStream (see "Shared Modules" in the README)
+import asyncio
+import hashlib
+import json
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def flight_key(*parts: Any) -> str:
+    """
+    Key for deduplicating identical work. Strings are whitespace-collapsed and
+    case-folded so trivially different spellings of a question share a flight.
+    """
+    def normalize(part: Any) -> Any:
+        if isinstance(part, str):
+            return " ".join(part.split()).casefold()
+        return part
+
+    encoded = json.dumps([normalize(part) for part in parts], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Concurrent callers with the same key await one shared computation.
+    The computation runs as its own task, so one caller going away does not
+    fail the others; it is cancelled only when every caller has gone.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self._stats["leaders"] += 1
+        else:
+            self._stats["followers"] += 1
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            remaining = self._waiters.pop(task, 1) - 1
+            if remaining > 0:
+                self._waiters[task] = remaining
+            elif not task.done():
+                task.cancel()
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            task.exception()  # Mark retrieved when every caller has already left
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self._stats, "in_flight": len(self._flights)}
+
+
+class _Broadcast:
+    """One upstream stream replayed to every subscriber, late joiners included"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self):
+        await self._changed.wait()
+
+
+class SingleFlightStream:
+    """Fan out one upstream async stream to all concurrent subscribers with the same key"""
+
+    def __init__(self):
+        self._broadcasts: Dict[str, _Broadcast] = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    async def subscribe(self, key: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        broadcast = self._broadcasts.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._broadcasts[key] = broadcast
+            broadcast.task = asyncio.create_task(self._pump(key, broadcast, fn))
+            self._stats["leaders"] += 1
+        else:
+            self._stats["followers"] += 1
+
+        broadcast.subscribers += 1
+        position = 0
+        try:
+            while True:
+                if position < len(broadcast.chunks):
+                    chunk = broadcast.chunks[position]
+                    position += 1
+                    yield chunk
+                elif broadcast.done:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                else:
+                    await broadcast.wait()
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers <= 0 and not broadcast.done:
+                broadcast.task.cancel()
+
+    async def _pump(self, key: str, broadcast: _Broadcast, fn: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in fn():
+                broadcast.chunks.append(chunk)
+                broadcast.notify()
+        except asyncio.CancelledError:
+            broadcast.error = asyncio.CancelledError()
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            broadcast.done = True
+            # New subscribers start a fresh stream from here on
+            if self._broadcasts.get(key) is broadcast:
+                del self._broadcasts[key]
+            broadcast.notify()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self._stats, "in_flight": len(self._broadcasts)}
@@ -0,0 +1,19 @@
+import json
+import os
+from typing import Any
+
+# Comment lines keep idle connections open through proxies and load balancers
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache, no-transform",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # Disable nginx response buffering
+}
+
+HEARTBEAT = ": ping\n\n"
+
+
+def format_event(event: str, data: Any) -> str:
+    """Encode one Server-Sent Event; data is JSON on a single line"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
@@ -0,0 +1,158 @@
+"""
+Local stand-ins for the external services, installed into a service process
+before its `main` module is imported:
+
+- LLM: a litellm-shaped completion with configurable time to first token,
+  per-token delay, jitter and error rate, streaming or not
+- Embeddings: deterministic pseudo-random vectors with a configurable delay
+- Qdrant: qdrant-client's in-memory local mode
+- Redis: fakeredis (Lua scripts need `lupa`)
+- MongoDB: mongomock
+- Crawler: a Tavily client serving generated HTML pages
+
+Everything is configured through FAKE_* environment variables so the load
+driver can pass settings to the server subprocesses.
+"""
+
+from types import SimpleNamespace
+from typing import Any, Dict, List
+import asyncio
+import hashlib
+import math
+import os
+import random
+import time
+
+FAKE_LLM_TTFT_MS = float(os.getenv("FAKE_LLM_TTFT_MS", "400"))
+FAKE_LLM_TOKEN_MS = float(os.getenv("FAKE_LLM_TOKEN_MS", "15"))
+FAKE_LLM_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "60"))
+FAKE_LLM_JITTER = float(os.getenv("FAKE_LLM_JITTER", "0.2"))  # +/- fraction applied to every delay
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_EMBEDDING_MS = float(os.getenv("FAKE_EMBEDDING_MS", "40"))
+FAKE_EMBEDDING_DIM = int(os.getenv("FAKE_EMBEDDING_DIM", "768"))
+FAKE_CRAWL_PAGES = int(os.getenv("FAKE_CRAWL_PAGES", "5"))
+FAKE_CRAWL_PAGE_MS = float(os.getenv("FAKE_CRAWL_PAGE_MS", "150"))
+
+WORDS = (
+    "order shipping refund account invoice delivery warranty password upgrade plan "
+    "support return exchange tracking payment subscription discount store hours"
+).split()
+
+
+def _jittered(ms: float) -> float:
+    return max(0.0, ms * (1 + random.uniform(-FAKE_LLM_JITTER, FAKE_LLM_JITTER))) / 1000
+
+
+class FakeLLM:
+    """Drop-in for litellm.acompletion, as used through ModelRouter"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def completion(self, model: str, messages: List[Dict[str, Any]], stream: bool = False, **kwargs):
+        self.calls += 1
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages if isinstance(m, dict))
+        tokens = [random.choice(WORDS) + " " for _ in range(FAKE_LLM_TOKENS)]
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(tokens))
+
+        await asyncio.sleep(_jittered(FAKE_LLM_TTFT_MS))
+        if random.random() < FAKE_LLM_ERROR_RATE:
+            raise RuntimeError(f"fake provider error from {model}")
+
+        if not stream:
+            await asyncio.sleep(_jittered(FAKE_LLM_TOKEN_MS * len(tokens)))
+            message = SimpleNamespace(role="assistant", content="".join(tokens).strip(), tool_calls=None)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+        async def chunks():
+            for index, token in enumerate(tokens):
+                if index:
+                    await asyncio.sleep(_jittered(FAKE_LLM_TOKEN_MS))
+                last = index == len(tokens) - 1
+                yield SimpleNamespace(
+                    choices=[SimpleNamespace(delta=SimpleNamespace(content=token))],
+                    usage=usage if last else None
+                )
+
+        return chunks()
+
+
+def fake_embedding(text: str) -> List[float]:
+    """Unit vector seeded by the text, so equal texts embed equally"""
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(FAKE_EMBEDDING_DIM)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def fake_embed_content(model: str, content, task_type: str = None, **kwargs) -> Dict[str, Any]:
+    """Drop-in for google.generativeai.embed_content (blocking, like the real client); a list is one batch call"""
+    time.sleep(FAKE_EMBEDDING_MS / 1000)
+    if isinstance(content, list):
+        return {"embedding": [fake_embedding(text) for text in content]}
+    return {"embedding": fake_embedding(content)}
+
+
+def fake_page(url: str, paragraphs: int = 12) -> str:
+    rng = random.Random(url)
+    body = "\n".join(
+        f"<p>{' '.join(rng.choice(WORDS) for _ in range(rng.randint(30, 80)))}.</p>"
+        for _ in range(paragraphs)
+    )
+    return (
+        f"<html><head><style>p {{ margin: 0 }}</style><script>var x = 1;</script></head>"
+        f"<body><nav>Home | About</nav><h1>{url}</h1>{body}<footer>(c) Example</footer></body></html>"
+    )
+
+
+class FakeTavilyClient:
+    """Drop-in for tavily.TavilyClient covering map() and extract()"""
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key
+
+    def map(self, url: str, **kwargs) -> Dict[str, Any]:
+        time.sleep(FAKE_CRAWL_PAGE_MS / 1000)
+        base = url.rstrip("/")
+        return {"base_url": url, "urls": [url] + [f"{base}/page-{i}" for i in range(1, FAKE_CRAWL_PAGES)]}
+
+    def extract(self, urls: List[str], **kwargs) -> Dict[str, Any]:
+        time.sleep(FAKE_CRAWL_PAGE_MS / 1000 * len(urls))
+        return {"results": [{"url": url, "raw_content": fake_page(url)} for url in urls], "failed_results": []}
+
+
+def install_agent_fakes() -> FakeLLM:
+    """Patch Redis before `main` is imported; returns the LLM to attach once it is"""
+    # Connections and actions stay in the process instead of MongoDB
+    os.environ.setdefault("REGISTRY_BACKEND", "memory")
+    import fakeredis
+    import utils.redis_client as redis_client
+
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True, max_connections=10000)
+    redis_client.get_redis_client = lambda: client
+    return FakeLLM()
+
+
+def attach_agent_llm(main_module, llm: FakeLLM):
+    main_module.llm_service.router.completion = llm.completion
+
+
+def install_kb_fakes():
+    """Patch MongoDB, Qdrant, embeddings and the crawler before `main` is imported"""
+    os.environ.setdefault("GOOGLE_API_KEY", "fake")
+    os.environ.setdefault("TAVILY_API_KEY", "fake")
+
+    import mongomock
+    from qdrant_client import QdrantClient
+    import database
+
+    database.mongo_db = mongomock.MongoClient()["makkn_db"]
+    database.qdrant_client = QdrantClient(":memory:")
+
+    import google.generativeai as genai
+    genai.embed_content = fake_embed_content
+
+    import services.scraping as scraping
+    scraping.TavilyClient = FakeTavilyClient
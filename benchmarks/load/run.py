@@ -0,0 +1,449 @@
+"""
+Load test both services against local fakes (no Gemini, Qdrant, Redis, MongoDB
+or Tavily needed) and write the results as JSON:
+
+    python benchmarks/load/run.py --concurrency 20 --requests 300
+    python benchmarks/load/run.py --scenarios chat_stream,ws --llm-ttft-ms 800
+    python benchmarks/load/run.py --baseline benchmarks/load/baseline.json
+
+Scenarios: chat (POST /chat), chat_stream (POST /chat/stream), ws
+(/ws/chat/{project_id}), query (knowledge base /query) and upload (knowledge
+base /upload). Each reports throughput, p50/p95/p99 latency and, for the
+streaming ones, time to first token. With --baseline, the run is compared
+against an earlier result and exits with status 1 when throughput or p95
+latency regressed by more than --max-regression percent. benchmarks/load/
+baseline.json is a committed reference run with the default options; runs
+written to benchmarks/results are not committed.
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import httpx
+import websockets
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(HERE))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SCENARIOS = ("chat", "chat_stream", "ws", "query", "upload")
+DEFAULT_SCENARIOS = ("chat", "chat_stream", "ws", "query")
+
+TOPICS = (
+    "refund policy", "shipping times", "reset my password", "cancel my subscription",
+    "store opening hours", "warranty claim", "change delivery address", "invoice copy",
+    "upgrade my plan", "track my order", "exchange a product", "payment failed"
+)
+
+
+class RequestFailed(Exception):
+    pass
+
+
+class Recorder:
+    """Latencies, time to first token and failures for one scenario"""
+
+    def __init__(self):
+        self.completed = 0
+        self.latencies_ms: List[float] = []
+        self.ttft_ms: List[float] = []
+        self.errors: Dict[str, int] = {}
+
+    def ok(self, latency: float, ttft: Optional[float] = None, warmup: bool = False):
+        # Warmup requests count towards throughput but not the latency distribution
+        self.completed += 1
+        if warmup:
+            return
+        self.latencies_ms.append(latency * 1000)
+        if ttft is not None:
+            self.ttft_ms.append(ttft * 1000)
+
+    def error(self, reason: str):
+        self.errors[reason] = self.errors.get(reason, 0) + 1
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        completed = self.completed
+        failed = sum(self.errors.values())
+        return {
+            "requests": completed + failed,
+            "ok": completed,
+            "errors": failed,
+            "error_rate": round(failed / (completed + failed), 4) if completed + failed else 0.0,
+            "error_reasons": self.errors,
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(completed / duration, 2) if duration else 0.0,
+            "latency_ms": distribution(self.latencies_ms),
+            "ttft_ms": distribution(self.ttft_ms) if self.ttft_ms else None
+        }
+
+
+def percentile(ordered: List[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+def distribution(samples: List[float]) -> Optional[Dict[str, float]]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        "p50": round(percentile(ordered, 50), 1),
+        "p95": round(percentile(ordered, 95), 1),
+        "p99": round(percentile(ordered, 99), 1),
+        "mean": round(sum(ordered) / len(ordered), 1),
+        "max": round(ordered[-1], 1)
+    }
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace, agent_url: str, kb_url: str):
+        self.args = args
+        self.agent_url = agent_url.rstrip("/")
+        self.kb_url = kb_url.rstrip("/")
+        self.projects = [f"loadtest-{i}" for i in range(args.projects)]
+        self.http = httpx.AsyncClient(
+            timeout=args.timeout,
+            limits=httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+        )
+
+    def project(self, index: int) -> str:
+        return self.projects[index % len(self.projects)]
+
+    def query(self, index: int) -> str:
+        topic = TOPICS[index % len(TOPICS)]
+        # Unique by default: identical first-turn questions are coalesced by single-flight
+        return f"How does {topic} work?" if self.args.repeat_queries else f"How does {topic} work? (#{index})"
+
+    async def seed(self):
+        """One small document per project so /query and /chat retrieve real chunks"""
+        for index, project_id in enumerate(self.projects):
+            await self.upload_document(project_id, index, chunks=1)
+
+    async def upload_document(self, project_id: str, index: int, chunks: int):
+        rng = random.Random(index)
+        text = "\n".join(
+            f"{TOPICS[(index + i) % len(TOPICS)]}: " + " ".join(rng.choice(TOPICS) for _ in range(30))
+            for i in range(chunks * 2)
+        )[:chunks * 800]
+        response = await self.http.post(
+            f"{self.kb_url}/upload",
+            data={"project_id": project_id},
+            files={"file": (f"doc-{index}.txt", text.encode(), "text/plain")}
+        )
+        if response.status_code != 200:
+            raise RequestFailed(f"http_{response.status_code}")
+
+    # --- Scenarios: each runs one request and returns (latency, ttft) ---
+
+    async def run_chat(self, index: int, _state: Dict[str, Any]):
+        started = time.perf_counter()
+        response = await self.http.post(f"{self.agent_url}/chat", json={
+            "query": self.query(index),
+            "project_id": self.project(index),
+            "session_id": f"session-{index}"
+        })
+        if response.status_code != 200:
+            raise RequestFailed(f"http_{response.status_code}")
+        return time.perf_counter() - started, None
+
+    async def run_chat_stream(self, index: int, _state: Dict[str, Any]):
+        started = time.perf_counter()
+        ttft = None
+        event = None
+        async with self.http.stream("POST", f"{self.agent_url}/chat/stream", json={
+            "query": self.query(index),
+            "project_id": self.project(index),
+            "session_id": f"session-{index}"
+        }) as response:
+            if response.status_code != 200:
+                raise RequestFailed(f"http_{response.status_code}")
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                    if event == "token" and ttft is None:
+                        ttft = time.perf_counter() - started
+                    elif event == "error":
+                        raise RequestFailed("stream_error")
+                    elif event == "done":
+                        break
+        if event != "done":
+            raise RequestFailed("stream_incomplete")
+        return time.perf_counter() - started, ttft
+
+    async def run_ws(self, index: int, state: Dict[str, Any]):
+        # One socket per worker, reused for all of its requests like a widget would
+        socket_ = state.get("socket")
+        if socket_ is None:
+            ws_url = self.agent_url.replace("http", "ws", 1)
+            socket_ = await websockets.connect(f"{ws_url}/ws/chat/{self.project(index)}", max_size=None)
+            await socket_.recv()  # session frame
+            state["socket"] = socket_
+
+        request_id = f"r{index}"
+        started = time.perf_counter()
+        ttft = None
+        await socket_.send(json.dumps({"request_id": request_id, "query": self.query(index)}))
+        while True:
+            frame = json.loads(await asyncio.wait_for(socket_.recv(), self.args.timeout))
+            if frame.get("request_id") != request_id:
+                continue
+            if frame["type"] == "chunk" and ttft is None:
+                ttft = time.perf_counter() - started
+            elif frame["type"] == "complete":
+                return time.perf_counter() - started, ttft
+            elif frame["type"] == "error":
+                raise RequestFailed(f"ws_{frame.get('code', 'error')}")
+
+    async def run_query(self, index: int, _state: Dict[str, Any]):
+        started = time.perf_counter()
+        response = await self.http.post(f"{self.kb_url}/query", data={
+            "query": self.query(index),
+            "project_id": self.project(index)
+        })
+        if response.status_code != 200:
+            raise RequestFailed(f"http_{response.status_code}")
+        return time.perf_counter() - started, None
+
+    async def run_upload(self, index: int, _state: Dict[str, Any]):
+        started = time.perf_counter()
+        await self.upload_document(self.project(index), index, chunks=self.args.upload_chunks)
+        return time.perf_counter() - started, None
+
+    async def close_state(self, state: Dict[str, Any]):
+        if state.get("socket") is not None:
+            await state["socket"].close()
+
+    async def run_scenario(self, name: str, concurrency: int, requests: int) -> Dict[str, Any]:
+        run_one: Callable[[int, Dict[str, Any]], Awaitable] = getattr(self, f"run_{name}")
+        recorder = Recorder()
+        counter = itertools.count()
+        deadline = time.perf_counter() + self.args.duration if self.args.duration else None
+        warmup = self.args.warmup if deadline else min(self.args.warmup, requests // 10)
+
+        async def worker():
+            state: Dict[str, Any] = {}
+            try:
+                while True:
+                    index = next(counter)
+                    if deadline is None and index >= requests:
+                        return
+                    if deadline is not None and time.perf_counter() >= deadline:
+                        return
+                    try:
+                        latency, ttft = await run_one(index, state)
+                        recorder.ok(latency, ttft, warmup=index < warmup)
+                    except RequestFailed as e:
+                        recorder.error(str(e))
+                    except (httpx.HTTPError, websockets.WebSocketException, asyncio.TimeoutError, OSError) as e:
+                        recorder.error(type(e).__name__)
+                        await self.close_state(state)
+                        state.clear()
+            finally:
+                await self.close_state(state)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        summary = recorder.summary(time.perf_counter() - started)
+        summary["concurrency"] = concurrency
+        return summary
+
+    async def run(self) -> Dict[str, Any]:
+        results = {}
+        try:
+            if not self.args.no_seed:
+                print(f"Seeding {len(self.projects)} projects...", flush=True)
+                await self.seed()
+            for name in self.args.scenarios:
+                if name == "upload":
+                    concurrency, requests = self.args.upload_concurrency, self.args.upload_requests
+                else:
+                    concurrency, requests = self.args.concurrency, self.args.requests
+                print(f"Running {name}: concurrency={concurrency}", flush=True)
+                results[name] = await self.run_scenario(name, concurrency, requests)
+                print(format_line(name, results[name]), flush=True)
+        finally:
+            await self.http.aclose()
+        return results
+
+
+def format_line(name: str, result: Dict[str, Any]) -> str:
+    latency = result["latency_ms"] or {}
+    ttft = result["ttft_ms"] or {}
+    line = (
+        f"  {name:<12} {result['throughput_rps']:>8.1f} req/s  "
+        f"p50 {latency.get('p50', 0):>7.1f}  p95 {latency.get('p95', 0):>7.1f}  p99 {latency.get('p99', 0):>7.1f} ms"
+    )
+    if ttft:
+        line += f"  ttft p50 {ttft['p50']:.1f} p95 {ttft['p95']:.1f} ms"
+    if result["errors"]:
+        line += f"  errors {result['errors']} {result['error_reasons']}"
+    return line
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def fake_env(args: argparse.Namespace) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "FAKE_LLM_TTFT_MS": str(args.llm_ttft_ms),
+        "FAKE_LLM_TOKEN_MS": str(args.llm_token_ms),
+        "FAKE_LLM_TOKENS": str(args.llm_tokens),
+        "FAKE_LLM_ERROR_RATE": str(args.llm_error_rate),
+        "FAKE_EMBEDDING_MS": str(args.embedding_ms),
+        "LITELLM_LOCAL_MODEL_COST_MAP": "True"
+    })
+    # Keep server output to warnings unless asked otherwise
+    env.setdefault("LOG_LEVEL", "WARNING")
+    return env
+
+
+def start_server(service: str, port: int, env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "serve.py"), service, "--port", str(port)],
+        env=env
+    )
+
+
+def wait_healthy(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{url} exited with status {process.returncode} during startup")
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{url} did not become healthy within {timeout}s")
+
+
+def git_commit() -> Dict[str, Any]:
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, text=True).strip())
+        return {"commit": sha, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Print a comparison table and return the regressions beyond `max_regression` percent"""
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for name, current in results.items():
+        before = baseline["scenarios"].get(name)
+        if not before or not before.get("latency_ms") or not current.get("latency_ms"):
+            continue
+        checks = [("throughput_rps", current["throughput_rps"], before["throughput_rps"], False)]
+        checks.append(("p95_ms", current["latency_ms"]["p95"], before["latency_ms"]["p95"], True))
+        if current.get("ttft_ms") and before.get("ttft_ms"):
+            checks.append(("ttft_p95_ms", current["ttft_ms"]["p95"], before["ttft_ms"]["p95"], True))
+        for metric, now, then, lower_is_better in checks:
+            change = (now - then) / then * 100 if then else 0.0
+            worse = change > max_regression if lower_is_better else change < -max_regression
+            print(f"  {name:<12} {metric:<15} {then:>9.1f} -> {now:>9.1f}  ({change:+.1f}%){'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS),
+                        help=f"Comma-separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent clients per scenario")
+    parser.add_argument("--requests", type=int, default=300, help="Requests per scenario (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Run each scenario for this many seconds instead")
+    parser.add_argument("--warmup", type=int, default=10, help="Leading requests left out of the statistics")
+    parser.add_argument("--projects", type=int, default=8, help="Tenants the load is spread over")
+    parser.add_argument("--repeat-queries", action="store_true", help="Reuse questions, so single-flight can coalesce them")
+    parser.add_argument("--upload-concurrency", type=int, default=2)
+    parser.add_argument("--upload-requests", type=int, default=10)
+    parser.add_argument("--upload-chunks", type=int, default=3, help="Chunks per uploaded document")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--llm-ttft-ms", type=float, default=400)
+    parser.add_argument("--llm-token-ms", type=float, default=15)
+    parser.add_argument("--llm-tokens", type=int, default=60)
+    parser.add_argument("--llm-error-rate", type=float, default=0)
+    parser.add_argument("--embedding-ms", type=float, default=40)
+    parser.add_argument("--agent-url", help="Use a running AI Agent Service instead of starting one")
+    parser.add_argument("--kb-url", help="Use a running Knowledge Base Service instead of starting one")
+    parser.add_argument("--no-seed", action="store_true", help="Skip uploading one document per project first")
+    parser.add_argument("--output", help="Result file (default benchmarks/results/load-<commit>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    parser.add_argument("--max-regression", type=float, default=10, help="Allowed regression in percent")
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    env = fake_env(args)
+    processes = []
+    try:
+        kb_url = args.kb_url
+        if not kb_url:
+            kb_url = f"http://127.0.0.1:{free_port()}"
+            processes.append(start_server("kb", int(kb_url.rsplit(":", 1)[1]), env))
+            wait_healthy(kb_url, processes[-1])
+        agent_url = args.agent_url
+        if not agent_url:
+            agent_url = f"http://127.0.0.1:{free_port()}"
+            processes.append(start_server("agent", int(agent_url.rsplit(":", 1)[1]), {**env, "KNOWLEDGE_BASE_URL": kb_url}))
+            wait_healthy(agent_url, processes[-1])
+
+        scenarios = asyncio.run(LoadTest(args, agent_url, kb_url).run())
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    meta = {
+        **git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    }
+    report = {"meta": meta, "scenarios": scenarios}
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{meta['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            regressions = compare(scenarios, json.load(handle), args.max_regression)
+        if regressions:
+            print(f"\nRegressed beyond {args.max_regression}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
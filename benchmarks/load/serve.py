@@ -0,0 +1,49 @@
+"""
+Run one service against the local fakes:
+
+    python benchmarks/load/serve.py agent --port 18001
+    python benchmarks/load/serve.py kb --port 18000
+
+Each service runs in its own process: both have top-level `main` and
+`services` packages, so they cannot share an interpreter.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SERVICE_DIRS = {
+    "agent": os.path.join(ROOT, "ai-agent-service"),
+    "kb": os.path.join(ROOT, "knowledge-base-service")
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("service", choices=sorted(SERVICE_DIRS))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    args = parser.parse_args()
+
+    sys.path.insert(0, SERVICE_DIRS[args.service])
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # Uploaded files land in ./uploads; keep them out of the repository
+    os.chdir(tempfile.mkdtemp(prefix=f"loadtest-{args.service}-"))
+
+    import fakes
+    if args.service == "agent":
+        llm = fakes.install_agent_fakes()
+        import main as app_module
+        fakes.attach_agent_llm(app_module, llm)
+    else:
+        fakes.install_kb_fakes()
+        import main as app_module
+
+    import uvicorn
+    uvicorn.run(app_module.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
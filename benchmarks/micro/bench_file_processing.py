@@ -0,0 +1,62 @@
+"""chunk_text and extract_text: run on every document uploaded to the knowledge base"""
+
+import pytest
+import fixtures
+
+CHUNK_INPUTS = {
+    # ~60 pages of a manual
+    "manual_200k": lambda: fixtures.document_text(200_000),
+    # A large PDF after extraction
+    "manual_5m": lambda: fixtures.document_text(5_000_000),
+    "no_whitespace_1m": lambda: fixtures.no_whitespace_text(1_000_000),
+    # One space near the start of each 1000-character window: tiny steps, many chunks
+    "sparse_whitespace_200k": lambda: fixtures.sparse_whitespace_text(200_000),
+}
+HEAVY = {"manual_5m", "sparse_whitespace_200k"}
+
+
+@pytest.mark.benchmark(group="chunk_text")
+@pytest.mark.parametrize("name", sorted(CHUNK_INPUTS))
+def bench_chunk_text(benchmark, file_processing, name):
+    text = CHUNK_INPUTS[name]()
+    if name in HEAVY:
+        chunks = benchmark.pedantic(file_processing.chunk_text, args=(text,), rounds=5, iterations=1)
+    else:
+        chunks = benchmark(file_processing.chunk_text, text)
+    assert chunks
+
+
+@pytest.fixture(scope="module")
+def documents(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("documents")
+    paths = {
+        "pdf_20_pages": str(directory / "small.pdf"),
+        "pdf_300_pages": str(directory / "large.pdf"),
+        "docx_500_paragraphs": str(directory / "doc.docx"),
+        "text_2m": str(directory / "large.txt"),
+    }
+    fixtures.write_pdf(paths["pdf_20_pages"], pages=20)
+    fixtures.write_pdf(paths["pdf_300_pages"], pages=300)
+    fixtures.write_docx(paths["docx_500_paragraphs"], paragraphs=500)
+    with open(paths["text_2m"], "w", encoding="utf-8") as f:
+        f.write(fixtures.document_text(2_000_000))
+    return paths
+
+
+MIME_TYPES = {
+    "pdf_20_pages": "application/pdf",
+    "pdf_300_pages": "application/pdf",
+    "docx_500_paragraphs": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "text_2m": "text/plain",
+}
+
+
+@pytest.mark.benchmark(group="extract_text")
+@pytest.mark.parametrize("name", sorted(MIME_TYPES))
+def bench_extract_text(benchmark, file_processing, documents, name):
+    args = (documents[name], MIME_TYPES[name])
+    if name == "pdf_300_pages":
+        text = benchmark.pedantic(file_processing.extract_text, args=args, rounds=3, iterations=1)
+    else:
+        text = benchmark(file_processing.extract_text, *args)
+    assert text
@@ -0,0 +1,62 @@
+"""System prompt and tool schema construction: run on every chat turn"""
+
+import pytest
+from models.tool_action import AgentAction, ParameterDefinition
+from services.llm_service import LLMService
+from services.persona_builder import PersonaBuilder
+from services.tools_service import ToolsService
+
+PERSONAS = {
+    "default": ("friendly", "general", "medium", ""),
+    "custom_instructions_2k": ("professional", "support", "detailed", "Always greet the customer by name. " * 60),
+    "custom_instructions_100k": ("concise", "technical", "short", "Never mention competitor products. " * 3000),
+}
+
+
+@pytest.mark.benchmark(group="build_system_prompt")
+@pytest.mark.parametrize("name", sorted(PERSONAS))
+def bench_build_system_prompt_cold(benchmark, name):
+    # What a new persona (first turn, new worker) costs
+    benchmark(PersonaBuilder.build_system_prompt, *PERSONAS[name])
+
+
+@pytest.mark.benchmark(group="build_system_prompt")
+def bench_build_system_prompt_cached(benchmark):
+    # Every later turn: the memoized static prompt LLMService sends
+    LLMService._static_system_prompt(*PERSONAS["custom_instructions_2k"])
+    benchmark(LLMService._static_system_prompt, *PERSONAS["custom_instructions_2k"])
+
+
+def _actions(count: int, params: int):
+    return [
+        AgentAction(
+            id=f"action-{index}",
+            project_id="bench",
+            name=f"lookup_{index:04d}",
+            description=f"Look up record type {index} by its identifiers and return the matching rows.",
+            connection_id="conn",
+            sql_query="SELECT * FROM records WHERE id = :id",
+            parameters={
+                f"field_{p}": ParameterDefinition(type="string", description=f"Identifier number {p}", required=p % 2 == 0)
+                for p in range(params)
+            }
+        )
+        for index in range(count)
+    ]
+
+
+TOOL_SETS = {
+    "5_actions": (5, 3),
+    "50_actions": (50, 5),
+    "500_actions_20_params": (500, 20),
+}
+
+
+@pytest.mark.benchmark(group="get_tools_for_llm")
+@pytest.mark.parametrize("name", sorted(TOOL_SETS))
+def bench_get_tools_for_llm(benchmark, name):
+    # The registry lookup in get_tools_for_llm is a cached dict read; this is the rest.
+    # Reversed so the name sort has work to do
+    actions = list(reversed(_actions(*TOOL_SETS[name])))
+    result = benchmark(ToolsService.build_tools, actions)
+    assert result == sorted(result, key=lambda tool: tool["function"]["name"])
@@ -0,0 +1,34 @@
+"""clean_text and the BeautifulSoup page cleanup: run on every crawled page"""
+
+import pytest
+import fixtures
+
+CLEAN_INPUTS = {
+    "document_200k": lambda: fixtures.document_text(200_000),
+    "scraped_noise_200k": lambda: fixtures.noisy_scraped_text(200_000),
+    "punctuation_only_200k": lambda: fixtures.punctuation_run_text(200_000),
+    "no_whitespace_1m": lambda: fixtures.no_whitespace_text(1_000_000),
+}
+
+
+@pytest.mark.benchmark(group="clean_text")
+@pytest.mark.parametrize("name", sorted(CLEAN_INPUTS))
+def bench_clean_text(benchmark, scraping, name):
+    text = CLEAN_INPUTS[name]()
+    benchmark(scraping.clean_text, text)
+
+
+HTML_INPUTS = {
+    "help_page_20_sections": lambda: fixtures.html_page(20),
+    "long_page_400_sections": lambda: fixtures.html_page(400),
+    "nested_tables": lambda: fixtures.nested_html_page(depth=10, width=40),
+}
+
+
+@pytest.mark.benchmark(group="html_to_text")
+@pytest.mark.parametrize("name", sorted(HTML_INPUTS))
+def bench_html_to_text(benchmark, scraping, name):
+    html = HTML_INPUTS[name]()
+    text = benchmark(scraping.html_to_text, html)
+    assert text
+    assert "dataLayer" not in text
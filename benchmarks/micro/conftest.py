@@ -0,0 +1,60 @@
+"""
+Both services have top-level `services` packages, so they cannot both be on
+sys.path. The AI Agent Service is imported normally; the Knowledge Base
+modules under test have no intra-package imports and are loaded from their
+files under `kb_*` names instead.
+
+With --benchmark-compare, a run fails when a benchmark regressed beyond
+MICROBENCH_MAX_REGRESSION (default "min:20%": the fastest round is 20% slower
+than in the stored baseline), unless --benchmark-compare-fail is given.
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(HERE))
+AGENT_DIR = os.path.join(ROOT, "ai-agent-service")
+KB_DIR = os.path.join(ROOT, "knowledge-base-service")
+MICROBENCH_MAX_REGRESSION = os.getenv("MICROBENCH_MAX_REGRESSION", "min:20%")
+
+sys.path.insert(0, HERE)
+sys.path.insert(0, AGENT_DIR)
+# llm_service imports litellm; use its bundled cost map instead of fetching one
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    from pytest_benchmark.utils import parse_compare_fail
+
+    if config.getoption("benchmark_compare", None) and not config.getoption("benchmark_compare_fail", None):
+        config.option.benchmark_compare_fail = [parse_compare_fail(MICROBENCH_MAX_REGRESSION)]
+
+
+def _load_kb_module(name: str):
+    path = os.path.join(KB_DIR, "services", f"{name}.py")
+    spec = importlib.util.spec_from_file_location(f"kb_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    # file_processing creates ./uploads on import; keep it out of the repository
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="microbench-"))
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    sys.modules[spec.name] = module
+    return module
+
+
+@pytest.fixture(scope="session")
+def file_processing():
+    return _load_kb_module("file_processing")
+
+
+@pytest.fixture(scope="session")
+def scraping():
+    return _load_kb_module("scraping")
@@ -0,0 +1,151 @@
+"""
+Inputs for the micro-benchmarks, generated deterministically so every run
+measures the same bytes. Realistic inputs look like what customers upload or
+what the crawler returns; adversarial ones are shaped to hit the slow paths
+(no whitespace, sparse breaks, punctuation runs, deeply nested markup).
+"""
+
+from typing import List
+import random
+import zlib
+
+WORDS = (
+    "order shipping refund account invoice delivery warranty password upgrade plan "
+    "support return exchange tracking payment subscription discount store hours the "
+    "a to of and in for with your our we you can will be is are this that please"
+).split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(sentence(rng, rng.randint(6, 24)) for _ in range(sentences))
+
+
+def document_text(chars: int, seed: int = 1) -> str:
+    """Prose in paragraphs separated by blank lines, like an extracted manual"""
+    rng = random.Random(seed)
+    paragraphs: List[str] = []
+    size = 0
+    while size < chars:
+        block = paragraph(rng, rng.randint(2, 8))
+        paragraphs.append(block)
+        size += len(block) + 2
+    return "\n\n".join(paragraphs)[:chars]
+
+
+def no_whitespace_text(chars: int, seed: int = 2) -> str:
+    """Minified JSON, base64 or CJK: no paragraph, sentence or word breaks at all"""
+    rng = random.Random(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789+/"
+    return "".join(rng.choice(alphabet) for _ in range(chars))
+
+
+def sparse_whitespace_text(chars: int, every: int = 1000, seed: int = 3) -> str:
+    """A single space early in every window: the splitter falls back to tiny steps"""
+    text = list(no_whitespace_text(chars, seed))
+    for index in range(50, chars, every):
+        text[index] = " "
+    return "".join(text)
+
+
+def noisy_scraped_text(chars: int, seed: int = 4) -> str:
+    """Crawler output: whitespace runs, emoji, symbols and repeated punctuation"""
+    rng = random.Random(seed)
+    noise = ("   \n\t\t  ", "!!!", "...", "??!!", "★★★", "→", "©", "™", "😀", "🚚", "|", "•", ";;;")
+    parts: List[str] = []
+    size = 0
+    while size < chars:
+        part = sentence(rng, rng.randint(4, 12)) if rng.random() < 0.6 else rng.choice(noise)
+        parts.append(part)
+        size += len(part) + 1
+    return " ".join(parts)[:chars]
+
+
+def punctuation_run_text(chars: int) -> str:
+    """Nothing but punctuation: every character matches the collapsing regex"""
+    return ("!?.,;:" * (chars // 6 + 1))[:chars]
+
+
+def html_page(paragraphs: int, seed: int = 5) -> str:
+    """A typical marketing/help-centre page with scripts, navigation and a footer"""
+    rng = random.Random(seed)
+    scripts = "".join(f"<script>window.dataLayer.push({{event: 'e{i}'}});</script>" for i in range(10))
+    nav = "<nav><ul>" + "".join(f"<li><a href='/p{i}'>Link {i}</a></li>" for i in range(30)) + "</ul></nav>"
+    body = "".join(
+        f"<section><h2>{sentence(rng, 4)}</h2><p>{paragraph(rng, rng.randint(2, 6))}</p>"
+        f"<p>{paragraph(rng, rng.randint(1, 4))}</p></section>"
+        for _ in range(paragraphs)
+    )
+    return (
+        f"<!DOCTYPE html><html><head><title>Help</title><style>body {{ margin: 0 }}</style>{scripts}</head>"
+        f"<body><header><h1>Help centre</h1></header>{nav}<main>{body}</main>"
+        f"<aside>{paragraph(rng, 3)}</aside><footer>{paragraph(rng, 2)}</footer></body></html>"
+    )
+
+
+def nested_html_page(depth: int, width: int, seed: int = 6) -> str:
+    """Deeply nested, table-heavy markup with tiny text nodes (page builders, email templates)"""
+    rng = random.Random(seed)
+    cells = "".join(f"<td><span><b>{rng.choice(WORDS)}</b></span></td>" for _ in range(width))
+    inner = f"<table><tr>{cells}</tr></table>"
+    for _ in range(depth):
+        inner = f"<div class='w'><div>{inner}</div>{inner[:200]}</div>"
+    return f"<html><body>{inner}</body></html>"
+
+
+def write_pdf(path: str, pages: int, lines_per_page: int = 45, seed: int = 7):
+    """Write a text PDF with Helvetica text lines on every page (no extra dependency)"""
+    rng = random.Random(seed)
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")
+    pages_id = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    kids = []
+    for _ in range(pages):
+        lines = []
+        for line in range(lines_per_page):
+            text = sentence(rng, rng.randint(8, 14)).replace("\\", "").replace("(", "").replace(")", "")
+            lines.append(f"BT /F1 10 Tf 50 {780 - line * 16} Td ({text}) Tj ET")
+        stream = zlib.compress("\n".join(lines).encode("latin-1"))
+        content = add(
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font, content)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+def write_docx(path: str, paragraphs: int, seed: int = 8):
+    import docx
+
+    rng = random.Random(seed)
+    document = docx.Document()
+    for _ in range(paragraphs):
+        document.add_paragraph(paragraph(rng, rng.randint(2, 6)))
+    document.save(path)
@@ -0,0 +1,252 @@
+"""
+Offline recall of reduced-size embeddings against the full 768-dimension ones.
+
+For every candidate size, stored vectors and query vectors are truncated and
+renormalized exactly as the Knowledge Base Service does for a reduced-size
+project (services.embeddings.reduce_embedding). The top-k chunks found with
+them are compared with the top-k found with the full vectors, using exact
+(brute-force) cosine search on both sides, so the numbers measure the
+embedding loss alone and not the HNSW index.
+
+    # Chunks of one project from Qdrant; queries are other stored chunks
+    python benchmarks/recall/run.py --project proj_a
+
+    # Real questions (embedded with Gemini, needs GOOGLE_API_KEY), saved for later runs
+    python benchmarks/recall/run.py --queries questions.txt --export snapshot.npz
+    python benchmarks/recall/run.py --vectors snapshot.npz --dimensions 384,256,128
+
+    # Harness check only, on generated vectors
+    python benchmarks/recall/run.py --synthetic 20000
+
+Reports recall@k per size, raw vector memory and brute-force search time,
+and the smallest size whose recall@k reaches --min-recall.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(HERE))
+KB_DIR = os.path.join(ROOT, "knowledge-base-service")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+FULL_DIMENSIONS = 768
+DEFAULT_DIMENSIONS = "512,384,256,192,128,64"
+
+
+def git_commit() -> Dict[str, Any]:
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, text=True).strip())
+        return {"commit": sha, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def load_from_qdrant(url: str, collection: str, projects: List[str], max_points: int) -> np.ndarray:
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models as qmodels
+
+    client = QdrantClient(url=url)
+    selection = None
+    if projects:
+        selection = qmodels.Filter(must=[qmodels.FieldCondition(key="project_id", match=qmodels.MatchAny(any=projects))])
+    vectors, offset = [], None
+    while len(vectors) < max_points:
+        points, offset = client.scroll(
+            collection_name=collection, scroll_filter=selection, limit=min(1000, max_points - len(vectors)),
+            offset=offset, with_payload=False, with_vectors=True
+        )
+        vectors.extend(point.vector for point in points)
+        if offset is None:
+            break
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def embed_queries(path: str) -> np.ndarray:
+    """Full-size query embeddings, made the way /query makes them"""
+    sys.path.insert(0, KB_DIR)
+    from services.embeddings import GOOGLE_API_KEY, generate_query_embedding
+
+    if not GOOGLE_API_KEY:
+        raise SystemExit("--queries needs GOOGLE_API_KEY to embed the questions")
+    with open(path, encoding="utf-8") as handle:
+        questions = [line.strip() for line in handle if line.strip()]
+    embeddings = [generate_query_embedding(question) for question in questions]
+    return np.asarray([embedding for embedding in embeddings if embedding], dtype=np.float32)
+
+
+def synthetic(count: int, seed: int) -> np.ndarray:
+    """
+    Clustered vectors whose variance decays along the dimensions, the way
+    Matryoshka-trained embeddings front-load information. Only for checking
+    the harness: the recall it reports says nothing about real chunks.
+    """
+    rng = np.random.default_rng(seed)
+    scale = 1 / np.sqrt(1 + np.arange(FULL_DIMENSIONS) / 16)
+    centers = rng.standard_normal((max(8, count // 200), FULL_DIMENSIONS)) * scale
+    members = centers[rng.integers(0, len(centers), count)]
+    return (members + 0.6 * rng.standard_normal((count, FULL_DIMENSIONS)) * scale).astype(np.float32)
+
+
+def top_k(queries: np.ndarray, documents: np.ndarray, k: int, exclude: Optional[np.ndarray]) -> np.ndarray:
+    scores = queries @ documents.T
+    if exclude is not None:
+        # A stored chunk used as the query is not its own neighbour
+        scores[np.arange(len(queries)), exclude] = -np.inf
+    candidates = np.argpartition(-scores, k, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(row) & set(expected)) / k for row, expected in zip(found, truth)]))
+
+
+def search_ms(queries: np.ndarray, documents: np.ndarray, k: int, rounds: int = 3) -> float:
+    """Best of `rounds` brute-force searches, per query"""
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        top_k(queries, documents, k, None)
+        best = min(best, time.perf_counter() - started)
+    return best / len(queries) * 1000
+
+
+def evaluate(documents: np.ndarray, queries: np.ndarray, exclude: Optional[np.ndarray],
+             dimensions: List[int], ks: List[int]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    k_max = max(ks)
+    full_documents, full_queries = normalize(documents), normalize(queries)
+    truth = top_k(full_queries, full_documents, k_max, exclude)
+    baseline = {
+        "dimensions": FULL_DIMENSIONS,
+        "vector_mb": round(documents.shape[0] * FULL_DIMENSIONS * 4 / 1e6, 2),
+        "search_ms_per_query": round(search_ms(full_queries, full_documents, k_max), 4)
+    }
+
+    results = {}
+    for size in dimensions:
+        reduced_documents = normalize(documents[:, :size])
+        reduced_queries = normalize(queries[:, :size])
+        found = top_k(reduced_queries, reduced_documents, k_max, exclude)
+        results[str(size)] = {
+            **{f"recall@{k}": round(recall(found[:, :k], truth[:, :k]), 4) for k in ks},
+            "top1_agreement": round(float(np.mean(found[:, 0] == truth[:, 0])), 4),
+            "vector_mb": round(documents.shape[0] * size * 4 / 1e6, 2),
+            "search_ms_per_query": round(search_ms(reduced_queries, reduced_documents, k_max), 4)
+        }
+    return baseline, results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--vectors", help=".npz snapshot written by --export")
+    source.add_argument("--synthetic", type=int, help="Generate this many vectors instead (harness check)")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    parser.add_argument("--collection", default="makkn_knowledge_base", help="A full-size (768) collection")
+    parser.add_argument("--project", action="append", default=[], help="Only this project's chunks (repeatable)")
+    parser.add_argument("--max-points", type=int, default=100_000)
+    parser.add_argument("--queries", help="Questions, one per line, embedded with Gemini")
+    parser.add_argument("--sample-queries", type=int, default=500, help="Stored chunks used as queries without --queries")
+    parser.add_argument("--dimensions", default=DEFAULT_DIMENSIONS, help="Comma-separated sizes to compare")
+    parser.add_argument("--k", default="5,10", help="Comma-separated cutoffs (the chat asks /query for 5)")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="Recall@k (first --k) a size must reach")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--export", help="Save the vectors and queries used to this .npz")
+    parser.add_argument("--output", help="Result file (default benchmarks/results/recall-<commit>.json)")
+    args = parser.parse_args(argv)
+    args.dimensions = sorted({int(size) for size in args.dimensions.split(",") if size.strip()}, reverse=True)
+    args.k = [int(k) for k in args.k.split(",") if k.strip()]
+    if any(not 0 < size < FULL_DIMENSIONS for size in args.dimensions):
+        parser.error(f"--dimensions must be between 1 and {FULL_DIMENSIONS - 1}")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+
+    queries = None
+    if args.vectors:
+        snapshot = np.load(args.vectors)
+        documents = snapshot["documents"]
+        queries = snapshot["queries"] if "queries" in snapshot.files and len(snapshot["queries"]) else None
+    elif args.synthetic:
+        documents = synthetic(args.synthetic, args.seed)
+    else:
+        documents = load_from_qdrant(args.qdrant_url, args.collection, args.project, args.max_points)
+    if args.queries:
+        queries = embed_queries(args.queries)
+
+    if documents.ndim != 2 or documents.shape[1] != FULL_DIMENSIONS:
+        raise SystemExit(f"Expected {FULL_DIMENSIONS}-dimension vectors, got shape {documents.shape}")
+    if len(documents) <= max(args.k):
+        raise SystemExit(f"Need more than {max(args.k)} stored vectors, found {len(documents)}")
+
+    exclude = None
+    if queries is None:
+        exclude = rng.choice(len(documents), size=min(args.sample_queries, len(documents)), replace=False)
+        evaluated_queries = documents[exclude]
+    else:
+        evaluated_queries = queries
+
+    if args.export:
+        np.savez_compressed(args.export, documents=documents, queries=queries if queries is not None else np.empty((0, FULL_DIMENSIONS)))
+        print(f"Vectors saved to {args.export}")
+
+    baseline, results = evaluate(documents, evaluated_queries, exclude, args.dimensions, args.k)
+
+    k = args.k[0]
+    print(f"\n{len(documents)} vectors, {len(evaluated_queries)} queries "
+          f"({'questions' if exclude is None else 'stored chunks'}), exact cosine search")
+    print(f"{'dims':>6} " + " ".join(f"{'recall@' + str(cutoff):>10}" for cutoff in args.k) + f" {'top1':>7} {'MB':>9} {'ms/query':>9}")
+    print(f"{FULL_DIMENSIONS:>6} " + " ".join(f"{1.0:>10.4f}" for _ in args.k)
+          + f" {1.0:>7.4f} {baseline['vector_mb']:>9.2f} {baseline['search_ms_per_query']:>9.4f}")
+    for size, row in results.items():
+        print(f"{size:>6} " + " ".join(f"{row['recall@' + str(cutoff)]:>10.4f}" for cutoff in args.k)
+              + f" {row['top1_agreement']:>7.4f} {row['vector_mb']:>9.2f} {row['search_ms_per_query']:>9.4f}")
+
+    passing = [int(size) for size, row in results.items() if row[f"recall@{k}"] >= args.min_recall]
+    recommended = min(passing) if passing else None
+    if recommended:
+        print(f"\nSmallest size with recall@{k} >= {args.min_recall}: {recommended}")
+    else:
+        print(f"\nNo reduced size reaches recall@{k} >= {args.min_recall}; keep {FULL_DIMENSIONS}")
+
+    meta = {
+        **git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "source": "snapshot" if args.vectors else "synthetic" if args.synthetic else "qdrant",
+        "vectors": len(documents),
+        "queries": len(evaluated_queries),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "export")}
+    }
+    report = {"meta": meta, "baseline": baseline, "dimensions": results, "recommended": recommended}
+    output = args.output or os.path.join(RESULTS_DIR, f"recall-{meta['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,6 +16,24 @@
       this.attachShadow({ mode: 'open' });
       this.isOpen = false;
       this.config = null;
+      this.sessionId = this.getSessionId();
+    }
+
+    getSessionId() {
+      // One conversation per visitor tab; survives page navigation on the same site
+      const key = 'makkn-chat-session';
+      try {
+        let sessionId = window.sessionStorage.getItem(key);
+        if (!sessionId) {
+          sessionId = window.crypto && window.crypto.randomUUID
+            ? window.crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+          window.sessionStorage.setItem(key, sessionId);
+        }
+        return sessionId;
+      } catch (e) {
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+      }
     }
 
     connectedCallback() {
@@ -554,6 +572,33 @@
       }
     }
 
+    async readEventStream(response, onEvent) {
+      // Minimal Server-Sent Events parser over a fetch body (EventSource cannot POST)
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const rawEvent = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+
+          let event = 'message';
+          let data = '';
+          rawEvent.split('\n').forEach((line) => {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) data += line.slice(5).trim();
+          });
+          if (data) onEvent(event, JSON.parse(data));
+        }
+      }
+    }
+
     async sendMessage(message) {
       const messagesContainer = this.shadowRoot.getElementById('chat-messages');
       const apiUrl = this.getAttribute('api-url') || 'https://makkn.com';
@@ -608,15 +653,12 @@
             query: message,
             project_id: projectId,
             session_id: this.sessionId,
-            persona: this.config.persona
+            persona: this.config.persona,
+            stream: true
           })
         });
 
-        // Remove loading
-        messagesContainer.removeChild(loadingDiv);
-
         if (response.ok) {
-          const data = await response.json();
           const botMsgDiv = document.createElement('div');
           botMsgDiv.className = 'message agent';
           botMsgDiv.innerHTML = `
@@ -630,9 +672,34 @@
               }
                             </div>
                         ` : ''}
-                        <div class="message-content">${data.response}</div>
+                        <div class="message-content"></div>
                     `;
-          messagesContainer.appendChild(botMsgDiv);
+          const contentEl = botMsgDiv.querySelector('.message-content');
+          const showReply = () => {
+            if (loadingDiv.parentNode) {
+              messagesContainer.replaceChild(botMsgDiv, loadingDiv);
+            }
+          };
+
+          if ((response.headers.get('content-type') || '').includes('text/event-stream')) {
+            // Render tokens as they arrive
+            await this.readEventStream(response, (event, data) => {
+              if (event === 'token') {
+                showReply();
+                contentEl.textContent += data.content;
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+              } else if (event === 'error') {
+                throw new Error(data.message || 'Stream failed');
+              }
+            });
+            if (!contentEl.textContent) {
+              throw new Error('Empty response');
+            }
+          } else {
+            const data = await response.json();
+            contentEl.innerHTML = data.response;
+          }
+          showReply();
         } else {
           throw new Error('Failed to get response');
         }
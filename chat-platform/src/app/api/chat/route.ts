@@ -42,10 +42,24 @@ async function getProjectConfig(projectId: string): Promise<any> {
     }
 }
 
+/**
+ * W3C traceparent for the upstream call: the caller's if it sent a valid one,
+ * otherwise a new sampled trace, so each chat turn is one trace end to end
+ */
+function getTraceparent(request: Request): string {
+    const incoming = request.headers.get('traceparent');
+    if (incoming && /^[0-9a-f]{2}-[0-9a-f]{32}-[0-9a-f]{16}-[0-9a-f]{2}$/.test(incoming)) {
+        return incoming;
+    }
+    const traceId = crypto.randomUUID().replace(/-/g, '');
+    const spanId = crypto.randomUUID().replace(/-/g, '').substring(0, 16);
+    return `00-${traceId}-${spanId}-01`;
+}
+
 export async function POST(request: Request) {
     try {
         const body = await request.json();
-        const { query, project_id, session_id, history, persona } = body;
+        const { query, project_id, session_id, history, persona, workflow_state, stream } = body;
 
         if (!query || !project_id) {
             return NextResponse.json(
@@ -88,34 +102,67 @@ export async function POST(request: Request) {
         }
 
         const aiAgentUrl = process.env.AI_AGENT_API_URL || 'http://localhost:8001';
+        // Token streaming over Server-Sent Events; workflows always use the JSON endpoint
+        const streaming = stream === true && !workflow_state;
+        const endpoint = streaming ? '/chat/stream' : '/chat';
 
-        console.log(`🚀 Proxying chat request to: ${aiAgentUrl}/chat`);
+        const traceparent = getTraceparent(request);
+        const traceId = traceparent.split('-')[1];
 
-        const response = await fetch(`${aiAgentUrl}/chat`, {
+        console.log(`🚀 Proxying chat request to: ${aiAgentUrl}${endpoint} (trace ${traceId})`);
+
+        const response = await fetch(`${aiAgentUrl}${endpoint}`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'traceparent': traceparent,
             },
+            // Aborting when the visitor disconnects cancels generation upstream
+            signal: request.signal,
             body: JSON.stringify({
                 query,
                 project_id,
                 session_id,
                 history: history || [],
-                persona: persona || {}
+                persona: persona || {},
+                workflow_state: workflow_state || null
             }),
         });
 
         if (!response.ok) {
             const errorText = await response.text();
-            console.error('❌ AI Agent Service error:', errorText);
+            console.error(`❌ AI Agent Service error (trace ${traceId}):`, errorText);
+
+            // Workflow cache miss: the client must resend the full workflow definition
+            if (response.status === 409) {
+                return NextResponse.json(
+                    { error: 'Workflow definition required', code: 'workflow_definition_required' },
+                    { status: 409 }
+                );
+            }
+
             return NextResponse.json(
                 { error: 'Failed to get response from AI Agent' },
                 { status: response.status }
             );
         }
 
+        if (streaming) {
+            // Pass events through as they arrive instead of buffering the body
+            return new Response(response.body, {
+                status: response.status,
+                headers: {
+                    'Content-Type': 'text/event-stream',
+                    'Cache-Control': 'no-cache, no-transform',
+                    'Connection': 'keep-alive',
+                    'X-Accel-Buffering': 'no',
+                    'X-Trace-Id': traceId,
+                },
+            });
+        }
+
         const data = await response.json();
-        return NextResponse.json(data);
+        return NextResponse.json(data, { headers: { 'X-Trace-Id': traceId } });
 
     } catch (error) {
         console.error('❌ Chat API Error:', error);
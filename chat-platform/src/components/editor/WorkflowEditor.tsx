@@ -28,6 +28,8 @@ import AIAgentNode from './workflow-nodes/AIAgentNode';
 import APICallNode from './workflow-nodes/APICallNode';
 import VariableSetNode from './workflow-nodes/VariableSetNode';
 import HandoffNode from './workflow-nodes/HandoffNode';
+import ParallelNode from './workflow-nodes/ParallelNode';
+import JoinNode from './workflow-nodes/JoinNode';
 import EndNode from './workflow-nodes/EndNode';
 import NodePalette from './workflow-nodes/NodePalette';
 
@@ -40,6 +42,8 @@ const nodeTypes = {
     'api-call': APICallNode,
     'variable-set': VariableSetNode,
     handoff: HandoffNode,
+    parallel: ParallelNode,
+    join: JoinNode,
     end: EndNode,
 };
 
@@ -365,6 +369,42 @@ export default function WorkflowEditor({ workflow, onSave, onClose, apiWhitelist
                                                     placeholder="api_response"
                                                 />
                                             </div>
+                                            <div>
+                                                <label className="block text-xs font-medium text-gray-700 dark:text-gray-300 mb-1">Extract (JSON: variable → JSONPath)</label>
+                                                <input
+                                                    type="text"
+                                                    value={typeof selectedNode.data.extract === 'string' ? selectedNode.data.extract : JSON.stringify(selectedNode.data.extract || {})}
+                                                    onChange={(e) => handleNodeDataChange(selectedNode.id, { extract: e.target.value })}
+                                                    className="w-full px-3 py-2 text-sm border border-gray-300 dark:border-gray-600 rounded-lg bg-white dark:bg-gray-800 font-mono"
+                                                    placeholder='{"plan": "$.account.plan"}'
+                                                />
+                                                <p className="mt-1 text-[10px] text-gray-400">
+                                                    When set, only these values are stored instead of the whole response.
+                                                </p>
+                                            </div>
+                                            <div className="grid grid-cols-2 gap-2">
+                                                <div>
+                                                    <label className="block text-xs font-medium text-gray-700 dark:text-gray-300 mb-1">Timeout (ms)</label>
+                                                    <input
+                                                        type="number"
+                                                        min={100}
+                                                        value={selectedNode.data.timeoutMs as number || 5000}
+                                                        onChange={(e) => handleNodeDataChange(selectedNode.id, { timeoutMs: parseInt(e.target.value) || undefined })}
+                                                        className="w-full px-3 py-2 text-sm border border-gray-300 dark:border-gray-600 rounded-lg bg-white dark:bg-gray-800"
+                                                    />
+                                                </div>
+                                                <div>
+                                                    <label className="block text-xs font-medium text-gray-700 dark:text-gray-300 mb-1">Retries</label>
+                                                    <input
+                                                        type="number"
+                                                        min={0}
+                                                        max={5}
+                                                        value={selectedNode.data.retries as number ?? 2}
+                                                        onChange={(e) => handleNodeDataChange(selectedNode.id, { retries: parseInt(e.target.value) })}
+                                                        className="w-full px-3 py-2 text-sm border border-gray-300 dark:border-gray-600 rounded-lg bg-white dark:bg-gray-800"
+                                                    />
+                                                </div>
+                                            </div>
                                         </div>
                                     )}
 
@@ -409,6 +449,23 @@ export default function WorkflowEditor({ workflow, onSave, onClose, apiWhitelist
                                         </div>
                                     )}
 
+                                    {/* Parallel Node */}
+                                    {selectedNode.type === 'parallel' && (
+                                        <div>
+                                            <label className="block text-xs font-medium text-gray-700 dark:text-gray-300 mb-1">Branch Timeout (ms)</label>
+                                            <input
+                                                type="number"
+                                                min={100}
+                                                value={selectedNode.data.branchTimeoutMs as number || 10000}
+                                                onChange={(e) => handleNodeDataChange(selectedNode.id, { branchTimeoutMs: parseInt(e.target.value) || undefined })}
+                                                className="w-full px-3 py-2 text-sm border border-gray-300 dark:border-gray-600 rounded-lg bg-white dark:bg-gray-800"
+                                            />
+                                            <p className="mt-1 text-[10px] text-gray-400">
+                                                Each outgoing edge runs concurrently; all branches must end at the same Join node.
+                                            </p>
+                                        </div>
+                                    )}
+
                                     <div className="pt-4 text-[10px] text-gray-400">
                                         Changes are applied immediately. Remember to save the workflow.
                                     </div>
@@ -440,6 +497,10 @@ function getDefaultNodeData(type: string): any {
             return { variableName: '', value: '', valueType: 'static', executionLocation: 'frontend' };
         case 'handoff':
             return { target: 'human', executionLocation: 'backend' };
+        case 'parallel':
+            return { branchTimeoutMs: 10000, executionLocation: 'backend' };
+        case 'join':
+            return { executionLocation: 'backend' };
         case 'end':
             return { executionLocation: 'frontend' };
         default:
@@ -0,0 +1,16 @@
+import { memo } from 'react';
+import { Handle, Position } from '@xyflow/react';
+import { GitMerge } from 'lucide-react';
+
+export default memo(({ data }: { data: any }) => {
+    return (
+        <div className="px-4 py-3 shadow-lg rounded-lg bg-teal-50 dark:bg-teal-900/30 border-2 border-teal-500">
+            <Handle type="target" position={Position.Left} className="w-3 h-3 !bg-teal-500" />
+            <div className="flex items-center gap-2">
+                <GitMerge className="h-4 w-4 text-teal-700 dark:text-teal-300" />
+                <div className="text-sm font-semibold text-teal-900 dark:text-teal-100">Join</div>
+            </div>
+            <Handle type="source" position={Position.Right} className="w-3 h-3 !bg-teal-500" />
+        </div>
+    );
+});
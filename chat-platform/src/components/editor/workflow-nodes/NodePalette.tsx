@@ -9,6 +9,8 @@ import {
     Globe,
     Variable,
     UserPlus,
+    GitFork,
+    GitMerge,
     StopCircle,
 } from 'lucide-react';
 
@@ -24,6 +26,8 @@ const nodeDefinitions = [
     { type: 'ai-agent', label: 'AI Agent', icon: Brain, color: 'bg-indigo-100 dark:bg-indigo-900/30 text-indigo-700 dark:text-indigo-300', description: 'Call LLM' },
     { type: 'api-call', label: 'API Call', icon: Globe, color: 'bg-cyan-100 dark:bg-cyan-900/30 text-cyan-700 dark:text-cyan-300', description: 'External API' },
     { type: 'variable-set', label: 'Set Variable', icon: Variable, color: 'bg-pink-100 dark:bg-pink-900/30 text-pink-700 dark:text-pink-300', description: 'Store value' },
+    { type: 'parallel', label: 'Parallel', icon: GitFork, color: 'bg-teal-100 dark:bg-teal-900/30 text-teal-700 dark:text-teal-300', description: 'Run branches' },
+    { type: 'join', label: 'Join', icon: GitMerge, color: 'bg-teal-100 dark:bg-teal-900/30 text-teal-700 dark:text-teal-300', description: 'Merge branches' },
     { type: 'handoff', label: 'Handoff', icon: UserPlus, color: 'bg-orange-100 dark:bg-orange-900/30 text-orange-700 dark:text-orange-300', description: 'Transfer' },
     { type: 'end', label: 'End', icon: StopCircle, color: 'bg-red-100 dark:bg-red-900/30 text-red-700 dark:text-red-300', description: 'Terminate' },
 ];
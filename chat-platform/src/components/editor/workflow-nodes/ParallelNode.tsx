@@ -0,0 +1,22 @@
+import { memo } from 'react';
+import { Handle, Position } from '@xyflow/react';
+import { GitFork } from 'lucide-react';
+
+export default memo(({ data }: { data: any }) => {
+    return (
+        <div className="px-4 py-3 shadow-lg rounded-lg bg-teal-50 dark:bg-teal-900/30 border-2 border-teal-500 min-w-[200px]">
+            <Handle type="target" position={Position.Left} className="w-3 h-3 !bg-teal-500" />
+            <div className="flex items-center gap-2 mb-2">
+                <GitFork className="h-4 w-4 text-teal-700 dark:text-teal-300" />
+                <div className="text-sm font-semibold text-teal-900 dark:text-teal-100">Parallel</div>
+                <div className="ml-auto px-2 py-0.5 text-[10px] bg-teal-200 dark:bg-teal-800 text-teal-800 dark:text-teal-200 rounded">
+                    Backend
+                </div>
+            </div>
+            <div className="text-xs text-teal-800 dark:text-teal-200">
+                Timeout {data.branchTimeoutMs || 10000}ms per branch
+            </div>
+            <Handle type="source" position={Position.Right} className="w-3 h-3 !bg-teal-500" />
+        </div>
+    );
+});
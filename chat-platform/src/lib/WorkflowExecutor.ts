@@ -8,23 +8,29 @@ import {
 import { getNextNodeId } from './workflow-utils';
 
 /**
- * Frontend workflow executor for hybrid execution
- * Executes frontend-compatible nodes and delegates to backend when needed
+ * Frontend workflow executor
+ * By default a whole turn runs on the backend until the workflow needs input;
+ * with runOnServer disabled, frontend-compatible nodes run locally (hybrid mode)
  */
 export class WorkflowExecutor {
     private workflow: WorkflowDefinition;
     private state: WorkflowExecutionState;
     private projectId: string;
     private sessionId: string;
+    // Hash of the definition compiled by the backend; sent instead of the full workflow
+    private workflowHash?: string;
+    private runOnServer: boolean;
 
     constructor(
         workflow: WorkflowDefinition,
         projectId: string,
-        sessionId: string = 'default'
+        sessionId: string = 'default',
+        runOnServer: boolean = true
     ) {
         this.workflow = workflow;
         this.projectId = projectId;
         this.sessionId = sessionId;
+        this.runOnServer = runOnServer;
 
         // Initialize state with start node
         const startNode = workflow.nodes.find(n => n.type === 'start');
@@ -48,6 +54,11 @@ export class WorkflowExecutor {
         this.state.currentNodeId = startNode.id;
         this.state.executionHistory.push(startNode.id);
 
+        // One request runs every node up to the first input prompt
+        if (this.runOnServer) {
+            return this.executeOnBackend(startNode);
+        }
+
         // Move to next node after start
         const nextNodeId = getNextNodeId(startNode, this.workflow.edges);
         if (!nextNodeId) {
@@ -67,6 +78,19 @@ export class WorkflowExecutor {
      */
     async processUserInput(input: string): Promise<NodeExecutionResult> {
         this.state.userInput = input;
+
+        if (this.runOnServer) {
+            const currentNode = this.workflow.nodes.find(n => n.id === this.state.currentNodeId);
+            if (!currentNode) {
+                return {
+                    messages: ['Error: Invalid workflow state'],
+                    nextNodeId: null,
+                    isComplete: true,
+                };
+            }
+            return this.executeOnBackend(currentNode);
+        }
+
         return this.executeCurrentNode();
     }
 
@@ -98,7 +122,7 @@ export class WorkflowExecutor {
      * Check if node requires backend execution
      */
     private requiresBackendExecution(node: WorkflowNode): boolean {
-        return ['ai-agent', 'api-call', 'handoff'].includes(node.type);
+        return ['ai-agent', 'api-call', 'handoff', 'parallel', 'join'].includes(node.type);
     }
 
     /**
@@ -106,22 +130,18 @@ export class WorkflowExecutor {
      */
     private async executeOnBackend(node: WorkflowNode): Promise<NodeExecutionResult> {
         try {
-            const response = await fetch('/api/chat', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    query: this.state.userInput || '',
-                    project_id: this.projectId,
-                    session_id: this.sessionId,
-                    workflow_state: {
-                        currentNodeId: node.id,
-                        variables: this.state.variables,
-                        executionHistory: this.state.executionHistory,
-                    },
-                }),
-            });
+            let response = await this.postWorkflowState(node, false);
+
+            // Backend no longer has this workflow cached: resend the full definition once
+            if (response.status === 409) {
+                this.workflowHash = undefined;
+                response = await this.postWorkflowState(node, true);
+            }
 
             const data = await response.json();
+            if (data.workflow_hash) {
+                this.workflowHash = data.workflow_hash;
+            }
 
             // Update state with backend result
             if (data.node_result) {
@@ -133,6 +153,7 @@ export class WorkflowExecutor {
                     messages: result.messages || [data.response],
                     nextNodeId: result.nextNodeId,
                     variables: this.state.variables,
+                    requiresInput: result.requiresInput,
                     isComplete: !result.nextNodeId,
                 };
             }
@@ -152,6 +173,32 @@ export class WorkflowExecutor {
         }
     }
 
+    /**
+     * Send workflow state to the backend, with the full definition only when needed
+     */
+    private postWorkflowState(node: WorkflowNode, includeDefinition: boolean): Promise<Response> {
+        const sendDefinition = includeDefinition || !this.workflowHash;
+
+        return fetch('/api/chat', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                query: this.state.userInput || '',
+                project_id: this.projectId,
+                session_id: this.sessionId,
+                workflow_state: {
+                    currentNodeId: node.id,
+                    variables: this.state.variables,
+                    executionHistory: this.state.executionHistory,
+                    userInput: this.state.userInput ?? null,
+                    ...(sendDefinition
+                        ? { workflow: this.workflow }
+                        : { workflowHash: this.workflowHash }),
+                },
+            }),
+        });
+    }
+
     /**
      * Execute node on frontend
      */
@@ -11,6 +11,8 @@ export type NodeType =
     | 'api-call'
     | 'variable-set'
     | 'handoff'
+    | 'parallel'
+    | 'join'
     | 'end';
 
 export type ExecutionLocation = 'frontend' | 'backend';
@@ -54,6 +56,7 @@ export interface WorkflowExecutionState {
     variables: Record<string, any>;
     executionHistory: string[];
     userInput?: string;
+    workflowHash?: string; // Set once the backend has compiled the definition
 }
 
 export interface NodeExecutionResult {
@@ -101,6 +104,10 @@ export interface APICallNodeData {
     headers?: Record<string, string>;
     body?: string;
     responseVariable?: string;
+    extract?: Record<string, string>; // variable name -> JSONPath, e.g. { "plan": "$.account.plan" }
+    timeoutMs?: number;
+    retries?: number;
+    maxResponseBytes?: number;
 }
 
 export interface VariableSetNodeData {
@@ -114,3 +121,8 @@ export interface HandoffNodeData {
     targetId?: string;
     message?: string;
 }
+
+// Each outgoing edge of a parallel node starts a branch; all branches meet at one join node
+export interface ParallelNodeData {
+    branchTimeoutMs?: number;
+}
@@ -83,6 +83,15 @@ export function validateWorkflow(workflow: WorkflowDefinition): WorkflowValidati
                     });
                 }
                 break;
+            case 'parallel':
+                if (workflow.edges.filter(e => e.source === node.id).length < 2) {
+                    errors.push({
+                        type: 'error',
+                        message: 'Parallel node must have at least two outgoing branches',
+                        nodeId: node.id,
+                    });
+                }
+                break;
             case 'variable-set':
                 if (!node.data.variableName || node.data.variableName.trim() === '') {
                     errors.push({
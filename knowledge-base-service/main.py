@@ -1,16 +1,36 @@
-from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Request
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from database import get_mongo_db, get_qdrant_client
 from services.file_processing import save_upload_file, extract_text, chunk_text
+from services.bulk_ingestion import BulkIngestion, BulkLimitError, ingest_uploads
 from services.scraping import scrape_website
 from services.embeddings import generate_embedding, generate_query_embedding
+from services.vector_collections import (
+    collection_for, configured_dimensions, dimensions_for, ensure_collection, knowledge_base_collections
+)
+from services.single_flight import SingleFlight, flight_key
+from services.metrics import (
+    HTTP_REQUEST_SECONDS, STAGE_SECONDS, QUERIES, INGESTED_CHUNKS, INGESTED_DOCUMENTS,
+    project_label, render_metrics, stage
+)
+from services.tracing import setup_tracing, shutdown_tracing, TracingMiddleware
+from services.log import setup_logging, shutdown_logging, LogContextMiddleware
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as qmodels
 from pymongo.database import Database
 from datetime import datetime
+from typing import List
+import asyncio
+import logging
 import uuid
 import time
 
+setup_logging("knowledge-base-service")
+setup_tracing("knowledge-base-service")
+
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Knowledge Base Service",
     description="Microservice for managing files and generating embeddings",
@@ -25,34 +45,51 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(LogContextMiddleware)
+# Continues the AI Agent Service's trace for /query
+app.add_middleware(TracingMiddleware)
+
+query_flight = SingleFlight()
 
-# Constants
-COLLECTION_NAME = "makkn_knowledge_base"
-VECTOR_SIZE = 768 # Gemini 1.5 embedding dimension
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route templates, not raw paths, keep the label set bounded
+        route = request.scope.get("route")
+        if route is not None and request.url.path != "/metrics":
+            HTTP_REQUEST_SECONDS.labels(route.path, request.method, str(status)).observe(time.perf_counter() - started)
 
 @app.on_event("startup")
 async def startup_event():
     client = get_qdrant_client()
     try:
-        # Check if collection exists
-        collections = client.get_collections().collections
-        collection_exists = any(col.name == COLLECTION_NAME for col in collections)
-        
-        if not collection_exists:
-            client.create_collection(
-                collection_name=COLLECTION_NAME,
-                vectors_config=qmodels.VectorParams(size=VECTOR_SIZE, distance=qmodels.Distance.COSINE)
-            )
-            print(f"Created Qdrant collection: {COLLECTION_NAME}")
-        else:
-            print(f"Qdrant collection already exists: {COLLECTION_NAME}")
-    except Exception as e:
-        print(f"Error during startup: {e}")
+        # One collection per configured vector size (see services/vector_collections.py)
+        for dimensions in configured_dimensions():
+            ensure_collection(client, dimensions)
+    except Exception:
+        logger.exception("Error during startup")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    shutdown_tracing()
+    shutdown_logging()
 
 @app.get("/")
 async def root():
     return {"message": "Knowledge Base Service is running (Mongo + Qdrant)"}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -65,7 +102,8 @@ async def upload_file(
     qdrant: QdrantClient = Depends(get_qdrant_client)
 ):
     # 1. Save file
-    file_path = await save_upload_file(file, project_id)
+    with stage("upload", "save"):
+        file_path = await save_upload_file(file, project_id)
     
     # 2. Create Document record in MongoDB
     doc_id = str(uuid.uuid4())
@@ -78,24 +116,30 @@ async def upload_file(
         "upload_date": datetime.utcnow(),
         "status": "processing"
     }
-    mongo_db.documents.insert_one(doc_data)
+    with stage("upload", "mongo"):
+        mongo_db.documents.insert_one(doc_data)
     
     try:
         # 3. Extract text
-        text_content = extract_text(file_path, file.content_type)
+        with stage("upload", "extract"):
+            text_content = extract_text(file_path, file.content_type)
         if not text_content:
             raise Exception("Failed to extract text")
             
         # 4. Chunk text
-        chunks = chunk_text(text_content)
+        with stage("upload", "chunk"):
+            chunks = chunk_text(text_content)
         
         # 5. Generate embeddings and save chunks to Qdrant
+        dimensions = dimensions_for(project_id)
+        collection_name = ensure_collection(qdrant, dimensions)
         points = []
+        embed_started = time.perf_counter()
         for i, chunk_text_content in enumerate(chunks):
             # Rate limit mitigation for Free Tier
             time.sleep(1)
             
-            embedding = generate_embedding(chunk_text_content)
+            embedding = generate_embedding(chunk_text_content, dimensions)
             if embedding:
                 point_id = str(uuid.uuid4())
                 points.append(qmodels.PointStruct(
@@ -108,19 +152,25 @@ async def upload_file(
                         "chunk_index": i
                     }
                 ))
+        # Includes the free-tier rate limit pause between chunks
+        STAGE_SECONDS.labels("upload", "embed").observe(time.perf_counter() - embed_started)
         
         if points:
-            qdrant.upsert(
-                collection_name=COLLECTION_NAME,
-                points=points
-            )
+            with stage("upload", "qdrant_upsert"):
+                qdrant.upsert(
+                    collection_name=collection_name,
+                    points=points
+                )
         
         # Update status
-        mongo_db.documents.update_one(
-            {"_id": doc_id},
-            {"$set": {"status": "completed", "chunks_count": len(points)}}
-        )
+        with stage("upload", "mongo"):
+            mongo_db.documents.update_one(
+                {"_id": doc_id},
+                {"$set": {"status": "completed", "chunks_count": len(points)}}
+            )
         
+        INGESTED_CHUNKS.labels(project_label(project_id), "file").inc(len(points))
+        INGESTED_DOCUMENTS.labels(project_label(project_id), "file", "completed").inc()
         return {"id": doc_id, "status": "completed", "chunks": len(points)}
         
     except Exception as e:
@@ -128,6 +178,37 @@ async def upload_file(
             {"_id": doc_id},
             {"$set": {"status": "failed", "error": str(e)}}
         )
+        INGESTED_DOCUMENTS.labels(project_label(project_id), "file", "failed").inc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/upload/bulk")
+async def upload_bulk(
+    files: List[UploadFile] = File(...),
+    project_id: str = Form(...),
+    mongo_db: Database = Depends(get_mongo_db),
+    qdrant: QdrantClient = Depends(get_qdrant_client)
+):
+    """
+    Many files and/or zip or tar archives in one request. All of them share
+    batched embedding requests, Qdrant upserts and MongoDB writes.
+    """
+    # 1. Save the uploads as received; archives are kept whole, not extracted
+    uploads = []
+    with stage("upload_bulk", "save"):
+        for file in files:
+            file_path = await save_upload_file(file, project_id)
+            file.file.seek(0)
+            uploads.append((file.file, file.filename, file.content_type, file_path))
+
+    # 2. Extract, chunk, embed and store (blocking, kept off the event loop)
+    try:
+        # Creating the project's collection on first use is a blocking Qdrant call too
+        ingestion = await asyncio.to_thread(BulkIngestion, project_id, mongo_db, qdrant)
+        return await asyncio.to_thread(ingest_uploads, ingestion, uploads)
+    except BulkLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logger.exception("Bulk ingestion failed", extra={"project_id": project_id})
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/query")
@@ -137,25 +218,39 @@ async def query_knowledge_base(
     limit: int = 5,
     qdrant: QdrantClient = Depends(get_qdrant_client)
 ):
-    # 1. Generate query embedding
-    query_embedding = generate_query_embedding(query)
+    QUERIES.labels(project_label(project_id)).inc()
+    # Identical concurrent questions share one embedding call and one vector search
+    return await query_flight.do(
+        flight_key(project_id, query, limit),
+        lambda: search_knowledge_base(query, project_id, limit, qdrant)
+    )
+
+async def search_knowledge_base(query: str, project_id: str, limit: int, qdrant: QdrantClient):
+    # The project's vectors, and so its query vector, may be reduced-size
+    dimensions = dimensions_for(project_id)
+
+    # 1. Generate query embedding (blocking client, kept off the event loop)
+    with stage("query", "embed"):
+        query_embedding = await asyncio.to_thread(generate_query_embedding, query, dimensions)
     if not query_embedding:
         raise HTTPException(status_code=500, detail="Failed to generate embedding")
         
     # 2. Perform vector search using Qdrant
-    search_result = qdrant.search(
-        collection_name=COLLECTION_NAME,
-        query_vector=query_embedding,
-        query_filter=qmodels.Filter(
-            must=[
-                qmodels.FieldCondition(
-                    key="project_id",
-                    match=qmodels.MatchValue(value=project_id)
-                )
-            ]
-        ),
-        limit=limit
-    )
+    with stage("query", "qdrant_search"):
+        search_result = await asyncio.to_thread(
+            qdrant.search,
+            collection_name=collection_for(dimensions),
+            query_vector=query_embedding,
+            query_filter=qmodels.Filter(
+                must=[
+                    qmodels.FieldCondition(
+                        key="project_id",
+                        match=qmodels.MatchValue(value=project_id)
+                    )
+                ]
+            ),
+            limit=limit
+        )
     
     return [
         {
@@ -184,30 +279,36 @@ async def crawl_website(
         "upload_date": datetime.utcnow(),
         "status": "processing"
     }
-    mongo_db.documents.insert_one(doc_data)
+    with stage("crawl", "mongo"):
+        mongo_db.documents.insert_one(doc_data)
     
     try:
         # 2. Scrape website
-        print(f"🌐 Starting scrape for: {url}")
-        text_content = scrape_website(url)
+        logger.info("Starting scrape", extra={"project_id": project_id, "url": url})
+        with stage("crawl", "scrape"):
+            text_content = scrape_website(url)
         if not text_content:
             raise Exception("Failed to scrape content")
-        print(f"📝 Scraped content length: {len(text_content)} characters")
+        logger.info("Scraped content", extra={"chars": len(text_content)})
             
         # 3. Chunk text
-        print(f"✂️  Starting chunking...")
-        chunks = chunk_text(text_content)
-        print(f"📦 Created {len(chunks)} chunks")
+        logger.debug("Starting chunking")
+        with stage("crawl", "chunk"):
+            chunks = chunk_text(text_content)
+        logger.info("Created chunks", extra={"chunks": len(chunks)})
         
         # 4. Generate embeddings and save chunks to Qdrant
+        dimensions = dimensions_for(project_id)
+        collection_name = ensure_collection(qdrant, dimensions)
         points = []
+        embed_started = time.perf_counter()
         for i, chunk_text_content in enumerate(chunks):
-            print(f"🔢 Generating embedding for chunk {i+1}/{len(chunks)}")
+            logger.debug("Generating embedding for chunk %d/%d", i + 1, len(chunks))
             
             # Rate limit mitigation for Free Tier
             time.sleep(1)
             
-            embedding = generate_embedding(chunk_text_content)
+            embedding = generate_embedding(chunk_text_content, dimensions)
             if embedding:
                 point_id = str(uuid.uuid4())
                 points.append(qmodels.PointStruct(
@@ -223,22 +324,27 @@ async def crawl_website(
                     }
                 ))
             else:
-                print(f"⚠️  Failed to generate embedding for chunk {i+1}")
+                logger.warning("Failed to generate embedding for chunk %d", i + 1, extra={"project_id": project_id})
+        STAGE_SECONDS.labels("crawl", "embed").observe(time.perf_counter() - embed_started)
         
-        print(f"💾 Upserting {len(points)} points to Qdrant")
+        logger.debug("Upserting %d points to Qdrant", len(points))
         if points:
-            qdrant.upsert(
-                collection_name=COLLECTION_NAME,
-                points=points
-            )
+            with stage("crawl", "qdrant_upsert"):
+                qdrant.upsert(
+                    collection_name=collection_name,
+                    points=points
+                )
         
         # Update status
-        mongo_db.documents.update_one(
-            {"_id": doc_id},
-            {"$set": {"status": "completed", "chunks_count": len(points)}}
-        )
+        with stage("crawl", "mongo"):
+            mongo_db.documents.update_one(
+                {"_id": doc_id},
+                {"$set": {"status": "completed", "chunks_count": len(points)}}
+            )
         
-        print(f"✅ Crawl completed: {len(points)} chunks stored")
+        INGESTED_CHUNKS.labels(project_label(project_id), "website").inc(len(points))
+        INGESTED_DOCUMENTS.labels(project_label(project_id), "website", "completed").inc()
+        logger.info("Crawl completed", extra={"project_id": project_id, "chunks": len(points)})
         return {"id": doc_id, "status": "completed", "chunks": len(points)}
         
     except Exception as e:
@@ -246,6 +352,7 @@ async def crawl_website(
             {"_id": doc_id},
             {"$set": {"status": "failed", "error": str(e)}}
         )
+        INGESTED_DOCUMENTS.labels(project_label(project_id), "website", "failed").inc()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/documents")
@@ -271,19 +378,21 @@ async def delete_document(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Document not found")
         
-    # 2. Delete vectors from Qdrant
-    qdrant.delete(
-        collection_name=COLLECTION_NAME,
-        points_selector=qmodels.FilterSelector(
-            filter=qmodels.Filter(
-                must=[
-                    qmodels.FieldCondition(
-                        key="document_id",
-                        match=qmodels.MatchValue(value=doc_id)
-                    )
-                ]
+    # 2. Delete vectors from Qdrant, in every collection so a migration
+    # copying the project between sizes cannot bring them back
+    for collection_name in knowledge_base_collections(qdrant):
+        qdrant.delete(
+            collection_name=collection_name,
+            points_selector=qmodels.FilterSelector(
+                filter=qmodels.Filter(
+                    must=[
+                        qmodels.FieldCondition(
+                            key="document_id",
+                            match=qmodels.MatchValue(value=doc_id)
+                        )
+                    ]
+                )
             )
         )
-    )
     
     return {"status": "deleted", "id": doc_id}
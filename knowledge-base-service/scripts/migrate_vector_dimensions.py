@@ -0,0 +1,132 @@
+"""
+Copy stored embeddings into a smaller-vector collection, without re-embedding.
+Run from knowledge-base-service/ against the same Qdrant as the service:
+
+    python scripts/migrate_vector_dimensions.py --to 256 --project proj_a
+    python scripts/migrate_vector_dimensions.py --to 256 --project proj_a --delete-source
+
+Each stored vector is truncated to its first --to components and renormalized,
+which is exactly what ingestion now does for a reduced-size project, so the
+copies match newly ingested chunks. Point ids and payloads are kept, so the
+copy is idempotent and can be re-run.
+
+Moving a project:
+  1. Copy it (first command). Queries still read the source collection.
+  2. Add the project to KB_PROJECT_VECTOR_DIMENSIONS (or change
+     KB_VECTOR_DIMENSIONS for every project) and restart the service.
+  3. Copy again with --delete-source: chunks ingested between steps 1 and 2
+     are copied, then the project's points are removed from the source.
+Without --project every point in the source collection is copied, and
+--delete-source then drops the source collection, but only once no project is
+configured for the source size any more (KB_VECTOR_DIMENSIONS and every
+KB_PROJECT_VECTOR_DIMENSIONS entry). Likewise a project's points are only
+removed after it is configured for another size. The script reads the same
+environment as the service, so run it with the new configuration.
+
+Going back to more dimensions needs the chunks re-ingested; truncated vectors
+cannot be extended.
+"""
+
+from typing import List, Optional
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qdrant_client.http import models as qmodels  # noqa: E402
+from database import get_qdrant_client  # noqa: E402
+from services.embeddings import VECTOR_SIZE, reduce_embedding  # noqa: E402
+from services.vector_collections import collection_for, configured_dimensions, dimensions_for, ensure_collection  # noqa: E402
+
+
+def project_filter(projects: List[str]) -> Optional[qmodels.Filter]:
+    if not projects:
+        return None
+    return qmodels.Filter(must=[qmodels.FieldCondition(key="project_id", match=qmodels.MatchAny(any=projects))])
+
+
+def migrate(client, source_dimensions: int, target_dimensions: int, projects: List[str], batch_size: int) -> int:
+    source = collection_for(source_dimensions)
+    target = ensure_collection(client, target_dimensions)
+    selection = project_filter(projects)
+
+    copied, offset = 0, None
+    while True:
+        points, offset = client.scroll(
+            collection_name=source,
+            scroll_filter=selection,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        if points:
+            client.upsert(
+                collection_name=target,
+                points=[
+                    qmodels.PointStruct(id=point.id, vector=reduce_embedding(point.vector, target_dimensions), payload=point.payload)
+                    for point in points
+                ]
+            )
+            copied += len(points)
+            print(f"  copied {copied} points", file=sys.stderr)
+        if offset is None:
+            return copied
+
+
+def delete_source_blocker(source_dimensions: int, projects: List[str]) -> Optional[str]:
+    """Why the source must be kept: it is still where some project is stored and searched"""
+    if projects:
+        still_there = [project for project in projects if dimensions_for(project) == source_dimensions]
+        if still_there:
+            return f"{', '.join(still_there)} still configured for {source_dimensions} dimensions"
+    elif source_dimensions in configured_dimensions():
+        return f"projects are still configured for {source_dimensions} dimensions; pass --project to remove only the moved ones"
+    return None
+
+
+def delete_source(client, source_dimensions: int, projects: List[str]):
+    source = collection_for(source_dimensions)
+    if projects:
+        client.delete(collection_name=source, points_selector=qmodels.FilterSelector(filter=project_filter(projects)))
+    else:
+        client.delete_collection(collection_name=source)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--to", type=int, required=True, help="Target vector dimensions")
+    parser.add_argument("--from", dest="source", type=int, default=VECTOR_SIZE, help="Dimensions of the source collection")
+    parser.add_argument("--project", action="append", default=[], help="Project to move (repeatable); default all")
+    parser.add_argument("--delete-source", action="store_true", help="Remove the copied points from the source afterwards")
+    parser.add_argument("--batch-size", type=int, default=256)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.to >= args.source:
+        print(f"--to must be smaller than --from ({args.source}); re-ingest to grow vectors", file=sys.stderr)
+        return 2
+
+    blocker = delete_source_blocker(args.source, args.project) if args.delete_source else None
+    if blocker:
+        # Checked before copying, so nothing is half done
+        print(f"Not deleting from {collection_for(args.source)}: {blocker}", file=sys.stderr)
+        return 2
+
+    client = get_qdrant_client()
+    started = time.perf_counter()
+    print(f"{collection_for(args.source)} -> {collection_for(args.to)}", file=sys.stderr)
+    copied = migrate(client, args.source, args.to, args.project, args.batch_size)
+    if args.delete_source:
+        delete_source(client, args.source, args.project)
+    print(f"Copied {copied} points in {time.perf_counter() - started:.1f}s"
+          + (", source removed" if args.delete_source else ""), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""
+Bulk ingestion for /upload/bulk
+Many files, or zip/tar archives of them, go through one pipeline: chunks of
+all files are embedded EMBEDDING_BATCH_SIZE at a time with one request per
+batch, points are upserted to Qdrant KB_UPSERT_BATCH_SIZE at a time, and
+document records are written with insert_many / bulk_write. Archive members
+are read one at a time from the uploaded archive; nothing is extracted to
+disk. Runs in a worker thread: every call here blocks.
+"""
+
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+from datetime import datetime
+import logging
+import os
+import posixpath
+import tarfile
+import time
+import uuid
+import zipfile
+import zlib
+from pymongo import UpdateOne
+from pymongo.database import Database
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qmodels
+from services.embeddings import EMBEDDING_BATCH_SIZE, generate_embeddings
+from services.file_processing import extract_text_from_bytes, chunk_text
+from services.metrics import INGESTED_CHUNKS, INGESTED_DOCUMENTS, STAGE_SECONDS, project_label, stage
+from services.vector_collections import dimensions_for, ensure_collection
+
+logger = logging.getLogger(__name__)
+
+KB_BULK_MAX_FILES = int(os.getenv("KB_BULK_MAX_FILES", "5000"))  # Files and archive members per request
+KB_BULK_MAX_FILE_BYTES = int(os.getenv("KB_BULK_MAX_FILE_BYTES", str(50 * 1024 * 1024)))  # Per file, after decompression
+KB_UPSERT_BATCH_SIZE = int(os.getenv("KB_UPSERT_BATCH_SIZE", "256"))
+# Pause between embedding batches, the batched form of /upload's free-tier pause per chunk
+KB_EMBED_BATCH_INTERVAL_SECONDS = float(os.getenv("KB_EMBED_BATCH_INTERVAL_SECONDS", "1"))
+
+ENDPOINT = "upload_bulk"
+
+_CONTENT_TYPES = {
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".txt": "text/plain",
+    ".md": "text/markdown",
+    ".markdown": "text/markdown"
+}
+_TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+# Raised while reading one archive member: encrypted (RuntimeError), unsupported
+# compression (NotImplementedError), corrupt or truncated data
+_MEMBER_ERRORS = (RuntimeError, NotImplementedError, zlib.error, zipfile.BadZipFile, OSError, EOFError)
+
+
+class BulkLimitError(Exception):
+    """The request holds more files than KB_BULK_MAX_FILES"""
+
+
+def content_type_for(filename: str, declared: Optional[str] = None) -> Optional[str]:
+    """Supported content type from the extension, else the declared one if it is supported"""
+    content_type = _CONTENT_TYPES.get(posixpath.splitext(filename.lower())[1])
+    if content_type:
+        return content_type
+    if declared in _CONTENT_TYPES.values():
+        return declared
+    return None
+
+
+def archive_kind(filename: str, content_type: Optional[str]) -> Optional[str]:
+    name = filename.lower()
+    if name.endswith(".zip") or content_type in ("application/zip", "application/x-zip-compressed"):
+        return "zip"
+    if name.endswith(_TAR_SUFFIXES) or content_type in ("application/x-tar", "application/gzip", "application/x-gtar"):
+        return "tar"
+    return None
+
+
+def _read_limited(stream: BinaryIO) -> Optional[bytes]:
+    """The whole stream, or None when it exceeds KB_BULK_MAX_FILE_BYTES"""
+    data = stream.read(KB_BULK_MAX_FILE_BYTES + 1)
+    return None if len(data) > KB_BULK_MAX_FILE_BYTES else data
+
+
+def _skippable(name: str) -> bool:
+    # Folder entries and OS metadata (__MACOSX/, .DS_Store, ._resource forks)
+    base = posixpath.basename(name)
+    return not base or base.startswith(".") or name.startswith("__MACOSX/")
+
+
+def _read_member(open_member) -> Tuple[Optional[bytes], Optional[str]]:
+    """(content or None if too large, None), or (None, why the member could not be read)"""
+    try:
+        with open_member() as member:
+            # The declared size can lie; the read is capped either way
+            return _read_limited(member), None
+    except _MEMBER_ERRORS as e:
+        return None, f"Unreadable archive member: {e}"
+
+
+def iter_members(fileobj: BinaryIO, kind: str) -> Iterator[Tuple[str, Optional[bytes], Optional[str]]]:
+    """
+    (member name, content, None) for every file in an archive, in archive
+    order; content is None past KB_BULK_MAX_FILE_BYTES. A member that cannot
+    be read (encrypted, unsupported compression, corrupt) comes as
+    (member name, None, reason) and the following members are still read.
+    """
+    if kind == "zip":
+        # Zip needs random access; the upload is a seekable spooled file
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or _skippable(info.filename):
+                    continue
+                if info.file_size > KB_BULK_MAX_FILE_BYTES:
+                    yield info.filename, None, None
+                    continue
+                yield (info.filename, *_read_member(lambda: archive.open(info)))
+    else:
+        # Stream mode reads members in order without seeking back
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for info in archive:
+                if not info.isfile() or _skippable(info.name):
+                    continue
+                if info.size > KB_BULK_MAX_FILE_BYTES:
+                    yield info.name, None, None
+                    continue
+                yield (info.name, *_read_member(lambda: archive.extractfile(info)))
+
+
+class BulkIngestion:
+    """
+    One bulk request. Call add() for each file, then finish(). Chunks wait in
+    a shared batch until it is full, so a folder of small help articles costs
+    one embedding request per EMBEDDING_BATCH_SIZE chunks rather than one per chunk.
+    """
+
+    def __init__(self, project_id: str, mongo_db: Database, qdrant: QdrantClient):
+        self.project_id = project_id
+        self.mongo_db = mongo_db
+        self.qdrant = qdrant
+        self.dimensions = dimensions_for(project_id)
+        self.collection_name = ensure_collection(qdrant, self.dimensions)
+
+        self._files = 0
+        self._documents: Dict[str, Dict[str, Any]] = {}  # doc id -> summary returned to the caller
+        self._pending_records: List[Dict[str, Any]] = []  # not yet inserted into MongoDB
+        self._chunks: List[Tuple[str, int, str]] = []  # (doc id, chunk index, text) awaiting embedding
+        self._points: List[qmodels.PointStruct] = []  # awaiting upsert
+        self._stored: Dict[str, int] = {}  # doc id -> chunks stored in Qdrant
+        self._skipped: List[Dict[str, str]] = []
+        self._last_embed_at = 0.0
+        self._embed_seconds = 0.0
+
+    def add_upload(self, fileobj: BinaryIO, filename: str, content_type: Optional[str], file_path: str):
+        """A file from the request: an archive is expanded, anything else ingested as one document"""
+        kind = archive_kind(filename, content_type)
+        if kind:
+            members = iter_members(fileobj, kind)
+            while True:
+                # Only reading the archive is guarded; errors from ingesting a member propagate
+                try:
+                    name, data, error = next(members)
+                except StopIteration:
+                    return
+                except (tarfile.TarError, *_MEMBER_ERRORS) as e:
+                    # The archive itself is damaged; members read so far are kept
+                    self.skip(filename, f"Unreadable archive: {e}")
+                    return
+                if error:
+                    self.skip(name, error)
+                else:
+                    self.add(name, data, f"{file_path}#{name}")
+        self.add(filename, _read_limited(fileobj), file_path, content_type)
+
+    def skip(self, filename: str, reason: str):
+        self._skipped.append({"filename": filename, "reason": reason})
+
+    def add(self, filename: str, data: Optional[bytes], file_path: str, declared_type: Optional[str] = None):
+        content_type = content_type_for(filename, declared_type)
+        if content_type is None:
+            self.skip(filename, "Unsupported file type")
+            return
+        if data is None:
+            self.skip(filename, f"Larger than {KB_BULK_MAX_FILE_BYTES} bytes")
+            return
+        self._files += 1
+        if self._files > KB_BULK_MAX_FILES:
+            raise BulkLimitError(f"More than {KB_BULK_MAX_FILES} files in one request")
+
+        doc_id = str(uuid.uuid4())
+        record = {
+            "_id": doc_id,
+            "project_id": self.project_id,
+            "filename": filename,
+            "file_type": content_type,
+            "file_path": file_path,
+            "upload_date": datetime.utcnow(),
+            "status": "processing"
+        }
+        summary = {"id": doc_id, "filename": filename, "status": "processing", "chunks": 0}
+        self._documents[doc_id] = summary
+
+        with stage(ENDPOINT, "extract"):
+            text_content = extract_text_from_bytes(data, content_type, filename)
+        with stage(ENDPOINT, "chunk"):
+            chunks = chunk_text(text_content)
+        if not chunks:
+            # Recorded as failed right away; it never reaches the embedding batch
+            record.update(status="failed", error="Failed to extract text")
+            summary.update(status="failed", error="Failed to extract text")
+        self._pending_records.append(record)
+
+        for i, chunk in enumerate(chunks):
+            self._chunks.append((doc_id, i, chunk))
+            if len(self._chunks) >= EMBEDDING_BATCH_SIZE:
+                self._embed_batch()
+
+    def _insert_records(self):
+        """Document records go in before their chunks, so no point refers to a missing document"""
+        if self._pending_records:
+            with stage(ENDPOINT, "mongo"):
+                self.mongo_db.documents.insert_many(self._pending_records, ordered=False)
+            self._pending_records = []
+
+    def _embed_batch(self):
+        batch, self._chunks = self._chunks[:EMBEDDING_BATCH_SIZE], self._chunks[EMBEDDING_BATCH_SIZE:]
+        if not batch:
+            return
+        self._insert_records()
+
+        wait = KB_EMBED_BATCH_INTERVAL_SECONDS - (time.monotonic() - self._last_embed_at)
+        if wait > 0:
+            # Rate limit mitigation for Free Tier, once per request instead of once per chunk
+            time.sleep(wait)
+        started = time.perf_counter()
+        embeddings = generate_embeddings([text for _, _, text in batch], self.dimensions)
+        self._last_embed_at = time.monotonic()
+        self._embed_seconds += time.perf_counter() - started
+
+        for (doc_id, index, text), embedding in zip(batch, embeddings):
+            if not embedding:
+                continue
+            self._points.append(qmodels.PointStruct(
+                id=str(uuid.uuid4()),
+                vector=embedding,
+                payload={
+                    "document_id": doc_id,
+                    "content": text,
+                    "project_id": self.project_id,
+                    "chunk_index": index,
+                    "source_type": "bulk"
+                }
+            ))
+            if len(self._points) >= KB_UPSERT_BATCH_SIZE:
+                self._upsert()
+
+    def _upsert(self):
+        if not self._points:
+            return
+        with stage(ENDPOINT, "qdrant_upsert"):
+            self.qdrant.upsert(collection_name=self.collection_name, points=self._points)
+        for point in self._points:
+            doc_id = point.payload["document_id"]
+            self._stored[doc_id] = self._stored.get(doc_id, 0) + 1
+        self._points = []
+
+    def finish(self) -> Dict[str, Any]:
+        """Flush every batch and record the outcome of each document with one bulk_write"""
+        while self._chunks:
+            self._embed_batch()
+        self._upsert()
+        self._insert_records()
+        STAGE_SECONDS.labels(ENDPOINT, "embed").observe(self._embed_seconds)
+
+        updates = []
+        label = project_label(self.project_id)
+        for doc_id, summary in self._documents.items():
+            if summary["status"] == "failed":
+                INGESTED_DOCUMENTS.labels(label, "bulk", "failed").inc()
+                continue
+            stored = self._stored.get(doc_id, 0)
+            if stored:
+                summary.update(status="completed", chunks=stored)
+                updates.append(UpdateOne({"_id": doc_id}, {"$set": {"status": "completed", "chunks_count": stored}}))
+                INGESTED_DOCUMENTS.labels(label, "bulk", "completed").inc()
+            else:
+                summary.update(status="failed", error="No chunk could be embedded")
+                updates.append(UpdateOne({"_id": doc_id}, {"$set": {"status": "failed", "error": summary["error"]}}))
+                INGESTED_DOCUMENTS.labels(label, "bulk", "failed").inc()
+        if updates:
+            with stage(ENDPOINT, "mongo"):
+                self.mongo_db.documents.bulk_write(updates, ordered=False)
+
+        chunks = sum(self._stored.values())
+        INGESTED_CHUNKS.labels(label, "bulk").inc(chunks)
+        documents = list(self._documents.values())
+        completed = sum(1 for summary in documents if summary["status"] == "completed")
+        logger.info("Bulk ingestion completed", extra={
+            "project_id": self.project_id, "documents": len(documents), "completed": completed,
+            "chunks": chunks, "skipped": len(self._skipped)
+        })
+        return {
+            "status": "completed",
+            "documents": documents,
+            "completed": completed,
+            "failed": len(documents) - completed,
+            "skipped": self._skipped,
+            "chunks": chunks
+        }
+
+    def fail(self, error: str):
+        """Mark every document of an aborted request as failed and remove the chunks already stored"""
+        INGESTED_DOCUMENTS.labels(project_label(self.project_id), "bulk", "failed").inc(len(self._documents))
+        if not self._documents:
+            return
+        try:
+            self._insert_records()
+            self.mongo_db.documents.update_many(
+                {"_id": {"$in": list(self._documents)}, "status": "processing"},
+                {"$set": {"status": "failed", "error": error}}
+            )
+            if self._stored:
+                self.qdrant.delete(
+                    collection_name=self.collection_name,
+                    points_selector=qmodels.FilterSelector(
+                        filter=qmodels.Filter(must=[
+                            qmodels.FieldCondition(key="document_id", match=qmodels.MatchAny(any=list(self._stored)))
+                        ])
+                    )
+                )
+        except Exception:
+            logger.exception("Cleanup after failed bulk ingestion failed", extra={"project_id": self.project_id})
+
+
+def ingest_uploads(ingestion: BulkIngestion, uploads: List[Tuple[BinaryIO, str, Optional[str], str]]) -> Dict[str, Any]:
+    """Run a whole request: (file, filename, content type, saved path) for each uploaded file"""
+    try:
+        for fileobj, filename, content_type, file_path in uploads:
+            ingestion.add_upload(fileobj, filename, content_type, file_path)
+        return ingestion.finish()
+    except Exception as e:
+        ingestion.fail(str(e))
+        raise
@@ -1,48 +1,104 @@
 import google.generativeai as genai
+import logging
+import math
 import os
-from typing import List
+import time
+from typing import List, Optional
+from services.metrics import observe_embedding
+
+logger = logging.getLogger(__name__)
 
 # Configure Google API
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 if GOOGLE_API_KEY:
     genai.configure(api_key=GOOGLE_API_KEY)
 
-EMBEDDING_MODEL = "models/embedding-001"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/embedding-001")
+VECTOR_SIZE = 768  # Full output of the embedding model
+# Models that return fewer dimensions themselves (output_dimensionality);
+# the others are truncated locally
+REDUCED_OUTPUT_MODELS = {"models/text-embedding-004"}
 
-def generate_embedding(text: str) -> List[float]:
+def reduce_embedding(embedding: List[float], dimensions: int) -> List[float]:
+    """
+    Keep the first `dimensions` components and rescale to unit length.
+    Matryoshka-trained models put the most information first, so a prefix is
+    a smaller embedding of the same text; renormalizing keeps cosine and dot
+    product scores comparable.
+    """
+    prefix = embedding[:dimensions]
+    norm = math.sqrt(sum(value * value for value in prefix))
+    if norm == 0:
+        return list(prefix)
+    return [value / norm for value in prefix]
+
+# Texts per batch request (the Gemini API accepts at most 100)
+EMBEDDING_BATCH_SIZE = min(100, int(os.getenv("EMBEDDING_BATCH_SIZE", "100")))
+
+def _embed(content, task_type: str, dimensions: int, title: Optional[str] = None):
+    """One embedding for a text, or a list of them for a list of texts (one batch request)"""
+    kwargs = {"title": title} if title else {}
+    if dimensions < VECTOR_SIZE and EMBEDDING_MODEL in REDUCED_OUTPUT_MODELS:
+        kwargs["output_dimensionality"] = dimensions
+    result = genai.embed_content(model=EMBEDDING_MODEL, content=content, task_type=task_type, **kwargs)
+    embeddings = result['embedding'] if isinstance(content, list) else [result['embedding']]
+    if dimensions < VECTOR_SIZE:
+        # Provider-reduced output is not always unit length, so it is renormalized too
+        embeddings = [reduce_embedding(embedding, dimensions) for embedding in embeddings]
+    return embeddings if isinstance(content, list) else embeddings[0]
+
+def generate_embedding(text: str, dimensions: int = VECTOR_SIZE) -> List[float]:
     """
     Generate embedding for a single text chunk using Google Gemini.
     """
     if not GOOGLE_API_KEY:
-        print("Warning: GOOGLE_API_KEY not set. Returning dummy embedding.")
-        return [0.0] * 768
+        logger.warning("GOOGLE_API_KEY not set. Returning dummy embedding.")
+        return [0.0] * dimensions
 
+    started = time.perf_counter()
     try:
-        result = genai.embed_content(
-            model=EMBEDDING_MODEL,
-            content=text,
-            task_type="retrieval_document",
-            title="Embedding of chunk"
-        )
-        return result['embedding']
+        embedding = _embed(text, "retrieval_document", dimensions, title="Embedding of chunk")
+        observe_embedding("document", started, True)
+        return embedding
     except Exception as e:
-        print(f"Error generating embedding: {e}")
+        observe_embedding("document", started, False)
+        logger.warning("Error generating embedding: %s", e)
+        return []
+
+def generate_embeddings(texts: List[str], dimensions: int = VECTOR_SIZE) -> List[List[float]]:
+    """
+    Generate embeddings for up to EMBEDDING_BATCH_SIZE chunks with one request.
+    If the request fails every embedding is empty, like generate_embedding.
+    """
+    if not GOOGLE_API_KEY:
+        logger.warning("GOOGLE_API_KEY not set. Returning dummy embeddings.")
+        return [[0.0] * dimensions for _ in texts]
+    if not texts:
         return []
 
-def generate_query_embedding(text: str) -> List[float]:
+    started = time.perf_counter()
+    try:
+        embeddings = _embed(list(texts), "retrieval_document", dimensions, title="Embedding of chunk")
+        observe_embedding("document_batch", started, True)
+        return embeddings
+    except Exception as e:
+        observe_embedding("document_batch", started, False)
+        logger.warning("Error generating %d embeddings: %s", len(texts), e)
+        return [[] for _ in texts]
+
+def generate_query_embedding(text: str, dimensions: int = VECTOR_SIZE) -> List[float]:
     """
-    Generate embedding for a query.
+    Generate embedding for a query, with the dimensions of the collection it searches.
     """
     if not GOOGLE_API_KEY:
-        return [0.0] * 768
+        return [0.0] * dimensions
 
+    started = time.perf_counter()
     try:
-        result = genai.embed_content(
-            model=EMBEDDING_MODEL,
-            content=text,
-            task_type="retrieval_query"
-        )
-        return result['embedding']
+        embedding = _embed(text, "retrieval_query", dimensions)
+        observe_embedding("query", started, True)
+        return embedding
     except Exception as e:
-        print(f"Error generating query embedding: {e}")
+        observe_embedding("query", started, False)
+        logger.warning("Error generating query embedding: %s", e)
         return []
@@ -1,3 +1,5 @@
+import io
+import logging
 import os
 from fastapi import UploadFile
 import shutil
@@ -5,6 +7,8 @@ from pathlib import Path
 import PyPDF2
 import docx
 
+logger = logging.getLogger(__name__)
+
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
@@ -19,26 +23,36 @@ async def save_upload_file(upload_file: UploadFile, project_id: str) -> str:
     return str(file_path)
 
 def extract_text(file_path: str, file_type: str) -> str:
-    text = ""
     try:
-        if file_type == "application/pdf":
-            with open(file_path, "rb") as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                    
-        elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            doc = docx.Document(file_path)
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-                
-        elif file_type in ["text/plain", "text/markdown"]:
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
-                
+        with open(file_path, "rb") as f:
+            return _extract(f, file_type)
+    except Exception as e:
+        logger.warning("Error extracting text from %s: %s", file_path, e)
+        return ""
+
+def extract_text_from_bytes(data: bytes, file_type: str, name: str = "") -> str:
+    """Same as extract_text, for a file already in memory (e.g. an archive member)"""
+    try:
+        return _extract(io.BytesIO(data), file_type)
     except Exception as e:
-        print(f"Error extracting text from {file_path}: {e}")
+        logger.warning("Error extracting text from %s: %s", name, e)
         return ""
+
+def _extract(stream, file_type: str) -> str:
+    text = ""
+    if file_type == "application/pdf":
+        pdf_reader = PyPDF2.PdfReader(stream)
+        for page in pdf_reader.pages:
+            text += page.extract_text() + "\n"
+            
+    elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+        doc = docx.Document(stream)
+        for para in doc.paragraphs:
+            text += para.text + "\n"
+            
+    elif file_type in ["text/plain", "text/markdown"]:
+        # Universal newlines, as when the file is opened in text mode
+        text = io.TextIOWrapper(stream, encoding="utf-8").read()
         
     return text
 
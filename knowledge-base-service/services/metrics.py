@@ -0,0 +1,86 @@
+# project_label() and render_metrics() are copies of the ones in ai-agent-service/utils/metrics.py (see "Shared Modules" in the README)
+"""
+Prometheus metrics
+Request latency per route, per-stage latency for /query, /upload and /crawl
+(embedding, Qdrant, MongoDB, extraction, scraping) and per-project volumes.
+Project ids are used as labels only for the first METRICS_MAX_PROJECTS projects
+seen (or an explicit allowlist); everything else is reported as "other".
+"""
+
+from typing import Optional
+from contextlib import contextmanager
+import os
+import time
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess
+)
+from services.tracing import tracer
+
+METRICS_MAX_PROJECTS = int(os.getenv("METRICS_MAX_PROJECTS", "50"))
+METRICS_PROJECTS = {p.strip() for p in os.getenv("METRICS_PROJECTS", "").split(",") if p.strip()}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "kb_http_request_seconds", "Request latency by route",
+    ["route", "method", "status"], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "kb_stage_seconds", "Latency of each stage of a knowledge base request",
+    ["endpoint", "stage"], buckets=LATENCY_BUCKETS
+)
+EMBEDDING_CALLS = Counter("kb_embedding_calls_total", "Embedding API calls", ["task", "outcome"])
+EMBEDDING_SECONDS = Histogram(
+    "kb_embedding_seconds", "Embedding API latency",
+    ["task"], buckets=LATENCY_BUCKETS
+)
+QUERIES = Counter("kb_queries_total", "Knowledge base queries", ["project"])
+INGESTED_CHUNKS = Counter("kb_ingested_chunks_total", "Chunks embedded and stored", ["project", "source"])
+INGESTED_DOCUMENTS = Counter("kb_ingested_documents_total", "Documents processed", ["project", "source", "outcome"])
+
+_labelled_projects = set()
+
+
+def project_label(project_id: Optional[str]) -> str:
+    """Project id as a metric label, or "other" once the label budget is used up"""
+    if not project_id:
+        return "none"
+    if METRICS_PROJECTS:
+        return project_id if project_id in METRICS_PROJECTS else "other"
+    if project_id in _labelled_projects:
+        return project_id
+    if len(_labelled_projects) < METRICS_MAX_PROJECTS:
+        _labelled_projects.add(project_id)
+        return project_id
+    return "other"
+
+
+@contextmanager
+def stage(endpoint: str, name: str):
+    """Time one stage of a request, as a metric and as a span"""
+    started = time.perf_counter()
+    with tracer.start_as_current_span(f"{endpoint}.{name}"):
+        try:
+            yield
+        finally:
+            STAGE_SECONDS.labels(endpoint, name).observe(time.perf_counter() - started)
+
+
+def observe_embedding(task: str, started: float, ok: bool):
+    EMBEDDING_SECONDS.labels(task).observe(time.perf_counter() - started)
+    EMBEDDING_CALLS.labels(task, "ok" if ok else "error").inc()
+
+
+def render_metrics():
+    """(body, content type) for /metrics; aggregates workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
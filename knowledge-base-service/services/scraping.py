@@ -1,8 +1,11 @@
+import logging
 import os
 from tavily import TavilyClient
 from bs4 import BeautifulSoup
 import re
 
+logger = logging.getLogger(__name__)
+
 def clean_text(text: str) -> str:
     """
     Preprocess and clean extracted text.
@@ -15,6 +18,28 @@ def clean_text(text: str) -> str:
     text = re.sub(r'([.,!?;:]){2,}', r'\1', text)
     return text.strip()
 
+def html_to_text(raw_content: str) -> str:
+    """
+    Visible text of an HTML page, one line per block, without scripts,
+    styles and page chrome (navigation, header, footer, sidebars).
+    """
+    # Clean up with BeautifulSoup
+    soup = BeautifulSoup(raw_content, "html.parser")
+    
+    # Remove unwanted elements
+    for element in soup(["script", "style", "nav", "footer", "header", "aside", "iframe"]):
+        element.decompose()
+    
+    # Extract text
+    text = soup.get_text()
+    
+    # Break into lines and remove leading/trailing space
+    lines = (line.strip() for line in text.splitlines())
+    # Break multi-headlines into a line each
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    # Drop blank lines
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
 def scrape_website(url: str, max_pages: int = 5) -> str:
     """
     Scrapes a website using Tavily API with two-step approach:
@@ -30,20 +55,20 @@ def scrape_website(url: str, max_pages: int = 5) -> str:
         tavily = TavilyClient(api_key=api_key)
         
         # Step 1: Use map to discover all URLs on the website
-        print(f"�️  Step 1: Mapping website to discover URLs: {url}")
+        logger.debug("Mapping website to discover URLs: %s", url)
         map_response = tavily.map(url=url)
         
         if not map_response or "urls" not in map_response:
-            print(f"⚠️  Map returned no URLs, falling back to main URL only")
+            logger.warning("Map returned no URLs, falling back to main URL only", extra={"url": url})
             urls_to_scrape = [url]
         else:
             urls_to_scrape = map_response["urls"][:max_pages]
-            print(f"📄 Discovered {len(urls_to_scrape)} URLs to scrape")
+            logger.info("Discovered URLs to scrape", extra={"url": url, "pages": len(urls_to_scrape)})
         
         # Step 2: Extract content from each discovered URL
         all_content = []
         for idx, page_url in enumerate(urls_to_scrape, 1):
-            print(f"📥 Step 2: Extracting content from page {idx}/{len(urls_to_scrape)}: {page_url}")
+            logger.debug("Extracting content from page %d/%d: %s", idx, len(urls_to_scrape), page_url)
             try:
                 extract_response = tavily.extract(urls=[page_url])
                 
@@ -52,33 +77,18 @@ def scrape_website(url: str, max_pages: int = 5) -> str:
                     raw_content = result.get("raw_content", "")
                     
                     if raw_content:
-                        # Clean up with BeautifulSoup
-                        soup = BeautifulSoup(raw_content, "html.parser")
-                        
-                        # Remove unwanted elements
-                        for element in soup(["script", "style", "nav", "footer", "header", "aside", "iframe"]):
-                            element.decompose()
-                        
-                        # Extract text
-                        text = soup.get_text()
-                        
-                        # Break into lines and remove leading/trailing space
-                        lines = (line.strip() for line in text.splitlines())
-                        # Break multi-headlines into a line each
-                        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                        # Drop blank lines
-                        page_text = '\n'.join(chunk for chunk in chunks if chunk)
+                        page_text = html_to_text(raw_content)
                         
                         if page_text:
                             all_content.append(f"=== Content from: {page_url} ===\n{page_text}\n")
-                            print(f"✅ Extracted {len(page_text)} characters from {page_url}")
+                            logger.debug("Extracted %d characters from %s", len(page_text), page_url)
                     else:
-                        print(f"⚠️  No raw_content in extract response for {page_url}")
+                        logger.warning("No raw_content in extract response", extra={"page_url": page_url})
                 else:
-                    print(f"⚠️  Empty extract response for {page_url}")
+                    logger.warning("Empty extract response", extra={"page_url": page_url})
                     
             except Exception as e:
-                print(f"⚠️  Failed to extract from {page_url}: {e}")
+                logger.warning("Failed to extract page: %s", e, extra={"page_url": page_url})
                 continue
         
         if not all_content:
@@ -88,9 +98,9 @@ def scrape_website(url: str, max_pages: int = 5) -> str:
         combined_content = "\n\n".join(all_content)
         cleaned_content = clean_text(combined_content)
         
-        print(f"✅ Successfully scraped {len(all_content)} page(s), total length: {len(cleaned_content)} characters")
+        logger.info("Scraped website", extra={"url": url, "pages": len(all_content), "chars": len(cleaned_content)})
         return cleaned_content
 
     except Exception as e:
-        print(f"❌ Error scraping website: {e}")
+        logger.warning("Error scraping website: %s", e, extra={"url": url})
         raise e
@@ -0,0 +1,63 @@
+# Copy of ai-agent-service/utils/single_flight.py, without SingleFlightStream (see "Shared Modules" in the README)
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+def flight_key(*parts: Any) -> str:
+    """
+    Key for deduplicating identical work. Strings are whitespace-collapsed and
+    case-folded so trivially different spellings of a question share a flight.
+    """
+    def normalize(part: Any) -> Any:
+        if isinstance(part, str):
+            return " ".join(part.split()).casefold()
+        return part
+
+    encoded = json.dumps([normalize(part) for part in parts], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Concurrent callers with the same key await one shared computation.
+    The computation runs as its own task, so one caller going away does not
+    fail the others; it is cancelled only when every caller has gone.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self._stats["leaders"] += 1
+        else:
+            self._stats["followers"] += 1
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            remaining = self._waiters.pop(task, 1) - 1
+            if remaining > 0:
+                self._waiters[task] = remaining
+            elif not task.done():
+                task.cancel()
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            task.exception()  # Mark retrieved when every caller has already left
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self._stats, "in_flight": len(self._flights)}
@@ -0,0 +1,161 @@
+# Copy of ai-agent-service/utils/tracing.py, without inject_headers() and annotate_span() (see "Shared Modules" in the README)
+"""
+Distributed tracing (OpenTelemetry)
+The AI Agent Service sends W3C trace context with /query, so knowledge base
+spans (embedding, Qdrant search) join the chat turn's trace. Exporters: none
+(default), console, file (JSON lines), memory (tests) and otlp.
+"""
+
+from typing import Dict, Any, Optional, Sequence
+import json
+import logging
+import os
+import threading
+from opentelemetry import trace, propagate
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider, ReadableSpan
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SimpleSpanProcessor,
+    SpanExporter,
+    SpanExportResult
+)
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_FILE_PATH = os.getenv("TRACING_FILE_PATH", "traces.jsonl")
+# Fraction of new traces recorded; requests that arrive with a sampled parent are always recorded
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+
+tracer = trace.get_tracer("knowledge-base-service")
+
+_memory_exporter: Optional[InMemorySpanExporter] = None
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends one JSON object per finished span; readable with jq or a test"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = [json.dumps(span_to_dict(span), default=str) for span in spans]
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as handle:
+                handle.write("\n".join(lines) + "\n")
+        except OSError as e:
+            logger.warning("Error writing spans to %s: %s", self.path, e)
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def span_to_dict(span: ReadableSpan) -> Dict[str, Any]:
+    context = span.get_span_context()
+    return {
+        "name": span.name,
+        "service": span.resource.attributes.get("service.name"),
+        "trace_id": format(context.trace_id, "032x"),
+        "span_id": format(context.span_id, "016x"),
+        "parent_id": format(span.parent.span_id, "016x") if span.parent else None,
+        "kind": span.kind.name,
+        "start_ns": span.start_time,
+        "duration_ms": round((span.end_time - span.start_time) / 1e6, 2) if span.end_time else None,
+        "status": span.status.status_code.name,
+        "attributes": dict(span.attributes or {}),
+        "events": [{"name": event.name, "attributes": dict(event.attributes or {})} for event in span.events]
+    }
+
+
+def setup_tracing(service_name: str = "knowledge-base-service", exporter: str = TRACING_EXPORTER):
+    """Install the tracer provider; a no-op when the exporter is "none"."""
+    global _memory_exporter
+    if exporter == "none":
+        return
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", service_name)}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO))
+    )
+    if exporter == "memory":
+        _memory_exporter = InMemorySpanExporter()
+        provider.add_span_processor(SimpleSpanProcessor(_memory_exporter))
+    elif exporter == "file":
+        provider.add_span_processor(BatchSpanProcessor(FileSpanExporter(TRACING_FILE_PATH)))
+    elif exporter == "console":
+        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+    elif exporter == "otlp":
+        # Endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    else:
+        logger.warning("Unknown TRACING_EXPORTER %r, tracing disabled", exporter)
+        return
+
+    trace.set_tracer_provider(provider)
+    logger.info("Tracing enabled for %s", service_name, extra={"exporter": exporter})
+
+
+def get_memory_exporter() -> Optional[InMemorySpanExporter]:
+    """Finished spans when TRACING_EXPORTER=memory"""
+    return _memory_exporter
+
+
+def shutdown_tracing():
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+def current_trace_id() -> Optional[str]:
+    context = trace.get_current_span().get_span_context()
+    return format(context.trace_id, "032x") if context.is_valid else None
+
+
+class TracingMiddleware:
+    """
+    Plain ASGI middleware that continues the caller's trace (traceparent header).
+    The trace id is returned in X-Trace-Id so a slow response can be looked up.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in ("/metrics", "/health"):
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        context = propagate.extract(carrier)
+        method = scope["method"]
+        with tracer.start_as_current_span(method, context=context, kind=SpanKind.SERVER) as span:
+            span.set_attribute("http.method", method)
+            span.set_attribute("http.target", scope["path"])
+            trace_id = current_trace_id()
+
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                    if trace_id:
+                        message = {**message, "headers": [*message.get("headers", []), (b"x-trace-id", trace_id.encode())]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                # Name by route template once routing has happened, keeping span names bounded
+                route = scope.get("route")
+                if route is not None and getattr(route, "path", None):
+                    span.update_name(f"{method} {route.path}")
+                    span.set_attribute("http.route", route.path)
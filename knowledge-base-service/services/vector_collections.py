@@ -0,0 +1,95 @@
+"""
+Qdrant collections by embedding size
+Each vector size has its own collection: the full-size one keeps the original
+name, reduced ones get a suffix (makkn_knowledge_base_d256). A project is
+stored in and searched in the collection for its configured dimensions, so
+small knowledge bases can use shorter vectors (less RAM, faster search) while
+others keep full-size ones. See scripts/migrate_vector_dimensions.py for
+moving a project between sizes.
+"""
+
+from typing import Dict, List
+import logging
+import os
+import threading
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qmodels
+from services.embeddings import VECTOR_SIZE
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "makkn_knowledge_base"
+# Dimensions for projects without their own setting
+KB_VECTOR_DIMENSIONS = int(os.getenv("KB_VECTOR_DIMENSIONS", str(VECTOR_SIZE)))
+# Per-project overrides, e.g. "proj_a=256,proj_b=128"
+KB_PROJECT_VECTOR_DIMENSIONS = os.getenv("KB_PROJECT_VECTOR_DIMENSIONS", "")
+
+_ensured = set()
+_lock = threading.Lock()
+
+
+def _check(dimensions: int) -> int:
+    if not 1 <= dimensions <= VECTOR_SIZE:
+        raise ValueError(f"Vector dimensions must be between 1 and {VECTOR_SIZE}, got {dimensions}")
+    return dimensions
+
+
+def parse_project_dimensions(spec: str) -> Dict[str, int]:
+    overrides = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        project_id, _, dimensions = item.partition("=")
+        overrides[project_id.strip()] = _check(int(dimensions))
+    return overrides
+
+
+_check(KB_VECTOR_DIMENSIONS)
+_project_dimensions = parse_project_dimensions(KB_PROJECT_VECTOR_DIMENSIONS)
+
+
+def dimensions_for(project_id: str) -> int:
+    return _project_dimensions.get(project_id, KB_VECTOR_DIMENSIONS)
+
+
+def collection_for(dimensions: int) -> str:
+    _check(dimensions)
+    return COLLECTION_NAME if dimensions == VECTOR_SIZE else f"{COLLECTION_NAME}_d{dimensions}"
+
+
+def configured_dimensions() -> List[int]:
+    """Every size in use by the current configuration"""
+    return sorted({KB_VECTOR_DIMENSIONS, *_project_dimensions.values()})
+
+
+def ensure_collection(client: QdrantClient, dimensions: int) -> str:
+    """Create the collection for `dimensions` if needed (checked once per process) and return its name"""
+    name = collection_for(dimensions)
+    if name in _ensured:
+        return name
+    with _lock:
+        if name not in _ensured:
+            existing = {col.name for col in client.get_collections().collections}
+            if name not in existing:
+                client.create_collection(
+                    collection_name=name,
+                    vectors_config=qmodels.VectorParams(size=dimensions, distance=qmodels.Distance.COSINE)
+                )
+                # Every search filters on the project
+                client.create_payload_index(
+                    collection_name=name,
+                    field_name="project_id",
+                    field_schema=qmodels.PayloadSchemaType.KEYWORD
+                )
+                logger.info("Created Qdrant collection %s", name, extra={"dimensions": dimensions})
+            _ensured.add(name)
+    return name
+
+
+def knowledge_base_collections(client: QdrantClient) -> List[str]:
+    """Existing collections of every size, configured or left over from a migration"""
+    prefix = f"{COLLECTION_NAME}_d"
+    return [
+        col.name for col in client.get_collections().collections
+        if col.name == COLLECTION_NAME or col.name.startswith(prefix)
+    ]
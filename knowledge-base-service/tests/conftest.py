@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests import the service's top-level packages (services, database) like main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("KB_EMBED_BATCH_INTERVAL_SECONDS", "0")
@@ -0,0 +1,178 @@
+import io
+import zipfile
+from collections import Counter
+import pytest
+from fastapi.testclient import TestClient
+from qdrant_client import QdrantClient
+from services import bulk_ingestion, vector_collections
+from services.bulk_ingestion import BulkIngestion, BulkLimitError, ingest_uploads
+import main
+
+GOOD_TEXT = "Refunds are issued within 14 days of the request. " * 20
+
+
+class _Documents:
+    """The MongoDB calls bulk ingestion makes, kept in a dict"""
+
+    def __init__(self):
+        self.records = {}
+        self.calls = Counter()
+
+    def insert_many(self, records, ordered=True):
+        self.calls["insert_many"] += 1
+        for record in records:
+            self.records[record["_id"]] = dict(record)
+
+    def bulk_write(self, updates, ordered=True):
+        self.calls["bulk_write"] += 1
+        for update in updates:
+            self.records[update._filter["_id"]].update(update._doc["$set"])
+
+    def update_many(self, query, update):
+        self.calls["update_many"] += 1
+        for doc_id in query["_id"]["$in"]:
+            if self.records[doc_id]["status"] == query["status"]:
+                self.records[doc_id].update(update["$set"])
+
+
+class _Database:
+    def __init__(self):
+        self.documents = _Documents()
+
+
+@pytest.fixture
+def embed_calls(monkeypatch):
+    """Texts of each generate_embeddings call"""
+    calls = []
+
+    def embed(texts, dimensions):
+        calls.append(list(texts))
+        return [[0.1] * dimensions for _ in texts]
+
+    # Every test has its own in-memory Qdrant; forget collections created for earlier ones
+    monkeypatch.setattr(vector_collections, "_ensured", set())
+    monkeypatch.setattr(bulk_ingestion, "generate_embeddings", embed)
+    return calls
+
+
+@pytest.fixture
+def ingestion(embed_calls):
+    return BulkIngestion("proj_test", _Database(), QdrantClient(":memory:"))
+
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, text in members:
+            archive.writestr(name, text)
+    return buffer.getvalue()
+
+
+def _encrypt_flag(data: bytes, name: str) -> bytes:
+    """Mark `name` as encrypted in its local and central headers, as an encrypting zip tool would"""
+    data = bytearray(data)
+    for signature, flag_offset, name_offset in ((b"PK\x03\x04", 6, 30), (b"PK\x01\x02", 8, 46)):
+        start = 0
+        while (start := data.find(signature, start)) != -1:
+            if data[start + name_offset:start + name_offset + len(name)] == name.encode():
+                data[start + flag_offset] |= 0x1
+            start += 1
+    return bytes(data)
+
+
+def _corrupt_member(data: bytes, name: str) -> bytes:
+    """Overwrite the compressed data of `name` so inflating it fails"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        info = archive.getinfo(name)
+    start = info.header_offset + 30 + len(info.filename.encode()) + len(info.extra)
+    data = bytearray(data)
+    data[start:start + info.compress_size] = b"\xff" * info.compress_size
+    return bytes(data)
+
+
+def _run(ingestion, data):
+    return ingest_uploads(ingestion, [(io.BytesIO(data), "docs.zip", "application/zip", "uploads/docs.zip")])
+
+
+def test_encrypted_member_is_skipped_and_siblings_are_ingested(ingestion):
+    data = _encrypt_flag(_zip([("a.txt", GOOD_TEXT), ("secret.txt", GOOD_TEXT), ("b.txt", GOOD_TEXT)]), "secret.txt")
+
+    result = _run(ingestion, data)
+
+    assert sorted(doc["filename"] for doc in result["documents"]) == ["a.txt", "b.txt"]
+    assert result["completed"] == 2
+    assert [skipped["filename"] for skipped in result["skipped"]] == ["secret.txt"]
+    assert result["skipped"][0]["reason"].startswith("Unreadable archive member")
+
+
+def test_corrupt_member_is_skipped_and_siblings_are_ingested(ingestion):
+    data = _corrupt_member(_zip([("a.txt", GOOD_TEXT), ("broken.txt", GOOD_TEXT), ("b.txt", GOOD_TEXT)]), "broken.txt")
+
+    result = _run(ingestion, data)
+
+    assert result["completed"] == 2
+    assert [skipped["filename"] for skipped in result["skipped"]] == ["broken.txt"]
+    stored = {record["filename"]: record["status"] for record in ingestion.mongo_db.documents.records.values()}
+    assert stored == {"a.txt": "completed", "b.txt": "completed"}
+
+
+def test_unreadable_archive_is_reported(ingestion):
+    result = _run(ingestion, b"not a zip file")
+
+    assert result["documents"] == []
+    assert result["skipped"][0]["filename"] == "docs.zip"
+
+
+def _stored_points(ingestion):
+    return ingestion.qdrant.count(ingestion.collection_name).count
+
+
+def test_files_share_embedding_calls_and_database_writes(ingestion, embed_calls):
+    data = _zip([("a.txt", GOOD_TEXT), ("b.txt", GOOD_TEXT), ("c.txt", GOOD_TEXT)])
+
+    result = _run(ingestion, data)
+
+    assert result["completed"] == 3
+    assert len(embed_calls) == 1
+    assert len(embed_calls[0]) == result["chunks"] >= 3
+    assert ingestion.mongo_db.documents.calls == {"insert_many": 1, "bulk_write": 1}
+    assert _stored_points(ingestion) == result["chunks"]
+
+
+def test_file_limit_aborts_and_cleans_up(ingestion, embed_calls, monkeypatch):
+    monkeypatch.setattr(bulk_ingestion, "KB_BULK_MAX_FILES", 2)
+    # Embed and store every chunk as soon as it is read, so the aborted request has points to remove
+    monkeypatch.setattr(bulk_ingestion, "EMBEDDING_BATCH_SIZE", 1)
+    monkeypatch.setattr(bulk_ingestion, "KB_UPSERT_BATCH_SIZE", 1)
+    data = _zip([("a.txt", GOOD_TEXT), ("b.txt", GOOD_TEXT), ("c.txt", GOOD_TEXT)])
+
+    with pytest.raises(BulkLimitError):
+        _run(ingestion, data)
+
+    records = ingestion.mongo_db.documents.records.values()
+    assert sorted(record["filename"] for record in records) == ["a.txt", "b.txt"]
+    assert {record["status"] for record in records} == {"failed"}
+    assert len(embed_calls) >= 2
+    assert _stored_points(ingestion) == 0
+
+
+def test_file_limit_is_answered_with_413(embed_calls, monkeypatch):
+    monkeypatch.setattr(bulk_ingestion, "KB_BULK_MAX_FILES", 2)
+
+    async def save_upload_file(upload_file, project_id):
+        return f"uploads/{project_id}/{upload_file.filename}"
+
+    database, qdrant = _Database(), QdrantClient(":memory:")
+    monkeypatch.setattr(main, "save_upload_file", save_upload_file)
+    monkeypatch.setitem(main.app.dependency_overrides, main.get_mongo_db, lambda: database)
+    monkeypatch.setitem(main.app.dependency_overrides, main.get_qdrant_client, lambda: qdrant)
+
+    response = TestClient(main.app).post(
+        "/upload/bulk",
+        data={"project_id": "proj_test"},
+        files=[("files", (name, GOOD_TEXT.encode(), "text/plain")) for name in ("a.txt", "b.txt", "c.txt")]
+    )
+
+    assert response.status_code == 413
+    assert "More than 2 files" in response.json()["detail"]
+    assert {record["status"] for record in database.documents.records.values()} == {"failed"}
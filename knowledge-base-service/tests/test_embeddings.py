@@ -0,0 +1,61 @@
+import math
+import pytest
+from services import embeddings
+from services.embeddings import VECTOR_SIZE, reduce_embedding
+
+
+def _norm(vector):
+    return math.sqrt(sum(value * value for value in vector))
+
+
+def test_truncated_embedding_has_unit_length():
+    full = [float(i % 7) - 3 for i in range(VECTOR_SIZE)]
+
+    reduced = reduce_embedding(full, 256)
+
+    assert len(reduced) == 256
+    assert _norm(reduced) == pytest.approx(1.0)
+    # Same direction as the prefix it came from
+    assert reduced[1] / reduced[0] == pytest.approx(full[1] / full[0])
+
+
+def test_zero_prefix_is_kept_as_is():
+    assert reduce_embedding([0.0] * 8 + [1.0] * 8, 8) == [0.0] * 8
+
+
+@pytest.fixture
+def embed_content(monkeypatch):
+    """Records the keyword arguments of each Gemini call and answers with full-size vectors"""
+    calls = []
+
+    def fake(model, content, task_type, **kwargs):
+        calls.append(kwargs)
+        if isinstance(content, list):
+            return {"embedding": [[2.0] * VECTOR_SIZE for _ in content]}
+        return {"embedding": [2.0] * VECTOR_SIZE}
+
+    monkeypatch.setattr(embeddings.genai, "embed_content", fake)
+    return calls
+
+
+def test_reduced_output_models_are_asked_for_fewer_dimensions(embed_content, monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBEDDING_MODEL", "models/text-embedding-004")
+
+    vectors = embeddings._embed(["a", "b"], "retrieval_document", 128)
+    full = embeddings._embed("a", "retrieval_query", VECTOR_SIZE)
+
+    assert embed_content[0]["output_dimensionality"] == 128
+    assert "output_dimensionality" not in embed_content[1]
+    assert [len(vector) for vector in vectors] == [128, 128]
+    assert _norm(vectors[0]) == pytest.approx(1.0)
+    assert full == [2.0] * VECTOR_SIZE
+
+
+def test_other_models_are_truncated_locally(embed_content, monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBEDDING_MODEL", "models/embedding-001")
+
+    vector = embeddings._embed("a", "retrieval_query", 64)
+
+    assert "output_dimensionality" not in embed_content[0]
+    assert len(vector) == 64
+    assert _norm(vector) == pytest.approx(1.0)
@@ -0,0 +1,36 @@
+import os
+import sys
+import pytest
+from services import vector_collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+import migrate_vector_dimensions as migration  # noqa: E402
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    def configure(default: int, overrides: dict):
+        monkeypatch.setattr(vector_collections, "KB_VECTOR_DIMENSIONS", default)
+        monkeypatch.setattr(vector_collections, "_project_dimensions", overrides)
+    return configure
+
+
+def test_source_collection_is_kept_while_other_projects_use_it(configure):
+    configure(768, {"proj_a": 256})
+
+    assert migration.delete_source_blocker(768, []) is not None
+    assert migration.delete_source_blocker(768, ["proj_a"]) is None
+    assert migration.delete_source_blocker(768, ["proj_a", "proj_b"]) is not None
+
+
+def test_source_collection_is_dropped_once_nothing_maps_to_it(configure):
+    configure(256, {})
+
+    assert migration.delete_source_blocker(768, []) is None
+
+
+def test_refuses_before_copying(configure, monkeypatch):
+    configure(768, {})
+    monkeypatch.setattr(migration, "get_qdrant_client", lambda: pytest.fail("connected to Qdrant"))
+
+    assert migration.main(["--to", "256", "--delete-source"]) == 2
@@ -0,0 +1,54 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from services import tracing
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+@pytest.fixture(scope="module")
+def spans():
+    # The global tracer provider can only be installed once per process
+    tracing.setup_tracing("knowledge-base-service", exporter="memory")
+    return tracing.get_memory_exporter()
+
+
+@pytest.fixture
+def client(spans):
+    spans.clear()
+    app = FastAPI()
+    app.add_middleware(tracing.TracingMiddleware)
+
+    @app.post("/query")
+    async def query():
+        with tracing.tracer.start_as_current_span("qdrant.search"):
+            return {"results": []}
+
+    @app.get("/metrics")
+    async def metrics():
+        return {}
+
+    return TestClient(app)
+
+
+def _server_spans(spans):
+    """Spans from TracingMiddleware; newer FastAPI releases add their own spans too"""
+    return [span for span in spans.get_finished_spans() if "http.target" in (span.attributes or {})]
+
+
+def test_query_joins_the_agent_trace(client, spans):
+    client.post("/query", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+
+    [server] = _server_spans(spans)
+    assert server.name == "POST /query"
+    assert server.parent.span_id == int(PARENT_ID, 16)
+    assert server.attributes["http.route"] == "/query"
+    assert server.attributes["http.status_code"] == 200
+    assert {span.context.trace_id for span in spans.get_finished_spans()} == {int(TRACE_ID, 16)}
+
+
+def test_metrics_scrapes_are_not_traced(client, spans):
+    client.get("/metrics")
+
+    assert _server_spans(spans) == []
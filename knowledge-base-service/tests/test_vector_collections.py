@@ -0,0 +1,29 @@
+import pytest
+from services.embeddings import VECTOR_SIZE
+from services.vector_collections import COLLECTION_NAME, collection_for, parse_project_dimensions
+
+
+def test_full_size_keeps_the_original_collection_name():
+    assert collection_for(VECTOR_SIZE) == COLLECTION_NAME
+
+
+def test_reduced_sizes_get_a_suffixed_collection():
+    assert collection_for(256) == f"{COLLECTION_NAME}_d256"
+    assert collection_for(1) == f"{COLLECTION_NAME}_d1"
+
+
+@pytest.mark.parametrize("dimensions", [0, -1, VECTOR_SIZE + 1])
+def test_out_of_range_sizes_have_no_collection(dimensions):
+    with pytest.raises(ValueError):
+        collection_for(dimensions)
+
+
+def test_project_dimensions_are_parsed():
+    assert parse_project_dimensions(" proj_a=256, proj_b = 128 ,") == {"proj_a": 256, "proj_b": 128}
+    assert parse_project_dimensions("") == {}
+
+
+@pytest.mark.parametrize("spec", ["proj_a", "proj_a=small", "proj_a=0", f"proj_a={VECTOR_SIZE + 1}"])
+def test_bad_project_dimensions_are_rejected(spec):
+    with pytest.raises(ValueError):
+        parse_project_dimensions(spec)